@@ -0,0 +1,76 @@
+"""Checks the import time of each module against a budget.
+
+    python benchmarks/bench_imports.py [--repeat 5] [--budget import_budget.json]
+
+Each module is imported in a fresh interpreter with `python -X importtime`
+(Python 3.7 or later), and the best cumulative time of `--repeat` runs is
+compared with its budget in milliseconds. The budget file also lists the
+modules that must not be imported until a task needs them, like requests
+and AnsibleModule. The exit status is 1 if any module is over budget or
+imports one of those.
+"""
+
+import argparse, json, os, subprocess, sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LIBRARY = os.path.join(HERE, "..", "library")
+
+
+def import_times(module):
+    """Runs one import and returns {imported module: cumulative us}"""
+
+    output = subprocess.check_output(
+        [sys.executable, "-X", "importtime", "-c", "import {}" . format (module)],
+        cwd=LIBRARY, stderr=subprocess.STDOUT, universal_newlines=True,
+    )
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            times[name.strip()] = int(cumulative)
+        except ValueError:
+            continue
+    return times
+
+def measure(module, repeat):
+    best, imported = None, set()
+    for _ in range(repeat):
+        times = import_times(module)
+        imported.update(times)
+        if best is None or times[module] < best:
+            best = times[module]
+    return best / 1000.0, imported
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", default=os.path.join(HERE, "import_budget.json"))
+    args = parser.parse_args()
+
+    if sys.version_info < (3, 7):
+        parser.error("-X importtime needs Python 3.7 or later")
+
+    with open(args.budget) as source:
+        budget = json.load(source)
+
+    failed = False
+    for module, limit in sorted(budget["modules"].items()):
+        try:
+            elapsed, imported = measure(module, args.repeat)
+        except subprocess.CalledProcessError as error:
+            failed = True
+            print("{:<28} can't be imported: {}" . format (module, error.output.strip().splitlines()[-1]))
+            continue
+        eager = sorted(name for name in imported if name.split(".")[0] in budget["deferred"] or name in budget["deferred"])
+        over = elapsed > limit
+        failed = failed or over or bool(eager)
+        print("{:<28} {:>8.1f} ms  budget {:>5} ms  {}" . format (module, elapsed, limit, "OVER" if over else "ok"))
+        for name in eager:
+            print("    imports {} eagerly" . format (name))
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
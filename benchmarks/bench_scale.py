@@ -0,0 +1,247 @@
+"""Measures how KongAPI, KongPlugin and KongConsumer scale with the number
+of entities, against the fake admin server.
+
+    python benchmarks/bench_scale.py [--sizes 10,1000,50000] [--latency 0.002] [--error-rate 0.01]
+    python benchmarks/bench_scale.py --save
+
+Each scenario is seeded on the server and then run in a fresh process,
+which reports its wall time and peak memory; the server counts the
+requests it answered:
+
+    apis       KongAPI.converge of N APIs with a plugin each, 1 in 10 changed
+    plugins    KongPlugin.add_or_update of a plugin on each of N APIs, 1 in 10 changed
+    consumers  KongConsumer.converge of N consumers, 1 in 10 new
+    async      the consumers scenario with the asyncio engine, with
+               --parallelism requests in flight (Python 3.6 or later)
+    rotate     TargetRotation of N upstreams from two targets to two new ones
+               (at most MAX_SIZES["rotate"] upstreams, it takes 8 requests each)
+    prune      KongAPI.prune of N APIs and their plugins, by name prefix
+               (at most MAX_SIZES["prune"] APIs)
+
+The results are compared with the saved baseline for the same Python,
+latency, error rate and parallelism: a run fails if it makes more
+requests than the baseline, or takes more than `--tolerance` times more
+time or memory. A measurement without a baseline is reported, and fails
+the run with `--require-baseline`. `--save` records the run as the new
+baseline.
+"""
+
+import argparse, json, os, platform, resource, subprocess, sys, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "library"))
+
+from module_utils.kong_async import AsyncKongClient, AsyncKongEngine
+from module_utils.kong_client import KongClient
+from module_utils.kong_engine import KongEngine, result, summarize
+from module_utils.kong_resources import KongAPI, KongConsumer, KongPlugin, KongTarget, Selector, TargetRotation, prepare_target
+from fake_admin import FakeAdminServer
+
+SCENARIOS = ("apis", "plugins", "consumers", "async", "rotate", "prune")
+MAX_SIZES = {"rotate": 1000, "prune": 1000}
+DEFAULT_SIZES = "10,1000,50000"
+DEFAULT_BASELINE = os.path.join(HERE, "baselines", "bench_scale.json")
+
+# Differences smaller than these are noise, whatever the tolerance
+MIN_TIME = 0.05
+MIN_MEMORY = 2
+
+
+def api(number, changed=False):
+    return dict(
+        name="api{}" . format (number),
+        upstream_url="http://upstream{}.{}" . format (number, "org" if changed else "com"),
+        request_host="api{}.com" . format (number),
+    )
+
+def seed_apis(store, size):
+    for number in range(size):
+        entry = store.apis.add(dict(api(number), strip_request_path=False, preserve_host=False))
+        store.plugins.add(dict(name="cors", api_id=entry["id"], config={"origin": "*"}))
+
+def seed_consumers(store, size):
+    for number in range(size):
+        if number % 10:
+            store.consumers.add(dict(username="user{}" . format (number), custom_id="id{}" . format (number)))
+
+def seed_upstreams(store, size):
+    for number in range(size):
+        entry = store.upstreams.add(dict(name="upstream{}" . format (number), slots=1000))
+        for host in ("10.0.0.1:8080", "10.0.0.2:8080"):
+            store.targets.add(dict(target=host, weight=100, upstream_id=entry["id"]))
+
+SEEDS = {
+    "apis": seed_apis,
+    "plugins": seed_apis,
+    "consumers": seed_consumers,
+    "async": seed_consumers,
+    "rotate": seed_upstreams,
+    "prune": seed_apis,
+}
+
+
+def run_apis(client, size, engine):
+    apis = [
+        dict(api(number, changed=number % 10 == 0), plugins=[dict(name="cors", config={"config.origin": "*"})])
+        for number in range(size)
+    ]
+    return KongAPI(client.base_url, client=client).converge(apis, False, engine)
+
+def run_plugins(client, size, engine):
+    results = []
+    for number in range(size):
+        plugin = KongPlugin(client.base_url, "api{}" . format (number), client=client)
+        response = plugin.add_or_update("cors", {"config.origin": "example.com" if number % 10 == 0 else "*"})
+        results.append(result(plugin.api, None, response))
+    return results
+
+def run_consumers(client, size, engine):
+    consumers = (dict(username="user{}" . format (number), custom_id="id{}" . format (number)) for number in range(size))
+    return KongConsumer(client.base_url, client=client).converge(consumers, False, engine)
+
+def run_async(client, size, engine):
+    consumers = (dict(username="user{}" . format (number), custom_id="id{}" . format (number)) for number in range(size))
+    async_client = AsyncKongClient(client.base_url, parallelism=engine.parallelism, retry_backoff=client.retry_backoff)
+    try:
+        return KongConsumer(client.base_url, client=async_client).converge(consumers, False, AsyncKongEngine(engine.parallelism))
+    finally:
+        async_client.close()
+
+def run_rotate(client, size, engine):
+    targets = [prepare_target("10.0.1.1:8080"), prepare_target("10.0.1.2:8080")]
+    rotations = (
+        TargetRotation(KongTarget(client.base_url, "upstream{}" . format (number), client=client), targets, interval=0.01)
+        for number in range(size)
+    )
+    return engine.run([rotations])
+
+def run_prune(client, size, engine):
+    return KongAPI(client.base_url, client=client).prune(Selector(prefix="api"), engine)
+
+RUNS = {
+    "apis": run_apis,
+    "plugins": run_plugins,
+    "consumers": run_consumers,
+    "async": run_async,
+    "rotate": run_rotate,
+    "prune": run_prune,
+}
+
+
+def peak_memory():
+    """Peak resident memory of this process, in MB"""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024 if sys.platform == "darwin" else 1024.0)
+
+def child(scenario, size, url, parallelism):
+    """Runs one scenario against a seeded server and prints what it took"""
+
+    client = KongClient(url, retry_backoff=0.01)
+    start = time.time()
+    results = RUNS[scenario](client, size, KongEngine(parallelism))
+    wall = time.time() - start
+    _, failed, _, summary = summarize(results)
+    print(json.dumps(dict(wall=wall, peak_mb=peak_memory(), failed=len(failed), summary=summary)))
+
+def measure(server, scenario, size, parallelism):
+    server.reset()
+    SEEDS[scenario](server.store, size)
+    output = subprocess.check_output([
+        sys.executable, os.path.abspath(__file__), "--child", scenario, str(size), server.url,
+        "--parallelism", str(parallelism),
+    ])
+    measurement = json.loads(output.decode("utf-8"))
+    measurement["requests"] = sum(server.requests.values())
+    return measurement
+
+
+def load_baseline(path):
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (IOError, OSError, ValueError):
+        return {}
+
+def regressions(measurement, baseline, tolerance):
+    found = []
+    if measurement["requests"] > baseline["requests"]:
+        found.append("requests {} > {}" . format (measurement["requests"], baseline["requests"]))
+    if measurement["wall"] > baseline["wall"] * (1 + tolerance) and measurement["wall"] - baseline["wall"] > MIN_TIME:
+        found.append("wall {:.3f}s > {:.3f}s" . format (measurement["wall"], baseline["wall"]))
+    if measurement["peak_mb"] > baseline["peak_mb"] * (1 + tolerance) and measurement["peak_mb"] - baseline["peak_mb"] > MIN_MEMORY:
+        found.append("memory {:.1f}MB > {:.1f}MB" . format (measurement["peak_mb"], baseline["peak_mb"]))
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated entity counts")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--latency", type=float, default=0, help="seconds the server waits before each answer")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of requests answered with a 503")
+    parser.add_argument("--parallelism", type=int, default=1)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--save", action="store_true", help="save this run as the baseline")
+    parser.add_argument("--require-baseline", action="store_true", help="fail if a measurement has no baseline")
+    parser.add_argument("--child", nargs=3, metavar=("SCENARIO", "SIZE", "URL"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        scenario, size, url = args.child
+        return child(scenario, int(size), url, args.parallelism)
+
+    config = "python{}-latency{}-errors{}-parallelism{}" . format (
+        ".".join(platform.python_version_tuple()[:2]), args.latency, args.error_rate, args.parallelism)
+    saved = load_baseline(args.baseline)
+    baseline = saved.get(config, {})
+
+    server = FakeAdminServer(latency=args.latency, error_rate=args.error_rate).start()
+    measurements = {}
+    missing = []
+    failed = False
+    try:
+        print("{:<10} {:>6} {:>9} {:>9} {:>9}  {}" . format ("scenario", "size", "wall", "requests", "peak", "baseline"))
+        for size in [int(size) for size in args.sizes.split(",")]:
+            for scenario in args.scenarios.split(","):
+                if size > MAX_SIZES.get(scenario, size):
+                    continue
+                if scenario == "async" and sys.version_info < (3, 6):
+                    continue
+                key = "{}/{}" . format (scenario, size)
+                measurement = measurements[key] = measure(server, scenario, size, args.parallelism)
+                if args.save:
+                    status = "-"
+                elif key in baseline:
+                    found = regressions(measurement, baseline[key], args.tolerance)
+                    status = "; " . join (found) if found else "ok"
+                    failed = failed or bool(found)
+                else:
+                    status = "no baseline"
+                    missing.append(key)
+                if measurement["failed"]:
+                    status = "{} ({} failed)" . format (status, measurement["failed"])
+                print("{:<10} {:>6} {:>8.3f}s {:>9} {:>7.1f}MB  {}" . format (
+                    scenario, size, measurement["wall"], measurement["requests"], measurement["peak_mb"], status))
+    finally:
+        server.stop()
+
+    if missing:
+        sys.stderr.write("{}: no baseline for {} in {}, so they were not checked. Run with --save to record one.\n" . format (
+            "FAILED" if args.require_baseline else "WARNING", ", " . join (missing), config))
+        failed = failed or args.require_baseline
+
+    if args.save:
+        saved[config] = dict(baseline, **measurements)
+        directory = os.path.dirname(args.baseline)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(args.baseline, "w") as target:
+            json.dump(saved, target, indent=2, sort_keys=True, separators=(",", ": "))
+            target.write("\n")
+        print("Saved the baseline for {} to {}" . format (config, args.baseline))
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
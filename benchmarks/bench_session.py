@@ -0,0 +1,51 @@
+"""Compares a new connection per call with the pooled KongClient session.
+
+    python benchmarks/bench_session.py --requests 500
+"""
+
+import argparse, os, sys, time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "library"))
+
+from module_utils.kong_client import KongClient
+from stub_admin import StubAdminServer
+
+
+def per_call(url, count):
+    for _ in range(count):
+        requests.get(url).close()
+
+def pooled(url, count):
+    client = KongClient(url)
+    for _ in range(count):
+        client.get(url)
+    client.close()
+
+def timed(fn, url, count):
+    start = time.time()
+    fn(url, count)
+    return time.time() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    server = StubAdminServer().start()
+    url = "{}/apis" . format (server.url)
+    try:
+        results = [
+            ("per-call", timed(per_call, url, args.requests)),
+            ("pooled", timed(pooled, url, args.requests)),
+        ]
+    finally:
+        server.stop()
+
+    for name, elapsed in results:
+        print("{:<10} {:>8.3f}s {:>10.1f} req/s" . format (name, elapsed, args.requests / elapsed))
+    print("speedup    {:>8.2f}x" . format (results[0][1] / results[1][1]))
+
+if __name__ == '__main__':
+    main()
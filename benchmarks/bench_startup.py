@@ -0,0 +1,67 @@
+"""Compares running kong_api tasks as one process each, the way Ansible
+runs modules, with running them through the in-process batch runner.
+
+    python benchmarks/bench_startup.py --tasks 20
+"""
+
+import argparse, json, os, shutil, subprocess, sys, tempfile, time
+
+LIBRARY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "library")
+sys.path.insert(0, LIBRARY)
+
+from module_utils.kong_batch import run_batch
+from stub_admin import StubAdminServer
+
+
+def tasks(url, count):
+    return [
+        dict(module="kong_api", params=dict(
+            kong_admin_uri=url,
+            name="api{}" . format (number),
+            upstream_url="http://upstream{}.com" . format (number),
+        ))
+        for number in range(count)
+    ]
+
+def per_process(batch):
+    directory = tempfile.mkdtemp()
+    try:
+        for number, task in enumerate(batch):
+            path = os.path.join(directory, "args{}.json" . format (number))
+            with open(path, "w") as args:
+                json.dump(dict(ANSIBLE_MODULE_ARGS=task["params"]), args)
+            script = os.path.join(LIBRARY, "{}.py" . format (task["module"]))
+            subprocess.check_output([sys.executable, script, path], cwd=LIBRARY)
+    finally:
+        shutil.rmtree(directory)
+
+def in_process(batch):
+    for result in run_batch(batch):
+        assert not result["failed"], result
+
+def timed(fn, batch):
+    start = time.time()
+    fn(batch)
+    return time.time() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=20)
+    args = parser.parse_args()
+
+    server = StubAdminServer().start()
+    batch = tasks(server.url, args.tasks)
+    try:
+        results = [
+            ("process", timed(per_process, batch)),
+            ("batch", timed(in_process, batch)),
+        ]
+    finally:
+        server.stop()
+
+    for name, elapsed in results:
+        print("{:<10} {:>8.3f}s {:>10.1f} ms/task" . format (name, elapsed, 1000 * elapsed / args.tasks))
+    print("speedup    {:>8.2f}x" . format (results[0][1] / results[1][1]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""An in-memory fake of the Kong admin API for benchmarks.
+
+Unlike stub_admin, it keeps state: APIs, their plugins, consumers and
+their credentials, upstreams and their targets can be created, read, updated, deleted and listed,
+and listings are paginated with `size` and `offset` the way Kong's are.
+The server can also wait before every answer (`latency`, in seconds)
+and answer a share of requests with an error (`error_rate`), to see
+how the modules behave on a slow or flaky admin endpoint."""
+
+import json, random, threading, time
+
+from six.moves.urllib.parse import urlparse, parse_qs, urlencode
+
+from stub_admin import StubAdminHandler, StubAdminServer
+
+DEFAULT_PAGE_SIZE = 100
+
+# Credential paths under /consumers/{id}, by the collection of all of them
+CREDENTIALS = {
+    'key-auth': 'key-auths',
+    'basic-auth': 'basic-auths',
+    'hmac-auth': 'hmac-auths',
+    'jwt': 'jwts',
+    'acls': 'acls',
+    'oauth2': 'oauth2',
+}
+
+
+class Conflict(Exception):
+    pass
+
+
+class Collection:
+    """The entries of one Kong collection, in creation order, with a
+    lookup by id and by `key` (name, username) and lists of ids by the
+    value of each `indexed` field, so that filtered listings don't scan
+    the whole collection."""
+
+    def __init__(self, key=None, indexed=()):
+        self.key = key
+        self.entries = {}
+        self.order = []
+        self.by_key = {}
+        self.indexes = dict((field, {}) for field in indexed)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, ref):
+        entry = self.entries.get(ref)
+        if entry is None and self.key is not None:
+            entry = self.by_key.get(ref)
+        return entry
+
+    def add(self, fields, id=None):
+        if self.key is not None and fields.get(self.key) in self.by_key:
+            raise Conflict("{} already exists with value '{}'" . format (self.key, fields.get(self.key)))
+
+        entry = dict(fields, id=id or "{:012x}" . format (random.getrandbits(48)), created_at=int(time.time() * 1000))
+        self.entries[entry["id"]] = entry
+        self.order.append(entry["id"])
+        if self.key is not None and entry.get(self.key) is not None:
+            self.by_key[entry[self.key]] = entry
+        for field, index in self.indexes.items():
+            index.setdefault(entry.get(field), []).append(entry["id"])
+        return entry
+
+    def update(self, entry, fields):
+        if self.key is not None and fields.get(self.key, entry.get(self.key)) != entry.get(self.key):
+            if fields[self.key] in self.by_key:
+                raise Conflict("{} already exists with value '{}'" . format (self.key, fields[self.key]))
+            self.by_key.pop(entry.get(self.key), None)
+            self.by_key[fields[self.key]] = entry
+        for field, index in self.indexes.items():
+            if field in fields and fields[field] != entry.get(field):
+                index.setdefault(fields[field], []).append(entry["id"])
+        entry.update(fields)
+        return entry
+
+    def remove(self, entry):
+        self.entries.pop(entry["id"], None)
+        if self.key is not None:
+            self.by_key.pop(entry.get(self.key), None)
+
+    def page(self, filters, offset, size):
+        """Returns up to `size` entries matching `filters` from position
+        `offset`, and the offset of the next page, or None. Deleted ids
+        are left in the order lists and skipped here."""
+
+        ids = self.order
+        for field, value in filters.items():
+            if field in self.indexes:
+                candidates = self.indexes[field].get(value, [])
+                if len(candidates) < len(ids):
+                    ids = candidates
+
+        page = []
+        position = offset
+        while position < len(ids) and len(page) < size:
+            entry = self.entries.get(ids[position])
+            position += 1
+            if entry is not None and all(str(entry.get(field)) == str(value) for field, value in filters.items()):
+                page.append(entry)
+        return page, (position if position < len(ids) else None)
+
+
+class AdminStore:
+    """The state of the fake admin API"""
+
+    def __init__(self):
+        self.apis = Collection("name")
+        self.plugins = Collection(indexed=("api_id", "consumer_id", "name"))
+        self.consumers = Collection("username", indexed=("custom_id",))
+        self.credentials = dict((path, Collection(indexed=("consumer_id",))) for path in CREDENTIALS)
+        self.upstreams = Collection("name")
+        self.targets = Collection(indexed=("upstream_id",))
+        self.lock = threading.Lock()
+
+
+def convert(value):
+    """Turns a form value into the JSON type Kong would store"""
+
+    lowered = value.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+def form_fields(body):
+    """Decodes a form body, with dotted keys (config.minute) nested the
+    way Kong nests them"""
+
+    fields = {}
+    for key, values in parse_qs(body, keep_blank_values=True).items():
+        values = [convert(value) for value in values]
+        value = values[0] if len(values) == 1 else values
+        target = fields
+        parts = key.split(".")
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return fields
+
+
+class FakeAdminHandler(StubAdminHandler):
+
+    def _respond(self, status, body=None):
+        payload = b"" if body is None else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+
+        server = self.server
+        server.count(method)
+        if server.latency:
+            time.sleep(server.latency)
+        if server.fail():
+            return self._respond(server.error_status, {"message": "Injected error"})
+
+        url = urlparse(self.path)
+        query = dict((key, values[0]) for key, values in parse_qs(url.query).items())
+        segments = [segment for segment in url.path.split("/") if segment]
+        with server.store.lock:
+            try:
+                status, reply = self.route(method, segments, query, form_fields(body))
+            except Conflict as conflict:
+                status, reply = 409, {"message": str(conflict)}
+        self._respond(status, reply)
+
+    def route(self, method, segments, query, fields):
+        store = self.server.store
+        if not segments:
+            return 404, {"message": "Not found"}
+
+        head, rest = segments[0], segments[1:]
+        if head == "apis":
+            return self.nested(method, store.apis, rest, query, fields, "plugins", store.plugins, "api_id")
+        if head == "consumers":
+            if len(rest) >= 2 and rest[1] in store.credentials:
+                return self.nested(method, store.consumers, rest[:1] + ["credentials"] + rest[2:], query, fields,
+                                   "credentials", store.credentials[rest[1]], "consumer_id")
+            return self.nested(method, store.consumers, rest, query, fields)
+        if head == "plugins":
+            return self.entity(method, store.plugins, rest, query, fields)
+        if head == "upstreams":
+            if len(rest) == 2 and rest[1] == "health" and method == "GET":
+                return self.health(rest[0])
+            return self.nested(method, store.upstreams, rest, query, fields, "targets", store.targets, "upstream_id")
+        for path, collection in CREDENTIALS.items():
+            if head == collection and method == "GET":
+                return self.entity(method, store.credentials[path], rest, query, fields)
+        return 404, {"message": "Not found"}
+
+    def nested(self, method, parents, rest, query, fields, child=None, children=None, parent_field=None):
+        """Routes /parents[/ref[/child[/id]]]"""
+
+        if len(rest) <= 1:
+            return self.entity(method, parents, rest, query, fields)
+        if rest[1] != child:
+            return 404, {"message": "Not found"}
+
+        parent = parents.get(rest[0])
+        if parent is None:
+            return 404, {"message": "Not found"}
+        if len(rest) == 2:
+            query = dict(query, **{parent_field: parent["id"]})
+            fields = dict(fields, **{parent_field: parent["id"]})
+        else:
+            entry = children.get(rest[2])
+            if entry is None or entry.get(parent_field) != parent["id"]:
+                return 404, {"message": "Not found"}
+        return self.entity(method, children, rest[2:], query, fields)
+
+    def entity(self, method, collection, rest, query, fields):
+        """Routes /collection[/ref]"""
+
+        if not rest:
+            if method == "GET":
+                return 200, self.listing(collection, query)
+            if method in ("POST", "PUT"):
+                return 201, collection.add(fields)
+            return 405, {"message": "Method not allowed"}
+
+        entry = collection.get(rest[0])
+        if entry is None:
+            return 404, {"message": "Not found"}
+        if method == "GET":
+            return 200, entry
+        if method == "PATCH":
+            return 200, collection.update(entry, fields)
+        if method == "DELETE":
+            if collection is self.server.store.targets:
+                # Kong 0.x keeps a target's history: deleting it adds an
+                # entry with weight 0
+                collection.add(dict(target=entry.get("target"), weight=0, upstream_id=entry.get("upstream_id")))
+            else:
+                collection.remove(entry)
+            return 204, None
+        return 405, {"message": "Method not allowed"}
+
+    def health(self, ref):
+        """Reports every target of the upstream that takes requests as
+        healthy"""
+
+        store = self.server.store
+        upstream = store.upstreams.get(ref)
+        if upstream is None:
+            return 404, {"message": "Not found"}
+        latest = {}
+        targets, _ = store.targets.page({"upstream_id": upstream["id"]}, 0, len(store.targets))
+        for entry in targets:
+            latest[entry.get("target")] = entry
+        data = [dict(target=entry.get("target"), weight=entry.get("weight"), health="HEALTHY")
+                for entry in latest.values() if entry.get("weight")]
+        return 200, {"data": data, "total": len(data)}
+
+    def listing(self, collection, query):
+        size = int(query.pop("size", DEFAULT_PAGE_SIZE))
+        offset = int(query.pop("offset", 0))
+        page, next_offset = collection.page(query, offset, size)
+        body = {"data": page, "total": len(collection)}
+        if next_offset is not None:
+            body["offset"] = str(next_offset)
+            body["next"] = "{}?{}" . format (self.path.split("?")[0], urlencode(dict(query, size=size, offset=next_offset)))
+        return body
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+class FakeAdminServer(StubAdminServer):
+    """Serves an AdminStore. `requests` counts the requests answered,
+    by method."""
+
+    def __init__(self, latency=0, error_rate=0, error_status=503, seed=0):
+        StubAdminServer.__init__(self, FakeAdminHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.store = AdminStore()
+        self.requests = {}
+
+    def count(self, method):
+        with self._lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+
+    def fail(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
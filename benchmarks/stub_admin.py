@@ -0,0 +1,66 @@
+"""A minimal stub of the Kong admin API for benchmarks.
+
+Answers every request with a small JSON body over HTTP/1.1 keep-alive,
+so the cost measured is the client's, not the server's."""
+
+import json, threading
+
+from six.moves import BaseHTTPServer, socketserver
+
+
+class StubAdminHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _reply(self, status, body=None):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        payload = b"" if body is None else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._reply(200, {"data": []})
+
+    def do_POST(self):
+        self._reply(201, {"id": "1"})
+
+    def do_PATCH(self):
+        self._reply(200, {"id": "1"})
+
+    def do_DELETE(self):
+        self._reply(204)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubAdminServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+    # Room for the connections of hundreds of requests in flight
+    request_queue_size = 512
+
+    def __init__(self, handler=StubAdminHandler):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), handler)
+
+    @property
+    def url(self):
+        return "http://{}:{}" . format (*self.server_address)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,51 @@
+"""Runs kong_api, kong_plugin, kong_consumer and kong_upstream tasks in one process,
+outside of Ansible.
+
+    python bin/kong_batch.py tasks.json [--check] [--diff]
+
+The tasks file holds a JSON list of tasks, or one task per line, each
+with the module to run and its params:
+
+    {"module": "kong_api", "params": {"kong_admin_uri": "http://127.0.0.1:8001", "name": "mockbin", "upstream_url": "http://mockbin.com"}}
+
+Use - to read the tasks from stdin. One JSON result is printed per task,
+as it finishes. The exit status is 1 if any task failed.
+"""
+
+import argparse, json, os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "library"))
+
+from module_utils.kong_batch import run_batch
+
+
+def read_tasks(source):
+    content = source.read()
+    if content.lstrip().startswith("["):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tasks", help="JSON or JSON lines file of tasks, or - for stdin")
+    parser.add_argument("--check", action="store_true", help="plan the changes without making them")
+    parser.add_argument("--diff", action="store_true", help="include before and after diffs")
+    parser.add_argument("--stop-on-failure", action="store_true", help="stop at the first failed task")
+    args = parser.parse_args()
+
+    if args.tasks == "-":
+        tasks = read_tasks(sys.stdin)
+    else:
+        with open(args.tasks) as source:
+            tasks = read_tasks(source)
+
+    failed = False
+    for result in run_batch(tasks, args.check, args.diff, args.stop_on_failure):
+        failed = failed or result["failed"]
+        print(json.dumps(result, sort_keys=True))
+        sys.stdout.flush()
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -24,78 +24,30 @@ EXAMPLES = '''
 
 '''
 
-import json, requests, os
-
-class KongAPI:
-
-    def __init__(self, base_url, auth_username=None, auth_password=None):
-        self.base_url = base_url
-        if auth_username is not None and auth_password is not None:
-            self.auth = (auth_username, auth_password)
-        else:
-            self.auth = None
-
-    def __url(self, path):
-        return "{}{}" . format (self.base_url, path)
-
-    def _api_exists(self, name, api_list):
-        for api in api_list:
-            if name == api.get("name", None):
-                return True 
-        return False
-
-    def add_or_update(self, name, upstream_url, request_host=None, request_path=None, strip_request_path=False, preserve_host=False):
-
-        method = "post"        
-        url = self.__url("/apis/")
-        api_list = self.list().json().get("data", [])
-        api_exists = self._api_exists(name, api_list)
-
-        if api_exists:
-            method = "patch"
-            url = "{}{}" . format (url, name)
-
-        data = {
-            "name": name,
-            "upstream_url": upstream_url,
-            "strip_request_path": strip_request_path,
-            "preserve_host": preserve_host
-        }
-        if request_host is not None:
-            data['request_host'] = request_host
-        if request_path is not None:
-            data['request_path'] = request_path
-
-        return getattr(requests, method)(url, data, auth=self.auth)
-        
-
-    def list(self):
-        url = self.__url("/apis")
-        return requests.get(url, auth=self.auth)
-
-    def info(self, id):
-        url = self.__url("/apis/{}" . format (id))
-        return requests.get(url, auth=self.auth)
-
-    def delete_by_name(self, name):
-        info = self.info(name)
-        id = info.json().get("id")
-        return self.delete(id)
-
-    def delete(self, id):
-        path = "/apis/{}" . format (id)
-        url = self.__url(path)
-        return requests.delete(url, auth=self.auth)
+try:
+    from ansible.module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from ansible.module_utils.kong_cluster import fan_out
+    from ansible.module_utils.kong_engine import check_response
+    from ansible.module_utils.kong_resources import KongAPI, API_FIELDS
+    from ansible.module_utils.kong_result import response_meta, result_argument_spec
+    from ansible.module_utils.kong_task import finish
+except ImportError:
+    from module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from module_utils.kong_cluster import fan_out
+    from module_utils.kong_engine import check_response
+    from module_utils.kong_resources import KongAPI, API_FIELDS
+    from module_utils.kong_result import response_meta, result_argument_spec
+    from module_utils.kong_task import finish
 
 class ModuleHelper:
 
-    def __init__(self, fields):
+    def __init__(self, fields=API_FIELDS):
         self.fields = fields
     
-    def get_module(self):
+    def argument_spec(self):
 
         args = dict(
-            kong_admin_uri = dict(required=False, type='str'),
+            kong_admin_uri = dict(required=False, type='list'),
             kong_admin_username = dict(required=False, type='str'),
             kong_admin_password = dict(required=False, type='str'),
             name = dict(required=False, type='str'),
@@ -106,7 +58,14 @@ class ModuleHelper:
             preserve_host = dict(required=False, default=False, type='bool'),         
             state = dict(required=False, default="present", choices=['present', 'absent', 'latest', 'list', 'info'], type='str'),    
         )
-        return AnsibleModule(argument_spec=args,supports_check_mode=False)
+        args.update(client_argument_spec())
+        args.update(result_argument_spec())
+        return args
+
+    def get_module(self):
+        from ansible.module_utils.basic import AnsibleModule
+
+        return AnsibleModule(argument_spec=self.argument_spec(),supports_check_mode=True)
 
     def prepare_inputs(self, module):
         url = module.params['kong_admin_uri']
@@ -125,7 +84,7 @@ class ModuleHelper:
     def get_response(self, response, state):
 
         if state == "present":
-            meta = response.json()
+            meta = response_meta(response)
             has_changed = response.status_code in [201, 200]
             
         if state == "absent":
@@ -133,11 +92,43 @@ class ModuleHelper:
             has_changed = response.status_code == 204
 
         if state == "list":
-            meta = response.json()
+            meta = response_meta(response)
             has_changed = False
 
         return (has_changed, meta)
 
+def run(helper, module):
+    """Does the module's work for an AnsibleModule, or a KongTask when run
+    in process. Returns the result to exit (or, if failed, fail) with."""
+
+    base_url, data, state, auth_user, auth_password = helper.prepare_inputs(module)
+
+    client = get_client(base_url, auth_user, auth_password, **client_options(module.params))
+    api = KongAPI(base_url, client=client)
+    try:
+        if module.check_mode and state in ["present", "absent"]:
+            action, diff = api.plan(state=state, **data)
+            return dict(check_response(action, diff, module._diff), **client.stats())
+        if state == "present":
+            response = api.add_or_update(**data)
+        if state == "absent":
+            response = api.delete_by_name(data.get("name"))
+        if state == "list":
+            apis = list(api.iterate())
+            return dict(changed=False, meta=dict(data=apis, total=len(apis)), **client.stats())
+    except KongError as error:
+        response = error.response
+
+    if response.status_code == 401:
+        return dict(failed=True, msg="Please specify kong_admin_username and kong_admin_password", meta=response.json())
+    elif response.status_code == 403:
+        return dict(failed=True, msg="Please check kong_admin_username and kong_admin_password", meta=response.json())
+    elif response.status_code >= 400 and not (response.status_code == 404 and state == "absent"):
+        return dict(failed=True, msg="Kong admin API returned {}" . format (response.status_code), meta=response_meta(response))
+    else:
+        has_changed, meta = helper.get_response(response, state)
+        return dict(changed=has_changed, meta=meta, **client.stats())
+
 def main():
 
     fields = [
@@ -153,26 +144,7 @@ def main():
 
     global module # might not need this
     module = helper.get_module()  
-    base_url, data, state, auth_user, auth_password = helper.prepare_inputs(module)
-
-    api = KongAPI(base_url, auth_user, auth_password)
-    if state == "present":
-        response = api.add_or_update(**data)
-    if state == "absent":
-        response = api.delete_by_name(data.get("name"))
-    if state == "list":
-        response = api.list()
-
-    if response.status_code == 401:
-        module.fail_json(msg="Please specify kong_admin_username and kong_admin_password", meta=response.json())
-    elif response.status_code == 403:
-        module.fail_json(msg="Please check kong_admin_username and kong_admin_password", meta=response.json())
-    else:
-        has_changed, meta = helper.get_response(response, state)
-        module.exit_json(changed=has_changed, meta=meta)
-
-from ansible.module_utils.basic import *
-from ansible.module_utils.urls import *
+    finish(module, fan_out(run, helper, module))
 
 if __name__ == '__main__':
     main()
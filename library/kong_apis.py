@@ -0,0 +1,136 @@
+#!/usr/bin/python
+
+DOCUMENTATION = '''
+---
+module: kong_apis
+short_description: Converge many Kong APIs in one task
+
+'''
+
+EXAMPLES = '''
+- name: Register all APIs
+  kong_apis:
+    kong_admin_uri: http://127.0.0.1:8001
+    apis:
+      - name: "Mockbin"
+        upstream_url: "http://mockbin.com"
+        request_host: "mockbin.com"
+        plugins:
+          - name: "key-auth"
+          - name: "rate-limiting"
+            config:
+              config.minute: 20
+      - name: "Legacy"
+        state: absent
+    purge: no
+    parallelism: 8
+
+'''
+
+try:
+    from ansible.module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from ansible.module_utils.kong_cluster import fan_out
+    from ansible.module_utils.kong_engine import KongEngine, engine_argument_spec, summarize
+    from ansible.module_utils.kong_resources import KongAPI, API_FIELDS, prepare_api, validate_apis
+    from ansible.module_utils.kong_result import result_argument_spec
+    from ansible.module_utils.kong_task import finish
+except ImportError:
+    from module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from module_utils.kong_cluster import fan_out
+    from module_utils.kong_engine import KongEngine, engine_argument_spec, summarize
+    from module_utils.kong_resources import KongAPI, API_FIELDS, prepare_api, validate_apis
+    from module_utils.kong_result import result_argument_spec
+    from module_utils.kong_task import finish
+
+class ModuleHelper:
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def get_module(self):
+        from ansible.module_utils.basic import AnsibleModule
+
+        args = dict(
+            kong_admin_uri = dict(required=True, type='list'),
+            kong_admin_username = dict(required=False, type='str'),
+            kong_admin_password = dict(required=False, type='str'),
+            apis = dict(required=True, type='list'),
+            purge = dict(required=False, default=False, type='bool'),
+        )
+        args.update(client_argument_spec())
+        args.update(result_argument_spec())
+        args.update(engine_argument_spec())
+        return AnsibleModule(argument_spec=args,supports_check_mode=True)
+
+    def prepare_item(self, item):
+        """Picks the known fields out of one API definition and fills in
+        the same defaults kong_api would"""
+
+        return prepare_api(item, self.fields)
+
+    def prepare_inputs(self, module):
+        url = module.params['kong_admin_uri']
+        auth_user = module.params['kong_admin_username']
+        auth_password = module.params['kong_admin_password']
+        purge = module.params['purge']
+        apis = [self.prepare_item(item) for item in module.params['apis']]
+
+        return (url, apis, purge, auth_user, auth_password)
+
+    def validate(self, apis):
+        """Returns an error message, or None if every item is usable"""
+
+        return validate_apis(apis)
+
+    def get_response(self, results):
+        """Whether anything changed, the failures, every result, and a
+        count of the results per action"""
+
+        has_changed, failed, _, summary = summarize(results)
+        return (has_changed, failed, results, summary)
+
+    def get_diff(self, results):
+        """Takes the diffs out of the results, so they are only sent
+        back when Ansible runs with --diff"""
+
+        return [result.pop('diff') for result in results if 'diff' in result]
+
+def run(helper, module):
+    """Does the module's work against one admin endpoint, for an
+    AnsibleModule or a KongTask. Returns the result to exit (or, if
+    failed, fail) with."""
+
+    base_url, apis, purge, auth_user, auth_password = helper.prepare_inputs(module)
+
+    error = helper.validate(apis)
+    if error is not None:
+        return dict(failed=True, msg=error)
+
+    client = get_client(base_url, auth_user, auth_password, **client_options(module.params))
+    api = KongAPI(base_url, client=client)
+    engine = KongEngine(module.params['parallelism'])
+    try:
+        has_changed, failed, results, summary = helper.get_response(api.converge(apis, purge, engine, module.check_mode))
+    except KongError as error:
+        return dict(failed=True, msg="Could not list the registered APIs: {}" . format (error))
+
+    diff = helper.get_diff(results)
+    if any(result['status_code'] in [401, 403] for result in failed):
+        return dict(failed=True, msg="Please check kong_admin_username and kong_admin_password", results=results, summary=summary)
+    elif failed:
+        return dict(failed=True, msg="Failed to converge {} APIs" . format (len(failed)), results=results, summary=summary)
+    elif module._diff:
+        return dict(changed=has_changed, results=results, summary=summary, diff=diff, **client.stats())
+    else:
+        return dict(changed=has_changed, results=results, summary=summary, **client.stats())
+
+def main():
+
+    helper = ModuleHelper(API_FIELDS)
+
+    global module # might not need this
+    module = helper.get_module()
+    finish(module, fan_out(run, helper, module))
+
+if __name__ == '__main__':
+    main()
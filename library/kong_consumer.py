@@ -1,57 +1,50 @@
 #!/usr/bin/python
 
-import requests
-
-class KongConsumer:
-
-    def __init__(self, base_url, auth_username=None, auth_password=None):
-        self.base_url = "{}/consumers" . format(base_url)
-        if auth_username is not None and auth_password is not None:
-            self.auth = (auth_username, auth_password)
-        else:
-            self.auth = None
-
-    def list(self):
-    	return requests.get(self.base_url, auth=self.auth)
-
-    def add(self, username=None, custom_id=None):
-    	
-    	assert [username, custom_id] != [None, None], \
-    		'Please provide at least one of username or custom_id'
-
-    	data = {}
-    	if username is not None:
-    		data['username'] = username
-    	if custom_id is not None:
-    		data['custom_id'] = custom_id
-
-    	return requests.post(self.base_url, data, auth=self.auth)
-
-    def delete(self, id):
-    	url = "{}/{}" . format (self.base_url, id)
-    	return requests.delete(url, auth=self.auth)
-
-    def configure_for_plugin(self, username_or_id, api, data):
-        """This could possibly go in it's own plugin"""
-
-        url = "{}/{}/{}" . format (self.base_url, username_or_id, api)
-        return requests.post(url, data, auth=self.auth)
+import json, os, tempfile
+
+try:
+    from ansible.module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from ansible.module_utils.kong_cluster import admin_endpoints, fan_out
+    from ansible.module_utils.kong_engine import check_response, engine_argument_spec
+    from ansible.module_utils.kong_resources import KongConsumer, CREDENTIAL_COLLECTIONS
+    from ansible.module_utils.kong_result import response_meta, result_argument_spec
+    from ansible.module_utils.kong_task import finish
+except ImportError:
+    from module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from module_utils.kong_cluster import admin_endpoints, fan_out
+    from module_utils.kong_engine import check_response, engine_argument_spec
+    from module_utils.kong_resources import KongConsumer, CREDENTIAL_COLLECTIONS
+    from module_utils.kong_result import response_meta, result_argument_spec
+    from module_utils.kong_task import finish
+
+# Bytes read at a time when comparing an export with the file it replaces
+CHUNK_SIZE = 65536
 
 class ModuleHelper:
     
-    def get_module(self):
+    def argument_spec(self):
 
         args = dict(
-            kong_admin_uri = dict(required=True, type='str'),
+            kong_admin_uri = dict(required=True, type='list'),
             kong_admin_username = dict(required=False, type='str'),
             kong_admin_password = dict(required=False, type='str'),
             username = dict(required=False, type='str'),
             custom_id = dict(required=False, type='str'),
-            state = dict(required=False, default="present", choices=['present', 'absent', 'list', 'configure'], type='str'),    
+            state = dict(required=False, default="present", choices=['present', 'absent', 'list', 'configure', 'unconfigure', 'export'], type='str'),    
             data = dict(required=False, type='dict'),
             api_name = dict(required=False, type='str'),
+            dest = dict(required=False, type='path'),
+            credentials = dict(required=False, default=[], type='list'),
         )
-        return AnsibleModule(argument_spec=args,supports_check_mode=False)
+        args.update(client_argument_spec())
+        args.update(result_argument_spec())
+        args.update(engine_argument_spec())
+        return args
+
+    def get_module(self):
+        from ansible.module_utils.basic import AnsibleModule
+
+        return AnsibleModule(argument_spec=self.argument_spec(),supports_check_mode=True)
 
     def prepare_inputs(self, module):
         url = module.params['kong_admin_uri']
@@ -68,47 +61,155 @@ class ModuleHelper:
     def get_response(self, response, state):
 
         if state in ["present", "configure"]:
-            meta = json.dumps(response.content)
-            has_changed = response.status_code == 201
+            meta = response_meta(response)
+            has_changed = response.status_code in [200, 201]
             
-        if state == "absent":
+        if state in ["absent", "unconfigure"]:
             meta = {}
             has_changed = response.status_code == 204
         if state == "list":
-            meta = response.json()
+            meta = response_meta(response)
             has_changed = False
 
         return (has_changed, meta)
 
-def main():
-
-    helper = ModuleHelper()
+    def open_export(self, path, mode, compressed):
+        """Opens an export file, gzipped if `compressed`. The gzip header
+        carries no timestamp, so the same export gives the same file."""
+
+        if compressed:
+            import gzip
+            return gzip.GzipFile(path, mode, mtime=0)
+        return open(path, mode)
+
+    def digest(self, path):
+        """The SHA1 of a file's content (uncompressed), or None if there is
+        no such file"""
+
+        import hashlib
+        if not os.path.exists(path):
+            return None
+        digest = hashlib.sha1()
+        with self.open_export(path, "rb", path.endswith(".gz")) as source:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def write_export(self, module, dest, items):
+        """Streams the consumers to dest, one JSON object per line, as they
+        are read, gzipped if dest ends in .gz, and only replaces dest if its content differs. Nothing is
+        written in check mode. Returns whether dest changed and the number
+        of consumers and credentials (by plugin) exported."""
+
+        import hashlib
+        total = dict(consumers=0, credentials={})
+        digest = hashlib.sha1()
+        temporary = None
+        output = None
+        if not module.check_mode:
+            handle, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dest)))
+            os.close(handle)
+            output = self.open_export(temporary, "wb", dest.endswith(".gz"))
+        try:
+            for item in items:
+                line = (json.dumps(item, sort_keys=True) + "\n").encode("utf-8")
+                digest.update(line)
+                if output is not None:
+                    output.write(line)
+                total["consumers"] += 1
+                for credential in item.get("credentials", []):
+                    total["credentials"][credential["plugin"]] = total["credentials"].get(credential["plugin"], 0) + 1
+        except BaseException:
+            if output is not None:
+                output.close()
+                os.remove(temporary)
+            raise
+        if output is not None:
+            output.close()
+
+        has_changed = digest.hexdigest() != self.digest(dest)
+        if temporary is not None:
+            if has_changed:
+                module.atomic_move(temporary, dest)
+            else:
+                os.remove(temporary)
+        return (has_changed, total)
+
+def export(helper, module, api):
+    """Runs state export: streams every consumer, with the credentials
+    asked for, to the dest file. Returns the result."""
+
+    dest = module.params.get('dest')
+    plugins = module.params.get('credentials') or []
+    if dest is None:
+        return dict(failed=True, msg="Please give the dest file to export the consumers to")
+    unknown = [plugin for plugin in plugins if plugin not in CREDENTIAL_COLLECTIONS]
+    if unknown:
+        return dict(failed=True, msg="Unknown credentials {}, expected some of: {}" . format (
+            ", " . join (unknown), ", " . join (sorted(CREDENTIAL_COLLECTIONS))))
+
+    try:
+        has_changed, total = helper.write_export(module, dest, api.stream(plugins, module.params.get('parallelism') or 1))
+    except KongError as error:
+        return dict(failed=True, msg="Could not list the consumers: {}" . format (error))
+    except (IOError, OSError) as error:
+        return dict(failed=True, msg="Could not write {}: {}" . format (dest, error))
+    return dict(changed=has_changed, dest=dest, total=total, **api.client.stats())
+
+def run(helper, module):
+    """Does the module's work for an AnsibleModule, or a KongTask when run
+    in process. Returns the result to exit (or, if failed, fail) with."""
 
-    global module # might not need this
-    module = helper.get_module()  
     base_url, username, id, state, api_name, data, auth_user, auth_password = helper.prepare_inputs(module)
 
-    api = KongConsumer(base_url, auth_user, auth_password)
-    if state == "present":
-        response = api.add(username, id)
-    if state == "absent":
-        response = api.delete(username)
-    if state == "configure":
-        response = api.configure_for_plugin(username, api_name, data)
-    if state == "list":
-        response = api.list()
+    client = get_client(base_url, auth_user, auth_password, **client_options(module.params))
+    api = KongConsumer(base_url, client=client)
+    if state == "export":
+        return export(helper, module, api)
+    try:
+        if module.check_mode and state in ["present", "absent"]:
+            action, diff = api.plan(username, id, state)
+            return dict(check_response(action, diff, module._diff), **client.stats())
+        if module.check_mode and state in ["configure", "unconfigure"]:
+            action, diff = api.plan_credential(username, api_name, data or {}, "absent" if state == "unconfigure" else "present")
+            return dict(check_response(action, diff, module._diff), **client.stats())
+        if state == "present":
+            response = api.add(username, id)
+        if state == "absent":
+            response = api.delete(username)
+        if state == "configure":
+            response = api.configure_for_plugin(username, api_name, data or {})
+        if state == "unconfigure":
+            response = api.unconfigure_for_plugin(username, api_name, data or {})
+        if state == "list" and api_name is not None:
+            credentials = api.credentials(username, api_name)
+            return dict(changed=False, meta=dict(data=credentials, total=len(credentials)), **client.stats())
+        if state == "list":
+            consumers = list(api.iterate())
+            return dict(changed=False, meta=dict(data=consumers, total=len(consumers)), **client.stats())
+    except KongError as error:
+        response = error.response
 
     if response.status_code == 401:
-        module.fail_json(msg="Please specify kong_admin_username and kong_admin_password", meta=response.json())
+        return dict(failed=True, msg="Please specify kong_admin_username and kong_admin_password", meta=response.json())
     elif response.status_code == 403:
-        module.fail_json(msg="Please check kong_admin_username and kong_admin_password", meta=response.json())
+        return dict(failed=True, msg="Please check kong_admin_username and kong_admin_password", meta=response.json())
+    elif response.status_code >= 400 and not (response.status_code == 404 and state in ["absent", "unconfigure"]):
+        return dict(failed=True, msg="Kong admin API returned {}" . format (response.status_code), meta=response_meta(response))
     else:
         has_changed, meta = helper.get_response(response, state)
-        module.exit_json(changed=has_changed, meta=meta)
+        return dict(changed=has_changed, meta=meta, **client.stats())
 
+def main():
+
+    helper = ModuleHelper()
+
+    global module # might not need this
+    module = helper.get_module()  
+    if module.params.get('state') == "export" and len(admin_endpoints(module.params.get('kong_admin_uri'))) > 1:
+        module.fail_json(msg="Export reads one gateway, please give a single kong_admin_uri")
+    finish(module, fan_out(run, helper, module))
 
-from ansible.module_utils.basic import *
-from ansible.module_utils.urls import *
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
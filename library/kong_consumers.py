@@ -0,0 +1,259 @@
+#!/usr/bin/python
+
+DOCUMENTATION = '''
+---
+module: kong_consumers
+short_description: Converge many Kong consumers and their credentials in one task
+
+'''
+
+EXAMPLES = '''
+- name: Register consumers from a list
+  kong_consumers:
+    kong_admin_uri: http://127.0.0.1:8001
+    consumers:
+      - username: "joesoap"
+        credentials:
+          - plugin: "key-auth"
+            data:
+              key: "abc123"
+      - custom_id: "1234"
+      - username: "leaver"
+        state: absent
+    parallelism: 8
+
+- name: Register consumers from a file, one JSON object per line
+  kong_consumers:
+    kong_admin_uri: http://127.0.0.1:8001
+    src: /srv/kong/consumers.jsonl
+
+- name: Register consumers from a CSV file
+  # username,custom_id,key-auth.key
+  # joesoap,,abc123
+  kong_consumers:
+    kong_admin_uri: http://127.0.0.1:8001
+    src: /srv/kong/consumers.csv
+    purge: yes
+
+- name: Rotate keys, keeping the old ones for a day after the new ones are added
+  # username,key-auth.key
+  # joesoap,new-key-for-joe
+  kong_consumers:
+    kong_admin_uri: http://127.0.0.1:8001
+    src: /srv/kong/new-keys.csv
+    credential_grace: 86400
+    parallelism: 16
+
+- name: Converge 50k consumers with hundreds of requests in flight (Python 3)
+  kong_consumers:
+    kong_admin_uri: http://127.0.0.1:8001
+    src: /srv/kong/consumers.jsonl.gz
+    engine: asyncio
+    parallelism: 200
+
+'''
+
+import csv, json, sys
+
+try:
+    from ansible.module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from ansible.module_utils.kong_cluster import fan_out
+    from ansible.module_utils.kong_async import AsyncKongClient, AsyncKongEngine, has_asyncio
+    from ansible.module_utils.kong_engine import KongEngine, engine_argument_spec, summarize
+    from ansible.module_utils.kong_resources import KongConsumer, CONSUMER_FIELDS, prepare_consumer, validate_consumers
+    from ansible.module_utils.kong_result import result_argument_spec
+    from ansible.module_utils.kong_task import finish
+except ImportError:
+    from module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from module_utils.kong_cluster import fan_out
+    from module_utils.kong_async import AsyncKongClient, AsyncKongEngine, has_asyncio
+    from module_utils.kong_engine import KongEngine, engine_argument_spec, summarize
+    from module_utils.kong_resources import KongConsumer, CONSUMER_FIELDS, prepare_consumer, validate_consumers
+    from module_utils.kong_result import result_argument_spec
+    from module_utils.kong_task import finish
+
+class ModuleHelper:
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def get_module(self):
+        from ansible.module_utils.basic import AnsibleModule
+
+        args = dict(
+            kong_admin_uri = dict(required=True, type='list'),
+            kong_admin_username = dict(required=False, type='str'),
+            kong_admin_password = dict(required=False, type='str'),
+            consumers = dict(required=False, type='list'),
+            src = dict(required=False, type='path'),
+            purge = dict(required=False, default=False, type='bool'),
+            credential_grace = dict(required=False, type='int'),
+            engine = dict(required=False, default="threads", choices=['threads', 'asyncio'], type='str'),
+        )
+        args.update(client_argument_spec())
+        args.update(result_argument_spec())
+        args.update(engine_argument_spec())
+        return AnsibleModule(
+            argument_spec=args,
+            mutually_exclusive=[['consumers', 'src']],
+            required_one_of=[['consumers', 'src']],
+            supports_check_mode=True
+        )
+
+    def prepare_item(self, item):
+        """Picks the known fields out of one consumer definition"""
+
+        return prepare_consumer(item, self.fields)
+
+    def from_row(self, row):
+        """Turns a CSV row into a consumer definition. Columns named
+        plugin.field, such as key-auth.key, make up the credentials."""
+
+        item = {}
+        credentials = {}
+        for column, value in row.items():
+            if column is None or value in [None, ""]:
+                continue
+            if "." in column:
+                plugin, field = column.split(".", 1)
+                credentials.setdefault(plugin, {})[field] = value
+            else:
+                item[column] = value
+
+        item["credentials"] = [dict(plugin=plugin, data=data) for plugin, data in sorted(credentials.items())]
+        return item
+
+    def open_items(self, path):
+        """Opens a file of consumer definitions as text, unzipping it if
+        its name ends in .gz"""
+
+        if not path.endswith(".gz"):
+            return open(path)
+        import gzip
+        source = gzip.open(path, "rb")
+        if sys.version_info[0] >= 3:
+            import io
+            return io.TextIOWrapper(source, encoding="utf-8")
+        return source
+
+    def read_items(self, path):
+        """Streams the consumer definitions from a CSV file, or from a file
+        with one JSON object per line, either gzipped if its name ends in
+        .gz (as kong_consumer exports them)"""
+
+        name = path[:-len(".gz")] if path.endswith(".gz") else path
+        with self.open_items(path) as source:
+            if name.endswith(".csv"):
+                for row in csv.DictReader(source):
+                    yield self.from_row(row)
+            else:
+                for number, line in enumerate(source, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError as error:
+                        raise ValueError("{} line {}: {}" . format (path, number, error))
+
+    def items(self, module):
+        """The consumers to converge. Each call reads them afresh, so a
+        file can be read more than once without holding it in memory."""
+
+        if module.params['src'] is not None:
+            items = self.read_items(module.params['src'])
+        else:
+            items = module.params['consumers']
+        return (self.prepare_item(item) for item in items)
+
+    def prepare_inputs(self, module):
+        url = module.params['kong_admin_uri']
+        auth_user = module.params['kong_admin_username']
+        auth_password = module.params['kong_admin_password']
+        purge = module.params['purge']
+
+        return (url, purge, auth_user, auth_password)
+
+    def validate(self, consumers):
+        """Returns an error message, or None if every item is usable"""
+
+        return validate_consumers(consumers)
+
+    def get_client(self, base_url, auth_user, auth_password, params):
+        """The client to send the calls with: the shared one, or with
+        engine asyncio, one of its own whose writes don't block"""
+
+        if params.get('engine') == "asyncio":
+            return AsyncKongClient(base_url, auth_user, auth_password, params.get('parallelism'), **client_options(params))
+        return get_client(base_url, auth_user, auth_password, **client_options(params))
+
+    def get_engine(self, params):
+        """The engine to run the writes with: a pool of threads, or with
+        engine asyncio, an event loop"""
+
+        if params.get('engine') == "asyncio":
+            return AsyncKongEngine(params.get('parallelism'))
+        return KongEngine(params.get('parallelism'))
+
+    def get_response(self, results):
+        """Only the consumers and credentials that changed or failed are
+        reported one by one; the rest are counted in the summary"""
+
+        return summarize(results)
+
+    def get_diff(self, results):
+        """Takes the diffs out of the results, so they are only sent
+        back when Ansible runs with --diff"""
+
+        return [result.pop('diff') for result in results if 'diff' in result]
+
+def run(helper, module):
+    """Does the module's work against one admin endpoint, for an
+    AnsibleModule or a KongTask. Returns the result to exit (or, if
+    failed, fail) with."""
+
+    base_url, purge, auth_user, auth_password = helper.prepare_inputs(module)
+
+    try:
+        error = helper.validate(helper.items(module))
+    except (IOError, ValueError) as failure:
+        error = str(failure)
+    if error is not None:
+        return dict(failed=True, msg=error)
+
+    if module.params.get('engine') == "asyncio" and not has_asyncio():
+        return dict(failed=True, msg="engine asyncio needs Python 3.6 or later")
+
+    client = helper.get_client(base_url, auth_user, auth_password, module.params)
+    api = KongConsumer(base_url, client=client)
+    engine = helper.get_engine(module.params)
+    try:
+        results = api.converge(helper.items(module), purge, engine, module.check_mode, module.params.get('credential_grace'))
+    except KongError as error:
+        return dict(failed=True, msg="Could not list the registered consumers: {}" . format (error))
+    finally:
+        if isinstance(client, AsyncKongClient):
+            client.close()
+
+    diff = helper.get_diff(results)
+    has_changed, failed, results, summary = helper.get_response(results)
+    if any(result['status_code'] in [401, 403] for result in failed):
+        return dict(failed=True, msg="Please check kong_admin_username and kong_admin_password", results=results, summary=summary)
+    elif getattr(engine, 'stopped', None) is not None:
+        return dict(failed=True, msg="Stopped after a call failed: {}" . format (engine.stopped['msg']), results=results, summary=summary)
+    elif failed:
+        return dict(failed=True, msg="Failed to converge {} consumers or credentials" . format (len(failed)), results=results, summary=summary)
+    elif module._diff:
+        return dict(changed=has_changed, results=results, summary=summary, diff=diff, **client.stats())
+    else:
+        return dict(changed=has_changed, results=results, summary=summary, **client.stats())
+
+def main():
+
+    helper = ModuleHelper(CONSUMER_FIELDS)
+
+    global module # might not need this
+    module = helper.get_module()
+    finish(module, fan_out(run, helper, module))
+
+if __name__ == '__main__':
+    main()
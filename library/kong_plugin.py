@@ -1,71 +1,43 @@
 #!/usr/bin/python
 
-import requests
-
-class KongPlugin:
-
-    def __init__(self, base_url, api_name, auth_username=None, auth_password=None):
-        self.base_url = "{}/apis/{}/plugins" . format(base_url, api_name)
-        if auth_username is not None and auth_password is not None:
-            self.auth = (auth_username, auth_password)
-        else:
-            self.auth = None
-        self.api = api_name
-
-    def list(self):
-        
-        return requests.get(self.base_url, auth=self.auth)
-
-    def _get_plugin_id(self, name, plugins_list):
-        """Scans the list of plugins for an ID. 
-        returns None if no matching name is found"""
-
-        for plugin in plugins_list:
-            if plugin.get("name") == name:
-                return plugin.get("id")
-
-        return None
-
-    def add_or_update(self, name, config=None):
-        
-        # does it exist already?
-        plugins_response = self.list()
-        plugins_list = plugins_response.json().get('data', [])
-
-        data = {
-            "name": name,
-        }
-        if config is not None:
-            data.update(config)   
-
-        plugin_id = self._get_plugin_id(name, plugins_list)
-        if plugin_id is None:            
-            return requests.post(self.base_url, data, auth=self.auth)
-        else:
-            url = "{}/{}" . format (self.base_url, plugin_id)
-            return requests.patch(url, data, auth=self.auth)
-
-    def delete(self, id):
-
-        url = "{}/{}" . format (self.base_url, id)
-        return requests.delete(url, auth=self.auth)
-
+try:
+    from ansible.module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from ansible.module_utils.kong_cluster import fan_out
+    from ansible.module_utils.kong_engine import check_response
+    from ansible.module_utils.kong_resources import KongPlugin, plan_entry
+    from ansible.module_utils.kong_result import response_meta, result_argument_spec
+    from ansible.module_utils.kong_task import finish
+except ImportError:
+    from module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from module_utils.kong_cluster import fan_out
+    from module_utils.kong_engine import check_response
+    from module_utils.kong_resources import KongPlugin, plan_entry
+    from module_utils.kong_result import response_meta, result_argument_spec
+    from module_utils.kong_task import finish
 
 class ModuleHelper:
     
-    def get_module(self):
+    def argument_spec(self):
 
         args = dict(
-            kong_admin_uri = dict(required=True, type='str'),
+            kong_admin_uri = dict(required=True, type='list'),
             kong_admin_username = dict(required=False, type='str'),
             kong_admin_password = dict(required=False, type='str'),
             api_name = dict(required=False, type='str'),
+            consumer = dict(required=False, type='str'),
             plugin_name = dict(required=False, type='str'),
             plugin_id = dict(required=False, type='str'),
             config = dict(required=False, type='dict'),
             state = dict(required=False, default="present", choices=['present', 'absent', 'list'], type='str'),    
         )
-        return AnsibleModule(argument_spec=args,supports_check_mode=False)
+        args.update(client_argument_spec())
+        args.update(result_argument_spec())
+        return args
+
+    def get_module(self):
+        from ansible.module_utils.basic import AnsibleModule
+
+        return AnsibleModule(argument_spec=self.argument_spec(),supports_check_mode=True)
 
     def prepare_inputs(self, module):
         url = module.params['kong_admin_uri']
@@ -83,53 +55,71 @@ class ModuleHelper:
     def get_response(self, response, state):
 
         if state == "present":
-            meta = json.dumps(response.content)
-            has_changed = response.status_code == 201
+            meta = response_meta(response)
+            has_changed = response.status_code in [200, 201]
             
         if state == "absent":
             meta = {}
             has_changed = response.status_code == 204
 
         if state == "list":
-            meta = response.json()
+            meta = response_meta(response)
             has_changed = False
 
         return (has_changed, meta)
 
     
-def main():
+def run(helper, module):
+    """Does the module's work for an AnsibleModule, or a KongTask when run
+    in process. Returns the result to exit (or, if failed, fail) with."""
 
     state_to_method = {
         "present": "add",
         "absent": "delete"
     }
-    helper = ModuleHelper()
-
-    global module # might not need this
-    module = helper.get_module()
     base_url, api_name, data, state, auth_user, auth_password = helper.prepare_inputs(module)
 
     method_to_call = state_to_method.get(state)
 
-    api = KongPlugin(base_url, api_name, auth_user, auth_password)
-    if state == "present":
-        response = api.add_or_update(**data)
-    if state == "absent":
-        response = api.delete(module.params['plugin_id'])
-    if state == "list":
-        response = api.list()
+    client = get_client(base_url, auth_user, auth_password, **client_options(module.params))
+    api = KongPlugin(base_url, api_name, client=client, consumer=module.params.get('consumer'))
+    try:
+        if module.check_mode and state == "present":
+            action, diff = api.plan(**data)
+            return dict(check_response(action, diff, module._diff), **client.stats())
+        if module.check_mode and state == "absent":
+            plugin_id = module.params['plugin_id']
+            current = api._load_index().get_by_id(plugin_id)
+            action, diff = plan_entry(plugin_id, current, {}, state)
+            return dict(check_response(action, diff, module._diff), **client.stats())
+        if state == "present":
+            response = api.add_or_update(**data)
+        if state == "absent":
+            response = api.delete(module.params['plugin_id'])
+        if state == "list":
+            plugins = list(api.iterate())
+            return dict(changed=False, meta=dict(data=plugins, total=len(plugins)), **client.stats())
+    except KongError as error:
+        response = error.response
 
     if response.status_code == 401:
-        module.fail_json(msg="Please specify kong_admin_username and kong_admin_password", meta=response.json())
+        return dict(failed=True, msg="Please specify kong_admin_username and kong_admin_password", meta=response.json())
     elif response.status_code == 403:
-        module.fail_json(msg="Please check kong_admin_username and kong_admin_password", meta=response.json())
+        return dict(failed=True, msg="Please check kong_admin_username and kong_admin_password", meta=response.json())
+    elif response.status_code >= 400 and not (response.status_code == 404 and state == "absent"):
+        return dict(failed=True, msg="Kong admin API returned {}" . format (response.status_code), meta=response_meta(response))
     else:
         has_changed, meta = helper.get_response(response, state)
-        module.exit_json(changed=has_changed, meta=meta)
+        return dict(changed=has_changed, meta=meta, **client.stats())
+
+def main():
 
+    helper = ModuleHelper()
+
+    global module # might not need this
+    module = helper.get_module()
+    finish(module, fan_out(run, helper, module))
 
-from ansible.module_utils.basic import *
-from ansible.module_utils.urls import *
 
 if __name__ == '__main__':
     main()        
\ No newline at end of file
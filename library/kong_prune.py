@@ -0,0 +1,168 @@
+#!/usr/bin/python
+
+DOCUMENTATION = '''
+---
+module: kong_prune
+short_description: Delete the Kong APIs, consumers or upstreams a selector picks, dependents first
+
+'''
+
+EXAMPLES = '''
+- name: See how much tearing down a test environment would delete
+  kong_prune:
+    kong_admin_uri: http://127.0.0.1:8001
+    resource: apis
+    name_prefix: "pr-1234-"
+  check_mode: yes
+
+- name: Tear it down, with its plugins
+  kong_prune:
+    kong_admin_uri: http://127.0.0.1:8001
+    resource: apis
+    name_prefix: "pr-1234-"
+    parallelism: 16
+    compact: yes
+
+- name: Delete every consumer that is not listed, with its credentials
+  kong_prune:
+    kong_admin_uri: http://127.0.0.1:8001
+    resource: consumers
+    keep:
+      - "joesoap"
+      - "1234"
+
+- name: Delete the tagged upstreams of load tests
+  kong_prune:
+    kong_admin_uri: http://127.0.0.1:8001
+    resource: upstreams
+    name_regex: "^load-[0-9]+\\\\."
+    tags:
+      - "load-test"
+
+'''
+
+import re
+
+try:
+    from ansible.module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from ansible.module_utils.kong_cluster import fan_out
+    from ansible.module_utils.kong_engine import KongEngine, engine_argument_spec, summarize
+    from ansible.module_utils.kong_resources import KongAPI, KongConsumer, KongUpstream, Selector
+    from ansible.module_utils.kong_result import result_argument_spec
+    from ansible.module_utils.kong_task import finish
+except ImportError:
+    from module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from module_utils.kong_cluster import fan_out
+    from module_utils.kong_engine import KongEngine, engine_argument_spec, summarize
+    from module_utils.kong_resources import KongAPI, KongConsumer, KongUpstream, Selector
+    from module_utils.kong_result import result_argument_spec
+    from module_utils.kong_task import finish
+
+RESOURCES = ['apis', 'consumers', 'upstreams']
+
+class ModuleHelper:
+
+    def get_module(self):
+        from ansible.module_utils.basic import AnsibleModule
+
+        args = dict(
+            kong_admin_uri = dict(required=True, type='list'),
+            kong_admin_username = dict(required=False, type='str'),
+            kong_admin_password = dict(required=False, type='str'),
+            resource = dict(required=True, choices=RESOURCES, type='str'),
+            name_prefix = dict(required=False, type='str'),
+            name_regex = dict(required=False, type='str'),
+            tags = dict(required=False, type='list'),
+            keep = dict(required=False, type='list'),
+            credentials = dict(required=False, type='list'),
+        )
+        args.update(client_argument_spec())
+        args.update(result_argument_spec())
+        args.update(engine_argument_spec())
+        return AnsibleModule(argument_spec=args,supports_check_mode=True)
+
+    def prepare_inputs(self, module):
+        url = module.params['kong_admin_uri']
+        auth_user = module.params['kong_admin_username']
+        auth_password = module.params['kong_admin_password']
+        resource = module.params['resource']
+
+        return (url, resource, auth_user, auth_password)
+
+    def get_selector(self, params):
+        """The Selector for the module's params. Raises ValueError if
+        none is given or name_regex doesn't compile."""
+
+        try:
+            selector = Selector(params.get('name_prefix'), params.get('name_regex'), params.get('tags'), params.get('keep'))
+        except re.error as error:
+            raise ValueError("name_regex is not a valid regular expression: {}" . format (error))
+        if not selector.given:
+            raise ValueError("Please give at least one of name_prefix, name_regex, tags or keep, or keep: [] to delete everything")
+        return selector
+
+    def get_matched(self, results):
+        """The number of entries of each kind that were (or in check mode,
+        would be) deleted"""
+
+        matched = {}
+        for result in results:
+            matched[result['kind']] = matched.get(result['kind'], 0) + 1
+        return matched
+
+    def get_diff(self, results):
+        """Takes the diffs out of the results, so they are only sent
+        back when Ansible runs with --diff"""
+
+        return [result.pop('diff') for result in results if 'diff' in result]
+
+def prune(client, base_url, resource, selector, params, engine, check_mode=False):
+    """Deletes what `selector` picks among `resource`, dependents first"""
+
+    if resource == "apis":
+        return KongAPI(base_url, client=client).prune(selector, engine, check_mode)
+    if resource == "consumers":
+        return KongConsumer(base_url, client=client).prune(selector, params.get('credentials'), engine, check_mode)
+    return KongUpstream(base_url, client=client).prune(selector, engine, check_mode)
+
+def run(helper, module):
+    """Does the module's work against one admin endpoint, for an
+    AnsibleModule or a KongTask. Returns the result to exit (or, if
+    failed, fail) with."""
+
+    base_url, resource, auth_user, auth_password = helper.prepare_inputs(module)
+
+    try:
+        selector = helper.get_selector(module.params)
+    except ValueError as error:
+        return dict(failed=True, msg=str(error))
+
+    client = get_client(base_url, auth_user, auth_password, **client_options(module.params))
+    engine = KongEngine(module.params.get('parallelism'))
+    try:
+        results = prune(client, base_url, resource, selector, module.params, engine, module.check_mode)
+    except KongError as error:
+        return dict(failed=True, msg="Could not list the {} to prune: {}" . format (resource, error))
+
+    diff = helper.get_diff(results)
+    matched = helper.get_matched(results)
+    has_changed, failed, results, summary = summarize(results)
+    if any(result['status_code'] in [401, 403] for result in failed):
+        return dict(failed=True, msg="Please check kong_admin_username and kong_admin_password", results=results, summary=summary)
+    elif failed:
+        return dict(failed=True, msg="Failed to delete {} of {} entries" . format (len(failed), sum(matched.values())), results=results, matched=matched, summary=summary)
+    elif module._diff:
+        return dict(changed=has_changed, results=results, matched=matched, summary=summary, diff=diff, **client.stats())
+    else:
+        return dict(changed=has_changed, results=results, matched=matched, summary=summary, **client.stats())
+
+def main():
+
+    helper = ModuleHelper()
+
+    global module # might not need this
+    module = helper.get_module()
+    finish(module, fan_out(run, helper, module))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/python
+
+DOCUMENTATION = '''
+---
+module: kong_rotate
+short_description: Move the traffic of many Kong upstreams to new targets, without downtime
+
+'''
+
+EXAMPLES = '''
+- name: Roll every service over to the new hosts
+  kong_rotate:
+    kong_admin_uri: http://127.0.0.1:8001
+    upstreams:
+      - "orders.service"
+      - "billing.service"
+    targets:
+      - "10.0.1.1:8080"
+      - "10.0.1.2:8080"
+    timeout: 120
+    drain_time: 10
+    parallelism: 16
+
+- name: Rotate the upstreams of APIs, each to its own targets
+  kong_rotate:
+    kong_admin_uri: http://127.0.0.1:8001
+    apis:
+      - "orders"
+      - name: "billing"
+        targets:
+          - target: "10.0.2.1:8080"
+            weight: 50
+
+'''
+
+import time
+
+try:
+    from ansible.module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from ansible.module_utils.kong_cluster import fan_out
+    from ansible.module_utils.kong_engine import KongEngine, engine_argument_spec, result, summarize
+    from ansible.module_utils.kong_resources import (KongAPI, KongTarget, TargetRotation, api_upstream, prepare_target, validate_targets,
+                                                     DEFAULT_ROTATION_TIMEOUT, DEFAULT_ROTATION_INTERVAL)
+    from ansible.module_utils.kong_result import result_argument_spec
+    from ansible.module_utils.kong_task import finish
+except ImportError:
+    from module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from module_utils.kong_cluster import fan_out
+    from module_utils.kong_engine import KongEngine, engine_argument_spec, result, summarize
+    from module_utils.kong_resources import (KongAPI, KongTarget, TargetRotation, api_upstream, prepare_target, validate_targets,
+                                             DEFAULT_ROTATION_TIMEOUT, DEFAULT_ROTATION_INTERVAL)
+    from module_utils.kong_result import result_argument_spec
+    from module_utils.kong_task import finish
+
+class ModuleHelper:
+
+    def get_module(self):
+        from ansible.module_utils.basic import AnsibleModule
+
+        args = dict(
+            kong_admin_uri = dict(required=True, type='list'),
+            kong_admin_username = dict(required=False, type='str'),
+            kong_admin_password = dict(required=False, type='str'),
+            upstreams = dict(required=False, default=[], type='list'),
+            apis = dict(required=False, default=[], type='list'),
+            targets = dict(required=False, type='list'),
+            timeout = dict(required=False, default=DEFAULT_ROTATION_TIMEOUT, type='int'),
+            interval = dict(required=False, default=DEFAULT_ROTATION_INTERVAL, type='float'),
+            drain_time = dict(required=False, default=0, type='int'),
+        )
+        args.update(client_argument_spec())
+        args.update(result_argument_spec())
+        args.update(engine_argument_spec())
+        return AnsibleModule(argument_spec=args,supports_check_mode=True)
+
+    def prepare_inputs(self, module):
+        url = module.params['kong_admin_uri']
+        auth_user = module.params['kong_admin_username']
+        auth_password = module.params['kong_admin_password']
+        upstreams = [self.prepare_item(item, module.params['targets']) for item in module.params['upstreams'] or []]
+        apis = [self.prepare_item(item, module.params['targets']) for item in module.params['apis'] or []]
+
+        return (url, upstreams, apis, auth_user, auth_password)
+
+    def prepare_item(self, item, targets):
+        """Turns an upstream or API, a name or a dict of name and targets,
+        into a dict of both. Items without targets get `targets`."""
+
+        if not isinstance(item, dict):
+            item = dict(name=item)
+        targets = item.get("targets") or targets or []
+        return dict(name=item.get("name"), targets=[prepare_target(target) for target in targets])
+
+    def validate(self, upstreams, apis):
+        """Returns an error message, or None if every item is usable"""
+
+        if not upstreams and not apis:
+            return "Please give the upstreams or apis to rotate"
+        for item in upstreams + apis:
+            if not item["name"]:
+                return "Every upstream and API needs a name"
+            if not any(target["weight"] for target in item["targets"]):
+                return "{} needs targets to rotate to" . format (item["name"])
+            if any(target["state"] != "present" for target in item["targets"]):
+                return "The targets of {} can't have a state, they are rotated to" . format (item["name"])
+            error = validate_targets(item["targets"])
+            if error is not None:
+                return error
+        return None
+
+    def resolve(self, apis, upstreams, client, base_url):
+        """Adds the upstreams of `apis` to `upstreams`, from one listing of
+        the APIs. Returns them, one per upstream, with a failed result for
+        each API that can't be rotated."""
+
+        failed = []
+        by_name = dict((item["name"], item) for item in upstreams)
+        if apis:
+            index = KongAPI(base_url, client=client)._load_index()
+            for item in apis:
+                api = index.get(item["name"])
+                upstream = api_upstream(api) if api is not None else None
+                if upstream is None:
+                    failed.append(result(item["name"], "rotate", msg="No API called {}" . format (item["name"])))
+                elif upstream in by_name and by_name[upstream]["targets"] != item["targets"]:
+                    failed.append(result(item["name"], "rotate", msg="Upstream {} is given other targets too" . format (upstream)))
+                else:
+                    by_name[upstream] = dict(item, name=upstream)
+        return [by_name[name] for name in sorted(by_name)], failed
+
+def run(helper, module):
+    """Does the module's work against one admin endpoint, for an
+    AnsibleModule or a KongTask. Returns the result to exit (or, if
+    failed, fail) with."""
+
+    base_url, upstreams, apis, auth_user, auth_password = helper.prepare_inputs(module)
+
+    error = helper.validate(upstreams, apis)
+    if error is not None:
+        return dict(failed=True, msg=error)
+
+    started = time.time()
+    client = get_client(base_url, auth_user, auth_password, **client_options(module.params))
+    try:
+        upstreams, failed = helper.resolve(apis, upstreams, client, base_url)
+    except KongError as error:
+        return dict(failed=True, msg="Could not list the APIs: {}" . format (error))
+
+    def progress(upstream, phase, seconds):
+        module.log("kong_rotate: {} {} {} done in {}s" . format (base_url, upstream, phase, seconds))
+
+    rotations = [
+        TargetRotation(KongTarget(base_url, item["name"], client=client), item["targets"], module.params['timeout'],
+                       module.params['interval'], module.params['drain_time'], progress)
+        for item in upstreams
+    ]
+    engine = KongEngine(module.params['parallelism'])
+    results = failed + engine.run([rotations], module.check_mode)
+    has_changed, failed, _, summary = summarize(results)
+
+    diff = [outcome.pop('diff') for outcome in results if 'diff' in outcome]
+    elapsed = round(time.time() - started, 3)
+    if any(outcome['status_code'] in [401, 403] for outcome in failed):
+        return dict(failed=True, msg="Please check kong_admin_username and kong_admin_password", results=results)
+    elif failed:
+        return dict(failed=True, msg="Failed to rotate {} upstreams" . format (len(failed)), results=results, summary=summary, elapsed=elapsed)
+    elif module._diff:
+        return dict(changed=has_changed, results=results, summary=summary, elapsed=elapsed, diff=diff, **client.stats())
+    else:
+        return dict(changed=has_changed, results=results, summary=summary, elapsed=elapsed, **client.stats())
+
+def main():
+
+    helper = ModuleHelper()
+
+    global module # might not need this
+    module = helper.get_module()
+    finish(module, fan_out(run, helper, module))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/python
+
+DOCUMENTATION = '''
+---
+module: kong_state
+short_description: Apply or export the whole configuration of a Kong gateway
+
+'''
+
+EXAMPLES = '''
+- name: Apply the gateway configuration
+  kong_state:
+    kong_admin_uri: http://127.0.0.1:8001
+    config:
+      apis:
+        - name: "Mockbin"
+          upstream_url: "http://mockbin.com"
+          request_host: "mockbin.com"
+          plugins:
+            - name: "key-auth"
+      consumers:
+        - username: "joesoap"
+          credentials:
+            - plugin: "key-auth"
+              data:
+                key: "abc123"
+      plugins:
+        - name: "key-auth"
+        - name: "rate-limiting"
+          consumer: "joesoap"
+          config:
+            config.minute: 100
+    prune: yes
+    parallelism: 8
+
+- name: Export the gateway configuration to a file
+  kong_state:
+    kong_admin_uri: http://127.0.0.1:8001
+    state: export
+    dest: /srv/kong/gateway.json
+
+- name: Apply an exported configuration to another gateway
+  kong_state:
+    kong_admin_uri: http://127.0.0.2:8001
+    config: "{{ lookup('file', '/srv/kong/gateway.json') | from_json }}"
+
+'''
+
+import json, os, tempfile
+
+try:
+    from ansible.module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from ansible.module_utils.kong_cluster import admin_endpoints, fan_out
+    from ansible.module_utils.kong_engine import KongEngine, engine_argument_spec, summarize
+    from ansible.module_utils.kong_resources import KongAPI, KongConsumer, KongSharedPlugins, CREDENTIAL_PLUGINS, prepare_api, prepare_consumer, prepare_plugin, validate_apis, validate_consumers, validate_plugins
+    from ansible.module_utils.kong_result import result_argument_spec
+    from ansible.module_utils.kong_task import finish
+except ImportError:
+    from module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from module_utils.kong_cluster import admin_endpoints, fan_out
+    from module_utils.kong_engine import KongEngine, engine_argument_spec, summarize
+    from module_utils.kong_resources import KongAPI, KongConsumer, KongSharedPlugins, CREDENTIAL_PLUGINS, prepare_api, prepare_consumer, prepare_plugin, validate_apis, validate_consumers, validate_plugins
+    from module_utils.kong_result import result_argument_spec
+    from module_utils.kong_task import finish
+
+SECTIONS = ['apis', 'consumers', 'plugins']
+
+class ModuleHelper:
+
+    def get_module(self):
+        from ansible.module_utils.basic import AnsibleModule
+
+        args = dict(
+            kong_admin_uri = dict(required=True, type='list'),
+            kong_admin_username = dict(required=False, type='str'),
+            kong_admin_password = dict(required=False, type='str'),
+            state = dict(required=False, default="apply", choices=['apply', 'export'], type='str'),
+            config = dict(required=False, type='dict'),
+            prune = dict(required=False, default=False, type='bool'),
+            dest = dict(required=False, type='path'),
+        )
+        args.update(client_argument_spec())
+        args.update(result_argument_spec())
+        args.update(engine_argument_spec())
+        return AnsibleModule(
+            argument_spec=args,
+            required_if=[['state', 'apply', ['config']]],
+            supports_check_mode=True
+        )
+
+    def prepare_config(self, config):
+        """Picks the known fields out of the desired-state document. A
+        section that is left out is not managed, and is never pruned."""
+
+        document = {}
+        if config.get("apis") is not None:
+            document["apis"] = [prepare_api(item) for item in config["apis"]]
+        if config.get("consumers") is not None:
+            document["consumers"] = [prepare_consumer(item) for item in config["consumers"]]
+        if config.get("plugins") is not None:
+            document["plugins"] = [prepare_plugin(item) for item in config["plugins"]]
+        return document
+
+    def prepare_inputs(self, module):
+        url = module.params['kong_admin_uri']
+        auth_user = module.params['kong_admin_username']
+        auth_password = module.params['kong_admin_password']
+        state = module.params['state']
+        document = self.prepare_config(module.params['config'] or {})
+
+        return (url, document, state, auth_user, auth_password)
+
+    def validate(self, document):
+        """Returns an error message, or None if the document is usable"""
+
+        return (validate_apis(document.get("apis", [])) or validate_consumers(document.get("consumers", []))
+                or validate_plugins(document.get("plugins", [])))
+
+    def get_diff(self, results):
+        """Takes the diffs out of the results, so they are only sent
+        back when Ansible runs with --diff"""
+
+        return [result.pop('diff') for result in results if 'diff' in result]
+
+    def write(self, module, dest, document):
+        """Writes the exported document to dest, unless it already holds
+        the same. Returns whether the file changed."""
+
+        content = json.dumps(document, indent=2, sort_keys=True)
+        if os.path.exists(dest):
+            with open(dest) as current:
+                if current.read() == content:
+                    return False
+        if not module.check_mode:
+            handle, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dest)))
+            with os.fdopen(handle, "w") as output:
+                output.write(content)
+            module.atomic_move(temporary, dest)
+        return True
+
+def credential_plugins(apis, plugins=()):
+    """The credential paths of the auth plugins in use on any of `apis`,
+    or among `plugins`, the global and consumer plugins"""
+
+    paths = set()
+    for plugin in [plugin for api in apis for plugin in api.get("plugins", [])] + list(plugins):
+        if plugin.get("name") in CREDENTIAL_PLUGINS:
+            paths.add(CREDENTIAL_PLUGINS[plugin.get("name")])
+    return sorted(paths)
+
+def apply(apis, consumers, document, prune=False, engine=None, check_mode=False):
+    """Converges every section of `document`: APIs and their plugins
+    first, then consumers and their credentials, then the global and
+    consumer plugins. Each result is tagged with the section it belongs
+    to."""
+
+    results = []
+    for section, backend in [("apis", apis), ("consumers", consumers), ("plugins", KongSharedPlugins(apis, consumers))]:
+        if section not in document:
+            continue
+        for outcome in backend.converge(document[section], prune, engine, check_mode):
+            outcome['section'] = section
+            results.append(outcome)
+    return results
+
+def export(apis, consumers):
+    """The live configuration, in the form apply takes, from one listing
+    of each collection. Consumers are exported with their credentials
+    for the auth plugins in use, on an API or globally."""
+
+    plugins = list(apis.client.iterate("{}/plugins" . format (apis.base_url)))
+    exported = apis.export(plugins)
+    shared = KongSharedPlugins(apis, consumers).export(plugins)
+    return dict(apis=exported, consumers=consumers.export(credential_plugins(exported, shared)), plugins=shared)
+
+def run(helper, module):
+    """Does the module's work against one admin endpoint, for an
+    AnsibleModule or a KongTask. Returns the result to exit (or, if
+    failed, fail) with."""
+
+    base_url, document, state, auth_user, auth_password = helper.prepare_inputs(module)
+
+    error = helper.validate(document)
+    if error is not None:
+        return dict(failed=True, msg=error)
+
+    client = get_client(base_url, auth_user, auth_password, **client_options(module.params))
+    apis = KongAPI(base_url, client=client)
+    consumers = KongConsumer(base_url, client=client)
+
+    if state == "export":
+        try:
+            exported = export(apis, consumers)
+        except KongError as error:
+            return dict(failed=True, msg="Could not read the gateway configuration: {}" . format (error))
+        total = dict((section, len(exported[section])) for section in SECTIONS)
+        dest = module.params['dest']
+        if dest is None:
+            return dict(changed=False, config=exported, total=total, **client.stats())
+        has_changed = helper.write(module, dest, exported)
+        return dict(changed=has_changed, dest=dest, total=total, **client.stats())
+
+    engine = KongEngine(module.params['parallelism'])
+    try:
+        results = apply(apis, consumers, document, module.params['prune'], engine, module.check_mode)
+    except KongError as error:
+        return dict(failed=True, msg="Could not read the gateway configuration: {}" . format (error))
+
+    diff = helper.get_diff(results)
+    has_changed, failed, results, summary = summarize(results)
+    if any(result['status_code'] in [401, 403] for result in failed):
+        return dict(failed=True, msg="Please check kong_admin_username and kong_admin_password", results=results, summary=summary)
+    elif failed:
+        return dict(failed=True, msg="Failed to apply {} changes" . format (len(failed)), results=results, summary=summary)
+    elif module._diff:
+        return dict(changed=has_changed, results=results, summary=summary, diff=diff, **client.stats())
+    else:
+        return dict(changed=has_changed, results=results, summary=summary, **client.stats())
+
+def main():
+
+    helper = ModuleHelper()
+
+    global module # might not need this
+    module = helper.get_module()
+    if module.params.get('state') == "export" and len(admin_endpoints(module.params.get('kong_admin_uri'))) > 1:
+        module.fail_json(msg="Export reads one gateway, please give a single kong_admin_uri")
+    finish(module, fan_out(run, helper, module))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+
+DOCUMENTATION = '''
+---
+module: kong_target
+short_description: Converge the weighted targets of a Kong upstream in one task
+
+'''
+
+EXAMPLES = '''
+- name: Balance over three hosts, with less traffic to the canary
+  kong_target:
+    kong_admin_uri: http://127.0.0.1:8001
+    upstream: "mockbin.service"
+    targets:
+      - "10.0.0.1:8080"
+      - "10.0.0.2:8080"
+      - target: "10.0.0.3:8080"
+        weight: 10
+
+- name: Drain a host before taking it down, then remove it
+  kong_target:
+    kong_admin_uri: http://127.0.0.1:8001
+    upstream: "mockbin.service"
+    targets:
+      - target: "10.0.0.1:8080"
+        state: drained
+
+- name: Remove every other target
+  kong_target:
+    kong_admin_uri: http://127.0.0.1:8001
+    upstream: "mockbin.service"
+    targets:
+      - "10.0.0.2:8080"
+      - "10.0.0.3:8080"
+    purge: yes
+
+'''
+
+try:
+    from ansible.module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from ansible.module_utils.kong_cluster import fan_out
+    from ansible.module_utils.kong_engine import KongEngine, engine_argument_spec, summarize
+    from ansible.module_utils.kong_resources import KongTarget, prepare_target, validate_targets
+    from ansible.module_utils.kong_result import result_argument_spec
+    from ansible.module_utils.kong_task import finish
+except ImportError:
+    from module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from module_utils.kong_cluster import fan_out
+    from module_utils.kong_engine import KongEngine, engine_argument_spec, summarize
+    from module_utils.kong_resources import KongTarget, prepare_target, validate_targets
+    from module_utils.kong_result import result_argument_spec
+    from module_utils.kong_task import finish
+
+class ModuleHelper:
+
+    def get_module(self):
+        from ansible.module_utils.basic import AnsibleModule
+
+        args = dict(
+            kong_admin_uri = dict(required=True, type='list'),
+            kong_admin_username = dict(required=False, type='str'),
+            kong_admin_password = dict(required=False, type='str'),
+            upstream = dict(required=True, type='str'),
+            targets = dict(required=True, type='list'),
+            purge = dict(required=False, default=False, type='bool'),
+        )
+        args.update(client_argument_spec())
+        args.update(result_argument_spec())
+        args.update(engine_argument_spec())
+        return AnsibleModule(argument_spec=args,supports_check_mode=True)
+
+    def prepare_inputs(self, module):
+        url = module.params['kong_admin_uri']
+        auth_user = module.params['kong_admin_username']
+        auth_password = module.params['kong_admin_password']
+        upstream = module.params['upstream']
+        purge = module.params['purge']
+        targets = [prepare_target(item) for item in module.params['targets']]
+
+        return (url, upstream, targets, purge, auth_user, auth_password)
+
+    def validate(self, targets):
+        """Returns an error message, or None if every item is usable"""
+
+        return validate_targets(targets)
+
+    def get_response(self, results):
+        """Whether anything changed, the failures, every result, and a
+        count of the results per action"""
+
+        has_changed, failed, _, summary = summarize(results)
+        return (has_changed, failed, results, summary)
+
+    def get_diff(self, results):
+        """Takes the diffs out of the results, so they are only sent
+        back when Ansible runs with --diff"""
+
+        return [result.pop('diff') for result in results if 'diff' in result]
+
+def run(helper, module):
+    """Does the module's work against one admin endpoint, for an
+    AnsibleModule or a KongTask. Returns the result to exit (or, if
+    failed, fail) with."""
+
+    base_url, upstream, targets, purge, auth_user, auth_password = helper.prepare_inputs(module)
+
+    error = helper.validate(targets)
+    if error is not None:
+        return dict(failed=True, msg=error)
+
+    client = get_client(base_url, auth_user, auth_password, **client_options(module.params))
+    target = KongTarget(base_url, upstream, client=client)
+    engine = KongEngine(module.params['parallelism'])
+    try:
+        has_changed, failed, results, summary = helper.get_response(target.converge(targets, purge, engine, module.check_mode))
+    except KongError as error:
+        return dict(failed=True, msg="Could not list the targets of upstream {}: {}" . format (upstream, error))
+
+    diff = helper.get_diff(results)
+    if any(result['status_code'] in [401, 403] for result in failed):
+        return dict(failed=True, msg="Please check kong_admin_username and kong_admin_password", results=results, summary=summary)
+    elif failed:
+        return dict(failed=True, msg="Failed to converge {} targets" . format (len(failed)), results=results, summary=summary)
+    elif module._diff:
+        return dict(changed=has_changed, results=results, summary=summary, diff=diff, **client.stats())
+    else:
+        return dict(changed=has_changed, results=results, summary=summary, **client.stats())
+
+def main():
+
+    helper = ModuleHelper()
+
+    global module # might not need this
+    module = helper.get_module()
+    finish(module, fan_out(run, helper, module))
+
+if __name__ == '__main__':
+    main()
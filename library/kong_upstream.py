@@ -0,0 +1,146 @@
+#!/usr/bin/python
+
+DOCUMENTATION = '''
+---
+module: kong_upstream
+short_description: Configure a Kong upstream, for Kong to balance an API's requests over its targets
+
+'''
+
+EXAMPLES = '''
+- name: Register an upstream with active health checks
+  kong_upstream:
+    kong_admin_uri: http://127.0.0.1:8001
+    name: "mockbin.service"
+    slots: 1000
+    healthchecks:
+      active:
+        http_path: "/status"
+        healthy:
+          interval: 5
+        unhealthy:
+          interval: 5
+          http_failures: 2
+
+- name: Point an API at it
+  kong_api:
+    kong_admin_uri: http://127.0.0.1:8001
+    name: "mockbin"
+    upstream_url: "http://mockbin.service"
+
+- name: Delete an upstream
+  kong_upstream:
+    kong_admin_uri: http://127.0.0.1:8001
+    name: "mockbin.service"
+    state: absent
+
+'''
+
+try:
+    from ansible.module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from ansible.module_utils.kong_cluster import fan_out
+    from ansible.module_utils.kong_engine import check_response
+    from ansible.module_utils.kong_resources import KongUpstream
+    from ansible.module_utils.kong_result import response_meta, result_argument_spec
+    from ansible.module_utils.kong_task import finish
+except ImportError:
+    from module_utils.kong_client import get_client, client_argument_spec, client_options, KongError
+    from module_utils.kong_cluster import fan_out
+    from module_utils.kong_engine import check_response
+    from module_utils.kong_resources import KongUpstream
+    from module_utils.kong_result import response_meta, result_argument_spec
+    from module_utils.kong_task import finish
+
+class ModuleHelper:
+
+    def argument_spec(self):
+
+        args = dict(
+            kong_admin_uri = dict(required=True, type='list'),
+            kong_admin_username = dict(required=False, type='str'),
+            kong_admin_password = dict(required=False, type='str'),
+            name = dict(required=False, type='str'),
+            slots = dict(required=False, type='int'),
+            healthchecks = dict(required=False, type='dict'),
+            state = dict(required=False, default="present", choices=['present', 'absent', 'list'], type='str'),
+        )
+        args.update(client_argument_spec())
+        args.update(result_argument_spec())
+        return args
+
+    def get_module(self):
+        from ansible.module_utils.basic import AnsibleModule
+
+        return AnsibleModule(argument_spec=self.argument_spec(),supports_check_mode=True)
+
+    def prepare_inputs(self, module):
+        url = module.params['kong_admin_uri']
+        auth_user = module.params['kong_admin_username']
+        auth_password = module.params['kong_admin_password']
+        state = module.params['state']
+        data = {}
+
+        for field in ['name', 'slots', 'healthchecks']:
+            value = module.params.get(field, None)
+            if value is not None:
+                data[field] = value
+
+        return (url, data, state, auth_user, auth_password)
+
+    def get_response(self, response, state):
+
+        if state == "present":
+            meta = response_meta(response)
+            has_changed = response.status_code in [201, 200]
+
+        if state == "absent":
+            meta = {}
+            has_changed = response.status_code == 204
+
+        return (has_changed, meta)
+
+def run(helper, module):
+    """Does the module's work for an AnsibleModule, or a KongTask when run
+    in process. Returns the result to exit (or, if failed, fail) with."""
+
+    base_url, data, state, auth_user, auth_password = helper.prepare_inputs(module)
+
+    if state != "list" and data.get("name") is None:
+        return dict(failed=True, msg="name is required unless state is list")
+
+    client = get_client(base_url, auth_user, auth_password, **client_options(module.params))
+    upstream = KongUpstream(base_url, client=client)
+    try:
+        if module.check_mode and state in ["present", "absent"]:
+            action, diff = upstream.plan(state=state, **data)
+            return dict(check_response(action, diff, module._diff), **client.stats())
+        if state == "present":
+            response = upstream.add_or_update(**data)
+        if state == "absent":
+            response = upstream.delete_by_name(data.get("name"))
+        if state == "list":
+            upstreams = list(upstream.iterate())
+            return dict(changed=False, meta=dict(data=upstreams, total=len(upstreams)), **client.stats())
+    except KongError as error:
+        response = error.response
+
+    if response.status_code == 401:
+        return dict(failed=True, msg="Please specify kong_admin_username and kong_admin_password", meta=response.json())
+    elif response.status_code == 403:
+        return dict(failed=True, msg="Please check kong_admin_username and kong_admin_password", meta=response.json())
+    elif response.status_code >= 400 and response.status_code != 404:
+        return dict(failed=True, msg="Kong admin API returned {}" . format (response.status_code), meta=response.json())
+    else:
+        has_changed, meta = helper.get_response(response, state)
+        return dict(changed=has_changed, meta=meta, **client.stats())
+
+def main():
+
+    helper = ModuleHelper()
+
+    global module # might not need this
+    module = helper.get_module()
+    finish(module, fan_out(run, helper, module))
+
+if __name__ == '__main__':
+    main()
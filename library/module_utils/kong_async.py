@@ -0,0 +1,568 @@
+"""An asyncio client for the Kong admin API, for bulk runs that need
+hundreds of requests in flight, more than a pool of threads handles
+well, and the engine that schedules their writes.
+
+AsyncKongClient is a KongClient whose requests go over asyncio streams,
+HTTP/1.1 with keep-alive, at most `parallelism` at a time. KongAPI,
+KongPlugin and KongConsumer work over it as they are: their listings,
+pagination and lookups wait for their responses, and their writes
+(add, update, delete) return futures. AsyncKongEngine runs the writes
+those classes plan, as KongEngine does, without a thread per call.
+
+The module is written without async syntax, so that Ansible can package
+the modules that import it for any Python: the client's coroutines are
+generators run by start(). It only runs where asyncio is available
+(Python 3.6 or later), and asyncio is only imported once a client or an
+engine is made."""
+
+import base64, ssl, sys, threading, types
+
+try:
+    from ansible.module_utils.six.moves.urllib.parse import urlparse, quote
+    from ansible.module_utils.kong_client import (KongClient, KongResponse, entry_response, body_size, form_encode,
+                                                  IDEMPOTENT_METHODS, RETRY_STATUSES)
+    from ansible.module_utils.kong_engine import DEFAULT_PARALLELISM, preview
+    from ansible.module_utils.kong_metrics import clock
+except ImportError:
+    from six.moves.urllib.parse import urlparse, quote
+    from .kong_client import (KongClient, KongResponse, entry_response, body_size, form_encode,
+                              IDEMPOTENT_METHODS, RETRY_STATUSES)
+    from .kong_engine import DEFAULT_PARALLELISM, preview
+    from .kong_metrics import clock
+
+# Responses that mean every other call will fail the same way
+FATAL_STATUSES = (401, 403)
+
+
+class ProtocolError(Exception):
+    """Raised when the admin endpoint answers with something that isn't HTTP"""
+
+
+class StaleConnection(Exception):
+    """Raised when a kept-alive connection turns out to have been closed
+    by the server while it was idle"""
+
+
+class Return(Exception):
+    """Raised by the steps of a task to finish with `value`, as Python 2
+    can't compile a generator that returns one"""
+
+    def __init__(self, value=None):
+        Exception.__init__(self)
+        self.value = value
+
+
+def has_asyncio():
+    if sys.version_info < (3, 6):
+        return False
+    try:
+        import asyncio
+    except ImportError:
+        return False
+    return True
+
+
+def client_errors():
+    """The errors of a request that mean Kong couldn't be reached or
+    didn't answer: they are retried, and stop an AsyncKongEngine"""
+
+    import asyncio
+    return (IOError, OSError, EOFError, asyncio.TimeoutError, ProtocolError)
+
+
+def start(loop, steps):
+    """Runs `steps`, a generator, as a task on `loop`, and returns a
+    future of the value it raises Return with. Each future, coroutine or
+    generator it yields is awaited, and its result sent back in, or its
+    error raised at the yield.
+
+    Cancelling the future cancels what the steps wait for, and raises
+    CancelledError at the yield, so that their finally clauses run."""
+
+    import asyncio
+
+    task = loop.create_future()
+    waiting = []
+
+    def step(value=None, error=None):
+        try:
+            awaited = steps.throw(error) if error is not None else steps.send(value)
+        except Return as returned:
+            settle(returned.value)
+            return
+        except StopIteration:
+            settle(None)
+            return
+        except asyncio.CancelledError:
+            task.cancel()
+            return
+        except Exception as failure:
+            if not task.done():
+                task.set_exception(failure)
+            return
+
+        if isinstance(awaited, types.GeneratorType):
+            awaited = start(loop, awaited)
+        elif not asyncio.isfuture(awaited):
+            awaited = loop.create_task(awaited)
+        waiting.append(awaited)
+        awaited.add_done_callback(resume)
+        if task.cancelled():
+            awaited.cancel()
+
+    def settle(value):
+        if not task.done():
+            task.set_result(value)
+
+    def resume(awaited):
+        waiting.remove(awaited)
+        if awaited.cancelled():
+            step(error=asyncio.CancelledError())
+        elif awaited.exception() is not None:
+            step(error=awaited.exception())
+        else:
+            step(awaited.result())
+
+    def stop(task):
+        if task.cancelled():
+            for awaited in waiting:
+                awaited.cancel()
+
+    task.add_done_callback(stop)
+    loop.call_soon(step)
+    return task
+
+
+class LoopSession:
+    """The session of an AsyncKongClient, for the requests KongClient
+    sends and waits for: listings, lookups and rechecks"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def request(self, method, url, data=None, params=None, timeout=None):
+        client = self.client
+        return client.wait(lambda: start(client.loop, client._exchange(method, url, data, params)))
+
+    def close(self):
+        self.client.close_connections()
+
+
+class AsyncKongClient(KongClient):
+    """A KongClient that sends its requests from an asyncio event loop of
+    its own, over kept-alive connections. A semaphore holds the requests
+    in flight to `parallelism`, and no more connections than that are
+    ever open; one that the server closed while it was idle is replaced
+    without counting as a retry. The other options are KongClient's, and
+    so are the retries, rate limit, cache and metrics, except for
+    `pool_size` and `transport`, which the client's own connections
+    replace.
+
+    The requests of KongClient (get, iterate and the others) wait for
+    their response, running the loop until it comes; write() doesn't,
+    and returns a future. The loop is run by the thread that made the
+    client. A request waited for from another thread, such as the recheck
+    of a POST, is handed to the loop while that thread runs it."""
+
+    def __init__(self, base_url, auth_username=None, auth_password=None, parallelism=DEFAULT_PARALLELISM, **options):
+        KongClient.__init__(self, base_url, auth_username, auth_password, **options)
+        parsed = urlparse(base_url)
+        self.secure = parsed.scheme == "https"
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if self.secure else 80)
+        self.netloc = parsed.netloc.rpartition("@")[2]
+        self.authorization = None
+        if self.auth is not None:
+            credentials = "{}:{}" . format (*self.auth).encode("utf-8")
+            self.authorization = "Basic {}" . format (base64.b64encode(credentials).decode("ascii"))
+        self.parallelism = max(1, parallelism or 1)
+        self.connect_timeout, self.read_timeout = self.timeout
+        self.connections = 0
+        self._idle = []
+        self._semaphore = None
+        self._loop = None
+        self._thread = None
+
+    @property
+    def loop(self):
+        """The client's event loop, made on first use by the thread that
+        will run it"""
+
+        if self._loop is None:
+            if not has_asyncio():
+                raise RuntimeError("The asyncio client needs Python 3.6 or later")
+            import asyncio
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.current_thread()
+            self._errors = client_errors()
+        return self._loop
+
+    @property
+    def session(self):
+        self.loop
+        if self._session is None:
+            self._session = LoopSession(self)
+        return self._session
+
+    @property
+    def semaphore(self):
+        """Made on first use, from a step on the loop, so that it belongs
+        to the loop on every Python"""
+
+        if self._semaphore is None:
+            import asyncio
+            self._semaphore = asyncio.Semaphore(self.parallelism)
+        return self._semaphore
+
+    def wait(self, begin):
+        """Returns the result of the future `begin` starts on the loop. The
+        thread that runs the loop runs it until the future is done; other
+        threads hand `begin` to the loop and wait while it runs."""
+
+        loop = self.loop
+        if threading.current_thread() is self._thread:
+            return self.run(begin())
+
+        import concurrent.futures
+        done = concurrent.futures.Future()
+
+        def handoff():
+            future = begin()
+            future.add_done_callback(copy_outcome(done))
+
+        loop.call_soon_threadsafe(handoff)
+        return done.result()
+
+    def run(self, outcome):
+        """Runs the loop until `outcome`, a future of the client's, is done,
+        and returns its result. Anything else, such as the response a
+        write returns when there is nothing to change, is returned as it
+        is."""
+
+        import asyncio
+        if not asyncio.isfuture(outcome):
+            return outcome
+        return self.loop.run_until_complete(outcome)
+
+    def write(self, method, url, data=None, recheck=None, then=None):
+        """Starts a write, and returns a future of its response, which is
+        handed to `then` first. Like a request of KongClient, it is
+        retried if it fails in a way that is worth retrying. `recheck`,
+        which is not a coroutine, is run in a thread of its own before a
+        POST is retried."""
+
+        return start(self.loop, self._write(method, url, data, recheck, then))
+
+    def _write(self, method, url, data, recheck, then):
+        response = yield self._request(method, url, data, recheck)
+        if then is not None:
+            then(response)
+        raise Return(response)
+
+    def _request(self, method, url, data=None, recheck=None):
+        import asyncio
+
+        retryable = method.lower() in IDEMPOTENT_METHODS or recheck is not None
+        attempt = 0
+        while True:
+            started = clock()
+            try:
+                response, error = (yield self._attempt(method, url, data)), None
+            except self._errors as failure:
+                response, error = None, failure
+            if self.metrics is not None:
+                self.metrics.record(method, url, response, clock() - started, body_size(data), attempt > 0)
+
+            failed = error is not None or response.status_code in RETRY_STATUSES
+            if not failed or not retryable or attempt >= self.retries:
+                if error is not None:
+                    raise error
+                raise Return(response)
+
+            attempt += 1
+            yield asyncio.sleep(self._delay(attempt, response))
+            if recheck is not None:
+                entry = yield self.loop.run_in_executor(None, recheck)
+                if entry is not None:
+                    raise Return(entry_response(url, entry, 201))
+
+    def _attempt(self, method, url, data=None):
+        """One try of a write, at the pace of the rate limit. Any write
+        invalidates the cache, whether it went through or not."""
+
+        import asyncio
+
+        if self.rate_limiter is not None:
+            delay = self.rate_limiter.delay()
+            if delay > 0:
+                yield asyncio.sleep(delay)
+        try:
+            response = yield self._exchange(method, url, data)
+        finally:
+            if self.cache is not None and method.lower() not in ("get", "head"):
+                self.cache.invalidate()
+        raise Return(response)
+
+    def _exchange(self, method, url, data=None, params=None):
+        """Sends one request once the semaphore lets it, over an idle
+        connection if there is one"""
+
+        import asyncio
+
+        message = self._message(method, url, data, params)
+        yield self.semaphore.acquire()
+        try:
+            while self._idle:
+                connection = self._idle.pop()
+                try:
+                    response = yield asyncio.wait_for(start(self.loop, self._roundtrip(connection, method, url, message)), self.read_timeout)
+                except StaleConnection:
+                    continue
+                raise Return(response)
+
+            connection = yield asyncio.wait_for(start(self.loop, self._connect()), self.connect_timeout)
+            response = yield asyncio.wait_for(start(self.loop, self._roundtrip(connection, method, url, message, True)), self.read_timeout)
+            raise Return(response)
+        finally:
+            self.semaphore.release()
+
+    def _connect(self):
+        import asyncio
+
+        context = ssl.create_default_context() if self.secure else None
+        connection = yield asyncio.open_connection(self.host, self.port, ssl=context)
+        self.connections += 1
+        raise Return(connection)
+
+    def _message(self, method, url, data=None, params=None):
+        """The bytes of a request, with a form encoded body for a dict"""
+
+        parsed = urlparse(url)
+        target = quote(parsed.path or "/", safe="/%:@")
+        query = parsed.query
+        if params:
+            query = "{}{}{}" . format (query, "&" if query else "", form_encode(params))
+        if query:
+            target = "{}?{}" . format (target, query)
+
+        lines = ["{} {} HTTP/1.1" . format (method.upper(), target), "Host: {}" . format (self.netloc), "Accept: application/json"]
+        body = data
+        if isinstance(data, dict):
+            body = form_encode(data)
+            lines.append("Content-Type: application/x-www-form-urlencoded")
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        body = body or b""
+        if body or method.lower() in ("post", "put", "patch"):
+            lines.append("Content-Length: {}" . format (len(body)))
+        if self.authorization is not None:
+            lines.append("Authorization: {}" . format (self.authorization))
+        return "\r\n" . join (lines + ["", ""]).encode("latin-1") + body
+
+    def _roundtrip(self, connection, method, url, message, fresh=False):
+        """Sends the request on a connection and reads the response. The
+        connection goes back to the idle ones if the server keeps it open
+        and the response was read in full; otherwise, or if the exchange
+        is cancelled half way, it is closed."""
+
+        import asyncio
+
+        reader, writer = connection
+        keep = False
+        try:
+            try:
+                writer.write(message)
+                head = yield reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+                if fresh:
+                    raise
+                raise StaleConnection()
+            response, keep = yield self._read(reader, method, url, head)
+            raise Return(response)
+        finally:
+            if keep:
+                self._idle.append(connection)
+            else:
+                writer.close()
+
+    def _read(self, reader, method, url, head):
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+            raise ProtocolError("Unexpected status line from {}: {!r}" . format (self.base_url, lines[0]))
+        version, status_code = parts[0], int(parts[1])
+
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().title()] = value.strip()
+
+        keep = version == "HTTP/1.1" and headers.get("Connection", "").lower() != "close"
+        if method.lower() == "head" or status_code in (204, 304):
+            content = b""
+        elif headers.get("Transfer-Encoding", "").lower() == "chunked":
+            content = yield self._read_chunked(reader)
+        elif "Content-Length" in headers:
+            content = yield reader.readexactly(int(headers["Content-Length"]))
+        else:
+            content = yield reader.read()
+            keep = False
+        raise Return((KongResponse(url, status_code, content, headers), keep))
+
+    def _read_chunked(self, reader):
+        chunks = []
+        while True:
+            line = yield reader.readline()
+            try:
+                size = int(line.split(b";")[0].strip(), 16)
+            except ValueError:
+                raise ProtocolError("Unexpected chunk size from {}: {!r}" . format (self.base_url, line))
+            if size == 0:
+                yield reader.readuntil(b"\r\n")
+                raise Return(b"" . join (chunks))
+            chunks.append((yield reader.readexactly(size + 2))[:-2])
+
+    def close_connections(self):
+        idle, self._idle = self._idle, []
+        for reader, writer in idle:
+            writer.close()
+
+    def close(self):
+        """Closes the connections and the loop"""
+
+        KongClient.close(self)
+        self.close_connections()
+        if self._loop is not None and not self._loop.is_closed():
+            import asyncio
+            self._loop.run_until_complete(asyncio.sleep(0))
+            self._loop.close()
+
+
+def copy_outcome(done):
+    """A done callback that copies the outcome of a future of the loop
+    onto `done`, a concurrent.futures.Future another thread waits on"""
+
+    def settle(future):
+        if future.cancelled():
+            done.cancel()
+        elif future.exception() is not None:
+            done.set_exception(future.exception())
+        else:
+            done.set_result(future.result())
+    return settle
+
+
+class AsyncKongEngine:
+    """Runs admin operations like KongEngine, in the same stages (which
+    may hold results to pass through), when their calls return futures,
+    as the writes of KongAPI, KongPlugin and KongConsumer do over an
+    AsyncKongClient. Up to `parallelism` operations are in flight at a
+    time; the next one is started as soon as any one finishes, so one
+    slow call doesn't hold up the others, and a stage that is a generator
+    is read no further ahead than that. A call that returns a response
+    instead, or raises, is taken as it is.
+
+    The first fatal error stops the run: a call that can't reach Kong
+    (after its retries), or that Kong refuses with 401 or 403, since the
+    calls after it would fail the same way. The calls in flight are then
+    cancelled and reported as failed, no more are started and the later
+    stages are skipped. Other failures are reported like KongEngine
+    reports them."""
+
+    def __init__(self, parallelism=DEFAULT_PARALLELISM):
+        if not has_asyncio():
+            raise RuntimeError("The asyncio engine needs Python 3.6 or later")
+        self.parallelism = max(1, parallelism or 1)
+        self.stopped = None
+
+    def run(self, stages, check_mode=False):
+        """Returns the results of the operations that were run, in the
+        order given. In check mode no operation is called; their previews
+        are returned. `stopped` is the result that stopped the run, or
+        None if every operation was run."""
+
+        results = []
+        if check_mode:
+            for stage in stages:
+                results.extend(preview(operation) for operation in stage)
+            return results
+
+        self.stopped = None
+        for stage in stages:
+            results.extend(self._run_stage(stage))
+            if self.stopped is not None:
+                break
+        return results
+
+    def _run_stage(self, stage):
+        import asyncio
+
+        operations = iter(stage)
+        outcomes = []
+        pending = {}
+        loop = None
+        while True:
+            while self.stopped is None and len(pending) < self.parallelism:
+                operation = next(operations, None)
+                if operation is None:
+                    break
+                if isinstance(operation, dict):
+                    outcomes.append(operation)
+                    continue
+                outcomes.append(None)
+                position = len(outcomes) - 1
+                try:
+                    called = operation.call()
+                except Exception as error:
+                    outcomes[position] = self._failed(operation, error)
+                    continue
+                if asyncio.isfuture(called):
+                    pending[called] = (position, operation)
+                    loop = future_loop(called)
+                else:
+                    outcomes[position] = self._outcome(operation, called)
+            if not pending:
+                break
+
+            done, _ = loop.run_until_complete(asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED))
+            for future in done:
+                position, operation = pending.pop(future)
+                error = future.exception()
+                outcomes[position] = self._outcome(operation, future.result()) if error is None else self._failed(operation, error)
+
+            if self.stopped is not None and pending:
+                for future in pending:
+                    future.cancel()
+                loop.run_until_complete(asyncio.wait(list(pending)))
+                for future, (position, operation) in pending.items():
+                    if future.cancelled():
+                        outcomes[position] = operation.outcome(msg="Cancelled after: {}" . format (self.stopped['msg']))
+                    elif future.exception() is not None:
+                        outcomes[position] = operation.outcome(msg=str(future.exception()))
+                    else:
+                        outcomes[position] = operation.outcome(future.result())
+                pending = {}
+
+        if self.stopped is not None and hasattr(operations, "close"):
+            operations.close()
+        return outcomes
+
+    def _outcome(self, operation, response):
+        outcome = operation.outcome(response)
+        if response.status_code in FATAL_STATUSES and self.stopped is None:
+            self.stopped = dict(outcome, msg="Kong refused the call with {}" . format (response.status_code))
+        return outcome
+
+    def _failed(self, operation, error):
+        outcome = operation.outcome(msg=str(error) or error.__class__.__name__)
+        if isinstance(error, client_errors()) and self.stopped is None:
+            self.stopped = outcome
+        return outcome
+
+
+def future_loop(future):
+    """The loop a future belongs to (get_loop() is Python 3.7 or later)"""
+
+    get_loop = getattr(future, "get_loop", None)
+    return get_loop() if get_loop is not None else future._loop
@@ -0,0 +1,61 @@
+import importlib
+
+try:
+    from ansible.module_utils.kong_client import reset_client_stats
+    from ansible.module_utils.kong_cluster import fan_out
+    from ansible.module_utils.kong_result import shape_params
+    from ansible.module_utils.kong_task import KongTask, task_params
+except ImportError:
+    from .kong_client import reset_client_stats
+    from .kong_cluster import fan_out
+    from .kong_result import shape_params
+    from .kong_task import KongTask, task_params
+
+MODULES = ("kong_api", "kong_plugin", "kong_consumer", "kong_upstream")
+
+
+def load_module(name):
+    if name not in MODULES:
+        raise ValueError("Unknown module {}, expected one of: {}" . format (name, ", " . join (MODULES)))
+    return importlib.import_module(name)
+
+
+def run_task(task, check_mode=False, diff=False):
+    """Runs one task, a dict with the `module` to run and its `params`,
+    and returns its result. A task that can't be run, or raises, gives
+    a failed result rather than stopping the batch. The stats it reports
+    (retries, cache, metrics) are its own, though the clients are
+    shared with the other tasks."""
+
+    reset_client_stats()
+    try:
+        module = load_module(task.get("module"))
+        helper = module.ModuleHelper()
+        params = task_params(helper.argument_spec(), task.get("params") or {})
+        result = shape_params(fan_out(module.run, helper, KongTask(params, task.get("check_mode", check_mode), diff)), params)
+    except Exception as error:
+        result = dict(failed=True, msg=str(error))
+
+    result = dict(result, module=task.get("module"))
+    result.setdefault("failed", False)
+    if task.get("name") is not None:
+        result["name"] = task["name"]
+    return result
+
+
+def run_batch(tasks, check_mode=False, diff=False, stop_on_failure=False):
+    """Runs kong_api, kong_plugin, kong_consumer and kong_upstream tasks in one process
+    and yields the result of each in turn.
+
+    Each module's run() is called with a KongTask in place of
+    AnsibleModule, so the batch pays for the interpreter start and the
+    imports once rather than once per task, and the tasks share the
+    pooled admin client. The module files are imported by name, so the
+    library directory has to be on sys.path. Tasks run in order, since a
+    later task may depend on an earlier one (a plugin on its API)."""
+
+    for task in tasks:
+        result = run_task(task, check_mode, diff)
+        yield result
+        if stop_on_failure and result["failed"]:
+            return
@@ -0,0 +1,131 @@
+import errno, hashlib, json, os, stat, tempfile, threading, time
+
+DEFAULT_CACHE_TTL = 60
+
+
+def default_cache_dir():
+    """A directory of the temp dir for the user running the module, so
+    that users of the same host don't share snapshots"""
+
+    return os.path.join(tempfile.gettempdir(), "ansible-kong-cache-{}" . format (os.getuid()))
+
+
+class SnapshotCache:
+    """Keeps listings of one admin endpoint on disk, so that later module
+    invocations in the same play can reuse them instead of listing the
+    collection again.
+
+    Each listing is a file named after its path and query, under a
+    directory for the admin endpoint. A listing is served while it is
+    younger than `ttl` seconds and was fetched after the last write to
+    the endpoint: every write stamps an `invalidated` file, which makes
+    all earlier snapshots stale, including ones being fetched by other
+    processes at the time.
+
+    Snapshots are only read or written in a directory that belongs to
+    the user running the module and that no one else can write to, so
+    another user can't feed a module listings of their own.
+
+    Any error reading or writing the cache is treated as a miss; the
+    cache never makes a module fail."""
+
+    def __init__(self, base_url, ttl=DEFAULT_CACHE_TTL, directory=None):
+        self.ttl = ttl
+        self.directory = os.path.join(directory or default_cache_dir(), self._digest(base_url))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _digest(self, value):
+        return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+    def _path(self, url, params):
+        key = json.dumps([url, sorted((params or {}).items())])
+        return os.path.join(self.directory, self._digest(key) + ".json")
+
+    def _marker(self):
+        return os.path.join(self.directory, "invalidated")
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def invalidated_at(self):
+        try:
+            with open(self._marker()) as marker:
+                return float(marker.read() or 0)
+        except (IOError, OSError, ValueError):
+            return 0
+
+    def get(self, url, params=None):
+        """Returns the cached entries of a listing, or None if there is no
+        fresh snapshot of it"""
+
+        try:
+            if not self._trusted():
+                raise IOError("{} is not private to this user" . format (self.directory))
+            with open(self._path(url, params)) as snapshot:
+                stored = json.load(snapshot)
+            fetched = stored["fetched"]
+            fresh = time.time() - fetched < self.ttl and fetched > self.invalidated_at()
+            entries = stored["entries"] if fresh else None
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            entries = None
+
+        self._count(entries is not None)
+        return entries
+
+    def put(self, url, params, entries, fetched):
+        """Stores a listing that was started at `fetched`. A write since
+        then means the listing may already be out of date, so it is
+        dropped."""
+
+        if fetched <= self.invalidated_at():
+            return
+        self._write(self._path(url, params), json.dumps(dict(fetched=fetched, entries=entries)))
+
+    def invalidate(self):
+        """Marks every snapshot of this endpoint as stale"""
+
+        self._write(self._marker(), repr(time.time()))
+
+    def _write(self, path, content):
+        try:
+            self._ensure_directory()
+            if not self._trusted():
+                return
+            handle, temporary = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(handle, "w") as output:
+                output.write(content)
+            os.rename(temporary, path)
+        except (IOError, OSError):
+            pass
+
+    def _ensure_directory(self):
+        try:
+            os.makedirs(self.directory, 0o700)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+
+    def _trusted(self):
+        """Whether the directory is a real directory, owned by the user
+        running the module, that neither the group nor others can write to"""
+
+        try:
+            status = os.lstat(self.directory)
+        except OSError:
+            return False
+        return stat.S_ISDIR(status.st_mode) and status.st_uid == os.getuid() \
+            and not status.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses)
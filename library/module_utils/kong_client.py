@@ -0,0 +1,601 @@
+import json, random, threading, time
+
+try:
+    from ansible.module_utils.six import string_types, text_type
+    from ansible.module_utils.six.moves.urllib.parse import urlparse, parse_qs, urlencode
+except ImportError:
+    from six import string_types, text_type
+    from six.moves.urllib.parse import urlparse, parse_qs, urlencode
+
+try:
+    from ansible.module_utils.kong_cache import SnapshotCache, DEFAULT_CACHE_TTL
+except ImportError:
+    from .kong_cache import SnapshotCache, DEFAULT_CACHE_TTL
+
+try:
+    from ansible.module_utils.kong_metrics import Metrics, clock
+except ImportError:
+    from .kong_metrics import Metrics, clock
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+MAX_BACKOFF = 30
+
+TRANSPORTS = ("auto", "requests", "open_url")
+
+IDEMPOTENT_METHODS = ("get", "head", "put", "patch", "delete")
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class KongError(Exception):
+    """Raised when a paginated read gets an error response.
+    The response is kept so callers can report it."""
+
+    def __init__(self, response):
+        Exception.__init__(self, "Kong admin API returned {} for {}" . format (response.status_code, response.url))
+        self.response = response
+
+
+def unchanged_response(url, entry):
+    """Stands in for a write that was skipped because nothing differed.
+    It answers 304 Not Modified with the current entry as its body, so
+    callers can treat it like the response of the write it replaces."""
+
+    return entry_response(url, entry, 304)
+
+
+def entry_response(url, entry, status_code):
+    return KongResponse(url, status_code, json.dumps(entry).encode("utf-8"))
+
+
+class KongResponse:
+    """The parts of a requests.Response that the modules read, for the
+    responses of the open_url transport and the ones the client makes up."""
+
+    def __init__(self, url, status_code, content=b"", headers=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers if headers is not None else {}
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def next_offset(body):
+    """The cursor of the next page of a Kong listing, or None on the last
+    page. Older Kongs only give it in the `next` URL."""
+
+    offset = body.get("offset")
+    if offset is None and body.get("next"):
+        query = parse_qs(urlparse(body["next"]).query)
+        offset = query.get("offset", [None])[0]
+    return offset
+
+
+def requests_session(auth, pool_size):
+    """A requests session with a keep-alive pool of `pool_size`
+    connections. Returns it with the errors worth retrying."""
+
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.auth = auth
+    return session, (requests.ConnectionError, requests.Timeout)
+
+
+def has_requests():
+    try:
+        import requests
+    except ImportError:
+        return False
+    return True
+
+
+def form_encode(data):
+    """Encodes a dict the way requests does for a form body: list values
+    give one field per item and None values are left out."""
+
+    fields = []
+    for key, values in data.items():
+        if isinstance(values, string_types) or not isinstance(values, (list, tuple)):
+            values = [values]
+        for value in values:
+            if value is None:
+                continue
+            if isinstance(value, text_type):
+                value = value.encode("utf-8")
+            fields.append((key, value))
+    return urlencode(fields)
+
+
+def body_size(data):
+    if isinstance(data, dict):
+        return len(form_encode(data))
+    return len(data or "")
+
+
+class OpenUrlSession:
+    """Sends the client's requests with Ansible's open_url, for targets
+    that don't have requests installed. There is no connection pool:
+    each request opens its own connection."""
+
+    def __init__(self, auth):
+        from ansible.module_utils.urls import open_url, ConnectionError
+        from ansible.module_utils.six.moves import http_client
+        from ansible.module_utils.six.moves.urllib.error import HTTPError, URLError
+        import socket
+
+        self.auth = auth
+        self._open_url = open_url
+        self._http_error = HTTPError
+        self.errors = (URLError, ConnectionError, http_client.HTTPException, socket.error, socket.timeout)
+
+    def request(self, method, url, data=None, params=None, timeout=None):
+        if params:
+            url = "{}{}{}" . format (url, "&" if "?" in url else "?", form_encode(params))
+        headers = {}
+        if isinstance(data, dict):
+            data = form_encode(data)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if isinstance(data, text_type):
+            data = data.encode("utf-8")
+        if isinstance(timeout, tuple):
+            timeout = max(timeout)
+        username, password = self.auth if self.auth is not None else (None, None)
+
+        try:
+            reply = self._open_url(url, data=data, headers=headers, method=method.upper(), timeout=timeout,
+                                   url_username=username, url_password=password, force_basic_auth=self.auth is not None)
+        except self._http_error as error:
+            content = error.read() if getattr(error, "fp", None) is not None else b""
+            return KongResponse(url, error.code, content, error.info())
+        try:
+            return KongResponse(reply.geturl(), reply.getcode(), reply.read(), reply.info())
+        finally:
+            reply.close()
+
+    def close(self):
+        pass
+
+
+class RateLimiter:
+    """Spaces out requests to one host so that no more than `rate` per
+    second are started, however many threads share it."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """Takes the next slot, and returns how long to wait for it"""
+
+        with self._lock:
+            now = time.time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        return delay
+
+    def wait(self):
+        delay = self.delay()
+        if delay > 0:
+            time.sleep(delay)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def retry_after(response):
+    """The delay asked for by a Retry-After header, in seconds, or None"""
+
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_tz, mktime_tz
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0, mktime_tz(date) - time.time())
+
+def get_rate_limiter(url, rate):
+    """Returns the limiter shared by every client talking to this host"""
+
+    key = (urlparse(url).netloc, rate)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(rate)
+        return _limiters[key]
+
+
+class KongClient:
+    """A pooled, keep-alive HTTP session for a Kong admin endpoint.
+
+    KongAPI, KongConsumer and KongPlugin all send their requests through
+    a client so that a module invocation reuses the same connections
+    instead of opening a new one for every call.
+
+    With `cache` on, listings are kept in a SnapshotCache on disk and
+    any write through the client invalidates them.
+
+    Requests that fail with a connection error, a timeout, 429 or a 502,
+    503 or 504 from a proxy are retried up to `retries` times, after an
+    exponential backoff with full jitter or the delay the server asks for
+    in Retry-After. Only idempotent verbs are retried as they are; a POST
+    is only retried if the caller gives a `recheck` that looks for what
+    it would have created, so that a create which did go through is not
+    made twice.
+
+    Requests are sent with requests when it is installed. With
+    `transport` set to open_url, or left on auto where requests is
+    missing, Ansible's own open_url is used instead. Neither is imported
+    before the first request.
+
+    With `metrics` on, every call is counted and timed; with a `trace`
+    path, the summary is also appended to that file each time stats()
+    reports it."""
+
+    def __init__(self, base_url, auth_username=None, auth_password=None, pool_size=DEFAULT_POOL_SIZE, page_size=DEFAULT_PAGE_SIZE, rate_limit=None,
+                 cache=False, cache_ttl=DEFAULT_CACHE_TTL, cache_dir=None,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT, retries=DEFAULT_RETRIES, retry_backoff=DEFAULT_RETRY_BACKOFF,
+                 transport="auto", metrics=False, trace=None):
+        self.base_url = base_url
+        if auth_username is not None and auth_password is not None:
+            self.auth = (auth_username, auth_password)
+        else:
+            self.auth = None
+        self.pool_size = pool_size
+        self.page_size = page_size
+        self.rate_limiter = get_rate_limiter(base_url, rate_limit) if rate_limit else None
+        self.cache = SnapshotCache(base_url, cache_ttl, cache_dir) if cache else None
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.retry_count = 0
+        self.backoff_time = 0
+        self.transport = transport
+        self.metrics = Metrics(base_url) if metrics or trace else None
+        self.trace = trace
+        self._stats_lock = threading.Lock()
+        self._session = None
+        self._errors = ()
+
+    @property
+    def session(self):
+        """The session is only built on first use"""
+
+        if self._session is None:
+            if self.transport == "open_url" or (self.transport == "auto" and not has_requests()):
+                session = OpenUrlSession(self.auth)
+                self._session, self._errors = session, session.errors
+            else:
+                self._session, self._errors = requests_session(self.auth, self.pool_size)
+        return self._session
+
+    def request(self, method, url, data=None, recheck=None, **kwargs):
+        """Sends a request, retrying it if it fails in a way that is worth
+        retrying. `recheck` is called before a POST is retried; if it
+        returns an entry, the POST is taken to have gone through and a
+        201 response with that entry is returned instead."""
+
+        kwargs.setdefault("timeout", self.timeout)
+        retryable = method.lower() in IDEMPOTENT_METHODS or recheck is not None
+        attempt = 0
+        while True:
+            session = self.session
+            started = clock()
+            try:
+                response, error = self._send(session, method, url, data, **kwargs), None
+            except self._errors as failure:
+                response, error = None, failure
+            if self.metrics is not None:
+                self.metrics.record(method, url, response, clock() - started, body_size(data), attempt > 0)
+
+            failed = error is not None or response.status_code in RETRY_STATUSES
+            if not failed or not retryable or attempt >= self.retries:
+                if error is not None:
+                    raise error
+                return response
+
+            attempt += 1
+            self._backoff(attempt, response)
+            if recheck is not None:
+                entry = recheck()
+                if entry is not None:
+                    return entry_response(url, entry, 201)
+
+    def _send(self, session, method, url, data=None, **kwargs):
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait()
+        try:
+            return session.request(method, url, data=data, **kwargs)
+        finally:
+            if self.cache is not None and method.lower() not in ("get", "head"):
+                self.cache.invalidate()
+
+    def _backoff(self, attempt, response):
+        time.sleep(self._delay(attempt, response))
+
+    def _delay(self, attempt, response):
+        """The time to wait before a retry, counted in the stats"""
+
+        delay = retry_after(response)
+        if delay is None:
+            delay = random.uniform(0, self.retry_backoff * 2 ** (attempt - 1))
+        delay = min(delay, MAX_BACKOFF)
+        with self._stats_lock:
+            self.retry_count += 1
+            self.backoff_time += delay
+        return delay
+
+    def get(self, url, **kwargs):
+        return self.request("get", url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request("post", url, data, **kwargs)
+
+    def patch(self, url, data=None, **kwargs):
+        return self.request("patch", url, data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("delete", url, **kwargs)
+
+    def write(self, method, url, data=None, recheck=None, then=None):
+        """Sends a write and hands its response to `then`, such as the
+        record method of an index, before returning it. KongAPI,
+        KongPlugin and KongConsumer write through here, so that over an
+        AsyncKongClient, which returns a future instead, their writes
+        don't wait for Kong."""
+
+        response = self.request(method, url, data, recheck=recheck)
+        if then is not None:
+            then(response)
+        return response
+
+    def iterate(self, url, size=None, params=None, cached=True):
+        """Yields every entry of a Kong collection, one page at a time,
+        following the `offset` cursor Kong returns while there are more
+        pages. Raises KongError if a page can't be read.
+
+        With the cache on, a fresh snapshot of the listing is served
+        instead, and a listing read to the end is stored. A listing that
+        is not `cached` is always read from Kong and never held whole."""
+
+        if self.cache is None or not cached:
+            for entry in self._iterate(url, size, params):
+                yield entry
+            return
+
+        entries = self.cache.get(url, params)
+        if entries is None:
+            fetched = time.time()
+            entries = []
+            for entry in self._iterate(url, size, params):
+                entries.append(entry)
+                yield entry
+            self.cache.put(url, params, entries, fetched)
+        else:
+            for entry in entries:
+                yield entry
+
+    def _iterate(self, url, size=None, params=None):
+        query = dict(params or {})
+        query['size'] = size or self.page_size
+        while True:
+            response = self.get(url, params=query)
+            if not response.ok:
+                raise KongError(response)
+
+            body = response.json()
+            for entry in body.get("data", []):
+                yield entry
+
+            offset = next_offset(body)
+            if offset is None:
+                return
+            query['offset'] = offset
+
+    def stats(self):
+        """Counters to add to the module result"""
+
+        stats = {}
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        if self.retry_count:
+            stats['retries'] = dict(count=self.retry_count, backoff=round(self.backoff_time, 3))
+        if self.metrics is not None:
+            stats['metrics'] = self.metrics.summary()
+            if self.trace:
+                self.metrics.write(self.trace, stats['metrics'])
+        return stats
+
+    def reset_stats(self):
+        """Starts the counters of stats() again, for a client that is
+        shared by several tasks"""
+
+        with self._stats_lock:
+            self.retry_count = 0
+            self.backoff_time = 0
+        if self.metrics is not None:
+            self.metrics = Metrics(self.base_url)
+        if self.cache is not None:
+            self.cache.reset_stats()
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+class KongIndex:
+    """An in-process index of one Kong collection, keyed by name and id.
+
+    It is loaded once from a listing and then kept current from the
+    responses of writes, so existence checks are dictionary lookups
+    rather than another listing. Any failed or unreadable write drops
+    the index, and the next lookup loads it again."""
+
+    def __init__(self, key="name"):
+        self.key = key
+        self._by_key = None
+        self._by_id = {}
+        self._lock = threading.RLock()
+
+    @property
+    def loaded(self):
+        return self._by_key is not None
+
+    def load(self, entries):
+        with self._lock:
+            self._by_key = {}
+            self._by_id = {}
+            for entry in entries:
+                self.put(entry)
+
+    def ensure(self, loader):
+        """Loads the index from `loader()` unless it is already loaded.
+        Threads that ask at the same time wait for one load."""
+
+        with self._lock:
+            if not self.loaded:
+                self.load(loader())
+        return self
+
+    def get(self, key):
+        return self._by_key.get(key)
+
+    def get_by_id(self, id):
+        return self._by_id.get(id)
+
+    def entries(self):
+        return list(self._by_id.values())
+
+    def put(self, entry):
+        with self._lock:
+            previous = self._by_id.get(entry.get("id"))
+            if previous is not None:
+                self._by_key.pop(previous.get(self.key), None)
+
+            if entry.get(self.key) is not None:
+                self._by_key[entry.get(self.key)] = entry
+            if entry.get("id") is not None:
+                self._by_id[entry.get("id")] = entry
+
+    def remove(self, key_or_id):
+        with self._lock:
+            entry = self._by_id.get(key_or_id) or self._by_key.get(key_or_id)
+            if entry is not None:
+                self._by_id.pop(entry.get("id"), None)
+                self._by_key.pop(entry.get(self.key), None)
+
+    def invalidate(self):
+        with self._lock:
+            self._by_key = None
+            self._by_id = {}
+
+    def record(self, response, removed=None):
+        """Applies the result of a write: the entry returned by a POST or
+        PATCH, or the removal of `removed` after a DELETE."""
+
+        if not self.loaded:
+            return
+        if not response.ok:
+            self.invalidate()
+        elif removed is not None:
+            self.remove(removed)
+        else:
+            try:
+                entry = response.json()
+            except ValueError:
+                entry = None
+            if isinstance(entry, dict):
+                self.put(entry)
+            else:
+                self.invalidate()
+
+
+_clients = {}
+
+def get_client(base_url, auth_username=None, auth_password=None, **options):
+    """Returns the shared client for this admin endpoint, credentials
+    and options, creating it on first use."""
+
+    key = (base_url, auth_username, auth_password, tuple(sorted(options.items())))
+    client = _clients.get(key)
+    if client is None:
+        client = KongClient(base_url, auth_username, auth_password, **options)
+        _clients[key] = client
+    return client
+
+def reset_client_stats():
+    """Starts the counters of every shared client again, so that each
+    task run in one process reports its own"""
+
+    for client in _clients.values():
+        client.reset_stats()
+
+def client_argument_spec():
+    """Module arguments shared by every kong_* module"""
+
+    return dict(
+        kong_admin_pool_size = dict(required=False, default=DEFAULT_POOL_SIZE, type='int'),
+        kong_admin_page_size = dict(required=False, default=DEFAULT_PAGE_SIZE, type='int'),
+        kong_admin_rate_limit = dict(required=False, type='float'),
+        kong_admin_cache = dict(required=False, default=False, type='bool'),
+        kong_admin_cache_ttl = dict(required=False, default=DEFAULT_CACHE_TTL, type='int'),
+        kong_admin_cache_dir = dict(required=False, type='path'),
+        kong_admin_connect_timeout = dict(required=False, default=DEFAULT_CONNECT_TIMEOUT, type='float'),
+        kong_admin_read_timeout = dict(required=False, default=DEFAULT_READ_TIMEOUT, type='float'),
+        kong_admin_retries = dict(required=False, default=DEFAULT_RETRIES, type='int'),
+        kong_admin_retry_backoff = dict(required=False, default=DEFAULT_RETRY_BACKOFF, type='float'),
+        kong_admin_transport = dict(required=False, default="auto", choices=list(TRANSPORTS), type='str'),
+        kong_admin_metrics = dict(required=False, default=False, type='bool'),
+        kong_admin_trace = dict(required=False, type='path'),
+        kong_admin_quorum = dict(required=False, type='int'),
+    )
+
+CLIENT_OPTIONS = {
+    'kong_admin_pool_size': 'pool_size',
+    'kong_admin_page_size': 'page_size',
+    'kong_admin_rate_limit': 'rate_limit',
+    'kong_admin_cache': 'cache',
+    'kong_admin_cache_ttl': 'cache_ttl',
+    'kong_admin_cache_dir': 'cache_dir',
+    'kong_admin_connect_timeout': 'connect_timeout',
+    'kong_admin_read_timeout': 'read_timeout',
+    'kong_admin_retries': 'retries',
+    'kong_admin_retry_backoff': 'retry_backoff',
+    'kong_admin_transport': 'transport',
+    'kong_admin_metrics': 'metrics',
+    'kong_admin_trace': 'trace',
+}
+
+def client_options(params):
+    """Maps the module arguments from client_argument_spec to
+    KongClient keyword arguments"""
+
+    options = {}
+    for param, option in CLIENT_OPTIONS.items():
+        value = params.get(param)
+        if value is not None:
+            options[option] = value
+    return options
@@ -0,0 +1,105 @@
+try:
+    from ansible.module_utils.six import string_types
+except ImportError:
+    from six import string_types
+
+
+def admin_endpoints(value):
+    """The admin endpoints in a kong_admin_uri: one URL, a comma separated
+    string of them or a list. Duplicates are dropped, the order is kept."""
+
+    if value is None:
+        return []
+    if isinstance(value, string_types):
+        value = value.split(",")
+
+    endpoints = []
+    for endpoint in value:
+        endpoint = str(endpoint).strip()
+        if endpoint and endpoint not in endpoints:
+            endpoints.append(endpoint)
+    return endpoints
+
+
+class EndpointModule:
+    """Stands in for the module while its work is done against one admin
+    endpoint. Its params name that endpoint alone; everything else
+    (check mode, diff mode, fail_json, log) is the module's."""
+
+    def __init__(self, module, endpoint):
+        self.module = module
+        self.params = dict(module.params, kong_admin_uri=endpoint)
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+
+def fan_out(run, helper, module):
+    """Calls a module's run() once for each admin endpoint in its
+    kong_admin_uri, all at once, and returns the combined result.
+
+    With a single endpoint the result is run()'s own. With several, each
+    endpoint has its result under `endpoints`, and the run fails if fewer
+    than kong_admin_quorum of them (default: all) succeed. An endpoint
+    that fails or raises doesn't stop the others. Each endpoint gets its
+    own pooled client, since clients are shared by admin URL."""
+
+    endpoints = admin_endpoints(module.params.get('kong_admin_uri'))
+    if not endpoints:
+        return run(helper, module)
+    if len(endpoints) == 1:
+        return run(helper, EndpointModule(module, endpoints[0]))
+
+    def run_endpoint(endpoint):
+        try:
+            return run(helper, EndpointModule(module, endpoint))
+        except Exception as error:
+            return dict(failed=True, msg=str(error))
+
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(len(endpoints))
+    try:
+        results = pool.map(run_endpoint, endpoints)
+    finally:
+        pool.close()
+        pool.join()
+
+    return combine(endpoints, results, module.params.get('kong_admin_quorum'))
+
+
+def combine(endpoints, results, quorum=None):
+    """The result of a run against several endpoints, from the result of
+    each. Their diffs are gathered into one list, headed by endpoint."""
+
+    if quorum is None:
+        quorum = len(endpoints)
+
+    diff = []
+    by_endpoint = {}
+    for endpoint, outcome in zip(endpoints, results):
+        outcome = dict(outcome)
+        changes = outcome.pop('diff', None)
+        if isinstance(changes, dict):
+            changes = [changes]
+        for change in changes or []:
+            diff.append(dict(change,
+                             before_header="{} {}" . format (endpoint, change.get('before_header', "")).strip(),
+                             after_header="{} {}" . format (endpoint, change.get('after_header', "")).strip()))
+        by_endpoint[endpoint] = outcome
+
+    failed = [endpoint for endpoint in endpoints if by_endpoint[endpoint].get('failed')]
+    combined = dict(
+        changed=any(outcome.get('changed') for outcome in by_endpoint.values()),
+        endpoints=by_endpoint,
+        quorum=quorum,
+    )
+    if diff:
+        combined['diff'] = diff
+    if failed:
+        combined['failed_endpoints'] = failed
+        msg = "{} of {} admin endpoints failed: {}" . format (len(failed), len(endpoints), ", " . join (failed))
+        if len(endpoints) - len(failed) < quorum:
+            combined.update(failed=True, msg="{}, {} had to succeed" . format (msg, quorum))
+        else:
+            combined['warnings'] = [msg]
+    return combined
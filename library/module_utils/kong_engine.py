@@ -0,0 +1,179 @@
+from itertools import islice
+
+DEFAULT_PARALLELISM = 1
+BATCH_SIZE = 500
+
+ACTIONS = {
+    200: "update",
+    201: "create",
+    204: "delete",
+    304: "none",
+}
+
+
+class Operation:
+    """One admin call to make, named for the results. `call` takes no
+    arguments and returns the response.
+
+    `action` is what the call is expected to do; when it is None the
+    action is read off the response status instead."""
+
+    def __init__(self, name, action, call, diff=None):
+        self.name = name
+        self.action = action
+        self.call = call
+        self.diff = diff
+
+    def __call__(self):
+        try:
+            response = self.call()
+        except Exception as error:
+            return self.outcome(msg=str(error))
+        return self.outcome(response)
+
+    def outcome(self, response=None, msg=None):
+        """The result of the operation, from its response or, if the call
+        raised, the error"""
+
+        if response is None:
+            return self._with_diff(result(self.name, self.action or "error", msg=msg))
+        return self._with_diff(result(self.name, self.action, response))
+
+    def preview(self):
+        """The result the operation is expected to have, for check mode"""
+
+        outcome = result(self.name, self.action)
+        outcome['changed'] = self.action in ("create", "update", "delete")
+        return self._with_diff(outcome)
+
+    def _with_diff(self, outcome):
+        if self.diff is not None:
+            outcome['diff'] = self.diff
+        return outcome
+
+
+def result(name, action, response=None, msg=None):
+    """The result of one operation, as reported by the bulk modules"""
+
+    if response is None:
+        return dict(
+            name=name,
+            action=action,
+            changed=False,
+            failed=msg is not None,
+            status_code=None,
+            msg=msg,
+        )
+
+    if action is None:
+        action = ACTIONS.get(response.status_code, "error")
+    return dict(
+        name=name,
+        action=action,
+        changed=response.status_code in [200, 201, 204],
+        failed=response.status_code >= 400,
+        status_code=response.status_code,
+        msg=msg,
+    )
+
+
+def summarize(results):
+    """Splits the results of a bulk run for reporting: whether anything
+    changed, the failures, the results that changed or failed, and a
+    count of the results per action"""
+
+    summary = {}
+    for outcome in results:
+        summary[outcome['action']] = summary.get(outcome['action'], 0) + 1
+
+    has_changed = any(outcome['changed'] for outcome in results)
+    failed = [outcome for outcome in results if outcome['failed']]
+    reported = [outcome for outcome in results if outcome['changed'] or outcome['failed']]
+    return (has_changed, failed, reported, summary)
+
+
+def call(operation):
+    """Calls an operation of a stage, or passes a result through"""
+
+    if isinstance(operation, dict):
+        return operation
+    return operation()
+
+
+def preview(operation):
+    """Previews an operation of a stage, or passes a result through"""
+
+    if isinstance(operation, dict):
+        return operation
+    return operation.preview()
+
+
+def check_response(action, diff, show_diff=False):
+    """The exit_json arguments for a single-entity module in check mode"""
+
+    response = dict(changed=action != "none", meta=dict(action=action))
+    if show_diff and diff is not None:
+        response['diff'] = diff
+    return response
+
+
+class KongEngine:
+    """Runs admin operations through a bounded pool of threads.
+
+    Operations are given in stages. The operations within a stage must
+    not depend on each other and run concurrently; a stage only starts
+    once the one before it is done, which is how dependencies are kept
+    in order (APIs before their plugins, consumers before their
+    credentials).
+
+    A stage can be any iterable, including a generator. It is read
+    BATCH_SIZE operations at a time, so a stage built while streaming
+    its input is never held in memory as a whole. A stage may also hold
+    the results of entries that need no call, as the dicts result()
+    makes; they are passed through in place, so the results keep the
+    order of the stage."""
+
+    def __init__(self, parallelism=DEFAULT_PARALLELISM):
+        self.parallelism = max(1, parallelism or 1)
+
+    def run(self, stages, check_mode=False):
+        """Returns the results of every operation, in the order given.
+        In check mode no operation is called; their previews are returned."""
+
+        results = []
+        for stage in stages:
+            if check_mode:
+                results.extend(preview(operation) for operation in stage)
+            else:
+                results.extend(self._run_stage(stage))
+        return results
+
+    def _run_stage(self, stage):
+        results = []
+        operations = iter(stage)
+        while True:
+            batch = list(islice(operations, BATCH_SIZE))
+            if not batch:
+                return results
+            results.extend(self._run_batch(batch))
+
+    def _run_batch(self, operations):
+        workers = min(self.parallelism, len(operations))
+        if workers <= 1:
+            return [call(operation) for operation in operations]
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(workers)
+        try:
+            return pool.map(call, operations)
+        finally:
+            pool.close()
+            pool.join()
+
+
+def engine_argument_spec():
+    """Module arguments for the modules that run a KongEngine"""
+
+    return dict(
+        parallelism = dict(required=False, default=DEFAULT_PARALLELISM, type='int'),
+    )
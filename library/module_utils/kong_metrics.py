@@ -0,0 +1,105 @@
+import heapq, json, threading, time
+
+try:
+    from ansible.module_utils.six.moves.urllib.parse import urlparse
+except ImportError:
+    from six.moves.urllib.parse import urlparse
+
+SLOWEST_CALLS = 5
+
+clock = getattr(time, "monotonic", time.time)
+
+
+def endpoint(base_path, url):
+    """The admin endpoint a URL belongs to, with the names and ids in
+    its path replaced, so that /apis/mockbin/plugins/1 and
+    /apis/other/plugins/2 are both counted as /apis/{}/plugins/{}"""
+
+    path = urlparse(url).path
+    if base_path and path.startswith(base_path):
+        path = path[len(base_path):]
+    segments = [segment for segment in path.split("/") if segment]
+    return "/" + "/" . join ("{}" if index % 2 else segment for index, segment in enumerate(segments))
+
+
+class Metrics:
+    """Counts and times the admin calls a client makes: the calls, time
+    and retries per verb and endpoint, the statuses, the bytes sent and
+    received and the slowest calls. Times are taken with a monotonic
+    clock where there is one."""
+
+    def __init__(self, base_url, slowest=SLOWEST_CALLS):
+        self.base_url = base_url
+        self.base_path = urlparse(base_url).path.rstrip("/")
+        self.calls = 0
+        self.time = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+        self.endpoints = {}
+        self.statuses = {}
+        self._slowest_size = slowest
+        self._slowest = []
+        self._lock = threading.Lock()
+
+    def record(self, method, url, response, elapsed, sent=0, retry=False):
+        """Adds one call. `response` is None when the call got no
+        response at all, after a connection error or a timeout."""
+
+        key = "{} {}" . format (method.upper(), endpoint(self.base_path, url))
+        status = str(response.status_code) if response is not None else "error"
+        received = len(response.content or b"") if response is not None else 0
+
+        with self._lock:
+            self.calls += 1
+            self.time += elapsed
+            self.bytes_sent += sent
+            self.bytes_received += received
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+            counts = self.endpoints.setdefault(key, dict(calls=0, time=0, max=0, retries=0))
+            counts["calls"] += 1
+            counts["time"] += elapsed
+            counts["max"] = max(counts["max"], elapsed)
+            if retry:
+                self.retries += 1
+                counts["retries"] += 1
+
+            call = (elapsed, self.calls, dict(method=method.upper(), url=url, status=status))
+            if len(self._slowest) < self._slowest_size:
+                heapq.heappush(self._slowest, call)
+            else:
+                heapq.heappushpop(self._slowest, call)
+
+    def summary(self):
+        """The counters as a dict for the module result, times in seconds"""
+
+        with self._lock:
+            endpoints = dict(
+                (key, dict(counts, time=round(counts["time"], 4), max=round(counts["max"], 4)))
+                for key, counts in self.endpoints.items()
+            )
+            slowest = [dict(call, time=round(elapsed, 4)) for elapsed, _, call in sorted(self._slowest, reverse=True)]
+            return dict(
+                calls=self.calls,
+                time=round(self.time, 4),
+                bytes_sent=self.bytes_sent,
+                bytes_received=self.bytes_received,
+                retries=self.retries,
+                statuses=dict(self.statuses),
+                endpoints=endpoints,
+                slowest=slowest,
+            )
+
+    def write(self, path, summary=None):
+        """Appends the summary as one JSON line to a trace file, with the
+        time and the admin endpoint, so that runs can be compared later.
+        A trace that can't be written is skipped; it never makes a
+        module fail."""
+
+        line = dict(summary or self.summary(), timestamp=time.time(), admin=self.base_url)
+        try:
+            with open(path, "a") as trace:
+                trace.write(json.dumps(line, sort_keys=True) + "\n")
+        except (IOError, OSError):
+            pass
@@ -0,0 +1,1693 @@
+import hashlib, re, time
+from functools import partial
+from itertools import islice
+
+try:
+    from ansible.module_utils.six import string_types
+    from ansible.module_utils.six.moves.urllib.parse import urlparse
+    from ansible.module_utils.kong_client import get_client, unchanged_response, KongError, KongIndex
+    from ansible.module_utils.kong_engine import KongEngine, Operation, result
+    from ansible.module_utils.kong_metrics import clock
+except ImportError:
+    from six import string_types
+    from six.moves.urllib.parse import urlparse
+    from .kong_client import get_client, unchanged_response, KongError, KongIndex
+    from .kong_engine import KongEngine, Operation, result
+    from .kong_metrics import clock
+
+CONSUMER_FIELDS = [
+    'username',
+    'custom_id',
+]
+
+# The collection of every credential of a plugin, by the path of a
+# consumer's credentials for it (/consumers/{id}/key-auth)
+CREDENTIAL_COLLECTIONS = {
+    'key-auth': 'key-auths',
+    'basic-auth': 'basic-auths',
+    'hmac-auth': 'hmac-auths',
+    'jwt': 'jwts',
+    'acls': 'acls',
+    'oauth2': 'oauth2',
+}
+
+# The path of a consumer's credentials, by the name of the plugin that
+# checks them
+CREDENTIAL_PLUGINS = {
+    'key-auth': 'key-auth',
+    'basic-auth': 'basic-auth',
+    'hmac-auth': 'hmac-auth',
+    'jwt': 'jwt',
+    'acl': 'acls',
+    'oauth2': 'oauth2',
+}
+
+# Fields Kong sets on every credential, which aren't part of its data
+CREDENTIAL_METADATA = ['id', 'consumer_id', 'created_at']
+
+# Credential fields Kong only stores hashed, by the path of the plugin's
+# credentials. They are left out of exports: the hash would be taken as
+# the secret itself when applied.
+CREDENTIAL_SECRETS = {
+    'basic-auth': ['password'],
+}
+
+# The field that tells a consumer's credentials of a plugin apart, by
+# the path of the plugin's credentials
+CREDENTIAL_KEYS = {
+    'key-auth': 'key',
+    'basic-auth': 'username',
+    'hmac-auth': 'username',
+    'jwt': 'key',
+    'acls': 'group',
+    'oauth2': 'client_id',
+}
+
+CREDENTIAL_STATES = ['present', 'absent']
+
+API_FIELDS = [
+    'name',
+    'upstream_url',
+    'request_host',
+    'request_path',
+    'strip_request_path',
+    'preserve_host'
+]
+
+API_DEFAULTS = {
+    'strip_request_path': False,
+    'preserve_host': False,
+}
+
+UPSTREAM_FIELDS = [
+    'name',
+    'slots',
+    'healthchecks',
+]
+
+# The weight Kong gives a target it is not told one for, and the port
+# it gives a target address without one
+DEFAULT_TARGET_WEIGHT = 100
+DEFAULT_TARGET_PORT = 8000
+
+TARGET_STATES = ['present', 'drained', 'absent']
+
+# Target health, as Kong reports it, that lets a rotation go on
+READY_HEALTH = ['HEALTHY', 'HEALTHCHECKS_OFF']
+DEFAULT_ROTATION_TIMEOUT = 60
+DEFAULT_ROTATION_INTERVAL = 1
+
+def prepare_api(item, fields=API_FIELDS):
+    """Picks the known fields out of one API definition and fills in the
+    same defaults kong_api would. `plugins` become dicts of name and
+    config; an API with a `plugins` list, even an empty one, has its
+    plugins managed."""
+
+    data = {}
+    for field in fields:
+        value = item.get(field, API_DEFAULTS.get(field))
+        if value is not None:
+            data[field] = value
+
+    state = item.get("state", "present")
+    if state == "absent":
+        return {"name": data.get("name"), "state": state}
+
+    plugins = item.get("plugins")
+    if plugins is not None:
+        data["plugins"] = [
+            dict(name=plugin.get("name"), config=plugin.get("config"))
+            for plugin in plugins
+        ]
+    return data
+
+def validate_apis(apis):
+    """Returns an error message, or None if every API is usable"""
+
+    for api in apis:
+        if api.get("name") is None:
+            return "Every API needs a name"
+        if api.get("state", "present") == "present" and api.get("upstream_url") is None:
+            return "API {} needs an upstream_url" . format (api.get("name"))
+        for plugin in api.get("plugins") or []:
+            if plugin.get("name") is None:
+                return "Every plugin on API {} needs a name" . format (api.get("name"))
+    return None
+
+def prepare_consumer(item, fields=CONSUMER_FIELDS):
+    """Picks the known fields out of one consumer definition.
+    `credentials` become dicts of plugin and data."""
+
+    data = {}
+    for field in fields:
+        value = item.get(field)
+        if value not in [None, ""]:
+            data[field] = value
+
+    state = item.get("state") or "present"
+    if state == "absent":
+        data["state"] = state
+        return data
+
+    credentials = item.get("credentials")
+    if credentials:
+        data["credentials"] = [prepare_credential(credential) for credential in credentials]
+    return data
+
+def prepare_credential(credential):
+    """Turns one credential into a dict of plugin and data, and its state
+    if that is absent"""
+
+    prepared = dict(plugin=credential.get("plugin"), data=credential.get("data") or {})
+    if credential.get("state") not in [None, "", "present"]:
+        prepared["state"] = credential.get("state")
+    return prepared
+
+def validate_consumers(consumers):
+    """Returns an error message, or None if every consumer is usable"""
+
+    for consumer in consumers:
+        if consumer.get("username") is None and consumer.get("custom_id") is None:
+            return "Every consumer needs a username or a custom_id"
+        for credential in consumer.get("credentials", []):
+            if not credential.get("plugin"):
+                return "Every credential of consumer {} needs a plugin" . format (consumer.get("username") or consumer.get("custom_id"))
+            if credential.get("state", "present") not in CREDENTIAL_STATES:
+                return "The state of a credential of consumer {} must be one of: {}" . format (
+                    consumer.get("username") or consumer.get("custom_id"), ", " . join (CREDENTIAL_STATES))
+            field = CREDENTIAL_KEYS.get(credential.get("plugin"))
+            if credential.get("state") == "absent" and credential["data"].get(field) is None:
+                return "A credential of consumer {} to remove needs its {}" . format (
+                    consumer.get("username") or consumer.get("custom_id"), field or "data")
+    return None
+
+def basic_auth_hash(password, consumer_id):
+    """A basic-auth password as Kong stores it: the SHA1, in hex, of the
+    password salted with the consumer's id"""
+
+    return hashlib.sha1("{}{}" . format (password, consumer_id).encode("utf-8")).hexdigest()
+
+def credential_changes(plugin, current, data):
+    """The fields of `data` that differ on the `current` credential. A
+    basic-auth password is hashed the way Kong stores it to compare it."""
+
+    desired = dict(data)
+    changed = []
+    if plugin == "basic-auth" and desired.get("password") is not None:
+        password = desired.pop("password")
+        if basic_auth_hash(password, current.get("consumer_id")) != current.get("password"):
+            changed.append("password")
+    return sorted(changed + changed_fields(current, desired))
+
+def match_credential(plugin, existing, data, taken=()):
+    """The credential among `existing` that `data` stands for: the one
+    with the same key (or username, client_id, group) if data has one,
+    otherwise one that has all of data's values. Credentials whose id is
+    in `taken` are skipped. None if there is no match."""
+
+    field = CREDENTIAL_KEYS.get(plugin)
+    for candidate in existing:
+        if candidate.get("id") in taken:
+            continue
+        if field is not None and data.get(field) is not None:
+            if normalise(candidate.get(field)) == normalise(data[field]):
+                return candidate
+        elif not credential_changes(plugin, candidate, data):
+            return candidate
+    return None
+
+def entry_age(entry, now):
+    """The seconds since Kong created an entry. Kong gives created_at in
+    milliseconds before 0.13 and in seconds since."""
+
+    created = entry.get("created_at") or 0
+    if created > 1e11:
+        created = created / 1000.0
+    return now - created
+
+def target_address(target):
+    """A target as Kong stores it, host:port, with Kong's default port
+    added if it has none, so that both forms compare equal"""
+
+    target = str(target).strip()
+    if target.startswith("["):
+        if target.endswith("]"):
+            return "{}:{}" . format (target, DEFAULT_TARGET_PORT)
+        return target
+    if ":" not in target:
+        return "{}:{}" . format (target, DEFAULT_TARGET_PORT)
+    return target
+
+def prepare_target(item):
+    """Turns one target, a host:port string or a dict of target, weight
+    and state, into a dict of all three"""
+
+    if not isinstance(item, dict):
+        item = dict(target=item)
+    state = item.get("state") or "present"
+    weight = item.get("weight")
+    if weight is None:
+        weight = 0 if state == "drained" else DEFAULT_TARGET_WEIGHT
+    address = item.get("target")
+    if address not in (None, ""):
+        address = target_address(address)
+    return dict(target=address, weight=int(weight), state=state)
+
+def validate_targets(targets):
+    """Returns an error message, or None if every target is usable"""
+
+    for target in targets:
+        if target.get("target") in (None, ""):
+            return "Every target needs an address"
+        if target.get("state") not in TARGET_STATES:
+            return "The state of target {} must be one of: {}" . format (target.get("target"), ", " . join (TARGET_STATES))
+        if not 0 <= target.get("weight") <= 1000:
+            return "The weight of target {} must be between 0 and 1000" . format (target.get("target"))
+    return None
+
+def api_upstream(api):
+    """The upstream an API sends its requests to: the host of its
+    upstream_url"""
+
+    return urlparse(api.get("upstream_url") or "").hostname
+
+def flatten(entry, prefix=""):
+    """Flattens nested objects into the dotted keys Kong accepts in form
+    data, e.g. {"config": {"minute": 20}} becomes {"config.minute": 20}"""
+
+    flat = {}
+    for key, value in entry.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, "{}{}." . format (prefix, key)))
+        else:
+            flat["{}{}" . format (prefix, key)] = value
+    return flat
+
+def normalise(value):
+    """Brings a desired or current value to a comparable form: yes/no and
+    true/false strings become booleans, numbers become strings, and
+    comma separated strings and lists become sorted lists"""
+
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, string_types):
+        value = value.strip()
+        lowered = value.lower()
+        if lowered in ("true", "yes"):
+            return True
+        if lowered in ("false", "no"):
+            return False
+        if "," not in value:
+            return value
+        value = value.split(",")
+    if isinstance(value, (list, tuple)):
+        items = sorted(normalise(item) for item in value if item not in ("", None))
+        if len(items) == 1:
+            return items[0]
+        return items
+    return value
+
+def changed_fields(current, desired):
+    """Returns the fields of `desired` whose values differ from those of
+    the `current` entry. A field missing from `current` matches an empty
+    or false desired value, since that is what Kong defaults it to."""
+
+    current = flatten(current)
+    changed = []
+    for field, value in desired.items():
+        have = normalise(current.get(field))
+        want = normalise(value)
+        if have == want:
+            continue
+        if have in (None, []) and not want:
+            continue
+        changed.append(field)
+    return sorted(changed)
+
+def entry_diff(name, current, desired):
+    """An Ansible diff for one entry. `before` only shows the fields that
+    are in `desired`, unless the entry is going away."""
+
+    before = {}
+    if current is not None:
+        flat = flatten(current)
+        if desired:
+            before = dict((field, flat[field]) for field in desired if field in flat)
+        else:
+            before = flat
+    return dict(before_header=name, after_header=name, before=before, after=desired)
+
+def plan_entry(name, current, desired, state="present"):
+    """Works out what a write would do to one entry without making it.
+    Returns the action (create, update, delete or none) and its diff."""
+
+    if state == "absent":
+        if current is None:
+            return ("none", None)
+        return ("delete", entry_diff(name, current, {}))
+    if current is None:
+        return ("create", entry_diff(name, None, desired))
+    if changed_fields(current, desired):
+        return ("update", entry_diff(name, current, desired))
+    return ("none", None)
+
+class Selector:
+    """Picks the entries a prune deletes, by the names they go by (an API's
+    name, a consumer's username and custom_id). An entry is picked when
+    it matches every selector given: a name starts with `prefix`, a name
+    contains a match for `regex`, the entry carries all of `tags`, and
+    none of its names is in `keep`, the names that should stay. A
+    selector that is not given matches everything, so `given` tells
+    whether any was. `keep` may be empty, which keeps nothing."""
+
+    def __init__(self, prefix=None, regex=None, tags=None, keep=None):
+        self.prefix = prefix
+        self.regex = re.compile(regex) if regex is not None else None
+        self.tags = set(tags or [])
+        self.keep = set(keep) if keep is not None else None
+
+    @property
+    def given(self):
+        return self.prefix is not None or self.regex is not None or bool(self.tags) or self.keep is not None
+
+    def matches(self, names, entry):
+        names = [name for name in names if name is not None]
+        if self.keep is not None and any(name in self.keep for name in names):
+            return False
+        if self.prefix is not None and not any(name.startswith(self.prefix) for name in names):
+            return False
+        if self.regex is not None and not any(self.regex.search(name) for name in names):
+            return False
+        return self.tags.issubset(entry.get("tags") or [])
+
+def prune_operation(name, entry, delete):
+    """The operation that deletes a picked entry by its id"""
+
+    return Operation(name, "delete", partial(delete, entry.get("id")), entry_diff(name, entry, {}))
+
+def run_stages(engine, stages, check_mode=False):
+    """Runs (kind, operations) stages through `engine`, one after the
+    other, and tags each result with the kind of entry it is for"""
+
+    results = []
+    for kind, operations in stages:
+        for outcome in engine.run([operations], check_mode):
+            outcome['kind'] = kind
+            results.append(outcome)
+    return results
+
+class KongAPI:
+
+    def __init__(self, base_url, auth_username=None, auth_password=None, client=None):
+        self.base_url = base_url
+        if client is None:
+            client = get_client(base_url, auth_username, auth_password)
+        self.client = client
+        self.index = KongIndex("name")
+
+    def __url(self, path):
+        return "{}{}" . format (self.base_url, path)
+
+    def _load_index(self):
+        return self.index.ensure(self.iterate)
+
+    @staticmethod
+    def _data(name, upstream_url, request_host=None, request_path=None, strip_request_path=False, preserve_host=False):
+
+        data = {
+            "name": name,
+            "upstream_url": upstream_url,
+            "strip_request_path": strip_request_path,
+            "preserve_host": preserve_host
+        }
+        if request_host is not None:
+            data['request_host'] = request_host
+        if request_path is not None:
+            data['request_path'] = request_path
+        return data
+
+    def add_or_update(self, name, upstream_url, request_host=None, request_path=None, strip_request_path=False, preserve_host=False):
+
+        method = "post"        
+        url = self.__url("/apis/")
+        current = self.find(name)
+
+        if current is not None:
+            method = "patch"
+            url = "{}{}" . format (url, name)
+
+        data = self._data(name, upstream_url, request_host, request_path, strip_request_path, preserve_host)
+
+        if current is not None and not changed_fields(current, data):
+            return unchanged_response(url, current)
+
+        recheck = partial(self._fetch, name) if current is None else None
+        return self.client.write(method, url, data, recheck, self.index.record)
+
+    def list(self):
+        url = self.__url("/apis")
+        return self.client.get(url)
+
+    def iterate(self, size=None):
+        """Yields every registered API, following Kong's pagination"""
+
+        url = self.__url("/apis")
+        return self.client.iterate(url, size)
+
+    def info(self, id):
+        url = self.__url("/apis/{}" . format (id))
+        return self.client.get(url)
+
+    def find(self, name):
+        """Returns the API called `name`, or None if there is none. Uses
+        the index if it is loaded, otherwise a single GET by name, so the
+        cost doesn't grow with the number of registered APIs."""
+
+        if self.index.loaded:
+            return self.index.get(name)
+        return self._fetch(name)
+
+    def _fetch(self, name):
+        response = self.info(name)
+        if response.status_code == 404:
+            return None
+        if not response.ok:
+            raise KongError(response)
+        return response.json()
+
+    def plan(self, name, state="present", **fields):
+        """Returns the action and diff that add_or_update (or, for absent,
+        delete_by_name) would carry out, without writing anything"""
+
+        current = self.find(name)
+        if state == "absent":
+            return plan_entry(name, current, {}, state)
+        return plan_entry(name, current, self._data(name, **fields))
+
+    def delete_by_name(self, name):
+        api = self.index.get(name) if self.index.loaded else None
+        if api is None:
+            info = self.info(name)
+            if not info.ok:
+                return info
+            api = info.json()
+        return self.delete(api.get("id"))
+
+    def delete(self, id):
+        path = "/apis/{}" . format (id)
+        url = self.__url(path)
+        return self.client.write("delete", url, then=partial(self.index.record, removed=id))
+
+    def _plugins_by_api(self, apis):
+        """Lists every plugin once, grouped by api_id, when any of `apis`
+        has plugins to converge"""
+
+        if any(api.get("plugins") is not None for api in apis):
+            return self._all_plugins_by_api()
+        return {}
+
+    def _all_plugins_by_api(self, plugins=None):
+        """Groups every plugin, or those of `plugins`, a listing already
+        made, by api_id. Plugins scoped to a consumer are left out, as
+        they aren't the API's own."""
+
+        if plugins is None:
+            plugins = self.client.iterate(self.__url("/plugins"))
+        grouped = {}
+        for plugin in plugins:
+            if plugin.get("consumer_id") is None:
+                grouped.setdefault(plugin.get("api_id"), []).append(plugin)
+        return grouped
+
+    def export(self, plugins=None):
+        """Returns every registered API with its plugins, in the form
+        converge takes, from one listing of APIs and one of plugins
+        (unless `plugins` is that listing)"""
+
+        plugins = self._all_plugins_by_api(plugins)
+        apis = []
+        for api in sorted(self._load_index().entries(), key=lambda api: api.get("name")):
+            item = dict((field, api.get(field)) for field in API_FIELDS if api.get(field) is not None)
+            item["plugins"] = [
+                dict(name=plugin.get("name"), config=flatten(dict(config=plugin.get("config") or {})) or None)
+                for plugin in sorted(plugins.get(api.get("id"), []), key=lambda plugin: plugin.get("name"))
+            ]
+            apis.append(item)
+        return apis
+
+    def converge(self, apis, purge=False, engine=None, check_mode=False):
+        """Brings the registered APIs in line with `apis`. Each entry is a
+        dict of API_FIELDS plus an optional `state` of present or absent,
+        and an optional list of `plugins` (dicts with a name and config)
+        to add or update on the API. With purge, APIs that are not in
+        `apis` are deleted, and so are the plugins of a listed API that
+        are not in its `plugins`.
+
+        The plan is made from one listing of APIs, and one of plugins if
+        any are given. The writes then go through `engine`: APIs first,
+        then their plugins. In check mode nothing is written. Returns one
+        result dict per API or plugin, with a diff for each planned write:
+        the APIs in the order of `apis`, then the APIs purged, then the
+        plugins in the same order."""
+
+        if engine is None:
+            engine = KongEngine()
+
+        index = self._load_index()
+        existing_plugins = self._plugins_by_api(apis)
+        apis_stage = []
+        plugins_stage = []
+        desired = set()
+        for api in apis:
+            data = dict(api)
+            name = data.get("name")
+            state = data.pop("state", "present")
+            plugins = data.pop("plugins", None)
+            current = index.get(name)
+            desired.add(name)
+
+            action, diff = self.plan(state=state, **data)
+            if action == "none":
+                apis_stage.append(result(name, action))
+            elif action == "delete":
+                apis_stage.append(Operation(name, action, partial(self.delete, current.get("id")), diff))
+            else:
+                apis_stage.append(Operation(name, action, partial(self.add_or_update, **data), diff))
+
+            if state == "present" and plugins is not None:
+                api_plugins = KongPlugin(self.base_url, name, client=self.client)
+                api_plugins.index.load(existing_plugins.get(current.get("id"), []) if current else [])
+                for plugin in plugins:
+                    plugin_name = "{}/{}" . format (name, plugin.get("name"))
+                    action, diff = api_plugins.plan(**plugin)
+                    if action == "none":
+                        plugins_stage.append(result(plugin_name, action))
+                    else:
+                        plugins_stage.append(Operation(plugin_name, action, partial(api_plugins.add_or_update, **plugin), diff))
+
+                if purge:
+                    wanted = set(plugin.get("name") for plugin in plugins)
+                    for plugin in api_plugins.index.entries():
+                        if plugin.get("name") not in wanted:
+                            plugin_name = "{}/{}" . format (name, plugin.get("name"))
+                            diff = entry_diff(plugin_name, plugin, {})
+                            plugins_stage.append(Operation(plugin_name, "delete", partial(api_plugins.delete, plugin.get("id")), diff))
+
+        if purge:
+            for current in index.entries():
+                name = current.get("name")
+                if name not in desired:
+                    diff = entry_diff(name, current, {})
+                    apis_stage.append(Operation(name, "delete", partial(self.delete, current.get("id")), diff))
+
+        return engine.run([apis_stage, plugins_stage], check_mode)
+
+    def prune(self, selector, engine=None, check_mode=False):
+        """Deletes the APIs `selector` picks, with their plugins. The APIs
+        are picked from one paginated scan, and their plugins, including
+        the ones scoped to a consumer on a picked API, from one scan of
+        the plugins if any API was picked. The plugins are deleted first,
+        then the APIs, each stage through `engine`. In check mode nothing
+        is deleted, and the results preview what would be. Returns one
+        result dict per API or plugin, tagged with its kind."""
+
+        if engine is None:
+            engine = KongEngine()
+
+        picked = sorted((api for api in self._load_index().entries() if selector.matches([api.get("name")], api)),
+                        key=lambda api: api.get("name"))
+        names = dict((api.get("id"), api.get("name")) for api in picked)
+        plugins_stage = []
+        if picked:
+            plugins = KongPlugin(self.base_url, client=self.client)
+            for plugin in self.client.iterate(self.__url("/plugins")):
+                if plugin.get("api_id") in names:
+                    plugin_name = "{}/{}" . format (names[plugin.get("api_id")], plugin.get("name"))
+                    plugins_stage.append(prune_operation(plugin_name, plugin, plugins.delete))
+
+        apis_stage = [prune_operation(api.get("name"), api, self.delete) for api in picked]
+        return run_stages(engine, [("plugin", plugins_stage), ("api", apis_stage)], check_mode)
+
+class KongPlugin:
+    """The plugins of one scope: those of an API, given `api_name`, those
+    of a consumer, given `consumer` (a username or id), those of a
+    consumer on an API, given both, or the global plugins, that apply to
+    every API and consumer, given neither. A plugin is looked up by
+    name within its scope."""
+
+    def __init__(self, base_url, api_name=None, auth_username=None, auth_password=None, client=None, consumer=None):
+        self.admin_url = base_url
+        if api_name is not None:
+            self.base_url = "{}/apis/{}/plugins" . format(base_url, api_name)
+        else:
+            self.base_url = "{}/plugins" . format(base_url)
+        if client is None:
+            client = get_client(base_url, auth_username, auth_password)
+        self.client = client
+        self.api = api_name
+        self.consumer = consumer
+        self._consumer_id = None
+        self.index = KongIndex("name")
+
+    def list(self):
+        
+        return self.client.get(self.base_url)
+
+    def iterate(self, size=None):
+        """Yields every plugin in the scope, following Kong's pagination"""
+
+        for plugin in self.client.iterate(self.base_url, size, self._filters()):
+            if self._in_scope(plugin):
+                yield plugin
+
+    def _load_index(self):
+        return self.index.ensure(self.iterate)
+
+    def consumer_id(self):
+        """The id of the consumer the plugins are scoped to, looked up
+        once if the consumer was given by username"""
+
+        if self.consumer is not None and self._consumer_id is None:
+            response = self.client.get("{}/consumers/{}" . format (self.admin_url, self.consumer))
+            if not response.ok:
+                raise KongError(response)
+            self._consumer_id = response.json().get("id")
+        return self._consumer_id
+
+    def _filters(self, **filters):
+        if self.consumer is not None:
+            filters["consumer_id"] = self.consumer_id()
+        return filters
+
+    def _in_scope(self, plugin):
+        """Kong can filter a listing by consumer_id, but not for plugins
+        without one, so an API's own plugins and the global ones are
+        picked out here"""
+
+        if plugin.get("consumer_id") != self.consumer_id():
+            return False
+        return self.api is not None or plugin.get("api_id") is None
+
+    def find(self, name):
+        """Returns the plugin called `name` in the scope, or None. Uses
+        the index if it is loaded, otherwise Kong's filtered listing of
+        plugins by name (and consumer_id), rather than listing them all.
+        With the cache on, the index is loaded from the scope's listing
+        instead, which the tasks for other plugins of the scope reuse."""
+
+        if self.index.loaded:
+            return self.index.get(name)
+        if self.client.cache is not None:
+            return self._load_index().get(name)
+        return self._fetch(name)
+
+    def _fetch(self, name):
+        """Looks the plugin up on Kong rather than in the index"""
+
+        for plugin in self.client.iterate(self.base_url, params=self._filters(name=name)):
+            if plugin.get("name") == name and self._in_scope(plugin):
+                return plugin
+        return None
+
+    def _data(self, name, config=None):
+
+        data = {
+            "name": name,
+        }
+        if self.consumer is not None:
+            data["consumer_id"] = self.consumer_id()
+        if config is not None:
+            data.update(config)   
+        return data
+
+    def plan(self, name, config=None, state="present"):
+        """Returns the action and diff that add_or_update would carry out,
+        without writing anything"""
+
+        current = self.find(name)
+        return plan_entry(name, current, self._data(name, config), state)
+
+    def add_or_update(self, name, config=None):
+        
+        # does it exist already?
+        plugin = self.find(name)
+        data = self._data(name, config)
+
+        if plugin is None:            
+            return self.client.write("post", self.base_url, data, partial(self._fetch, name), self.index.record)
+
+        url = "{}/{}" . format (self.base_url, plugin.get("id"))
+        if not changed_fields(plugin, data):
+            return unchanged_response(url, plugin)
+        return self.client.write("patch", url, data, then=self.index.record)
+
+    def delete(self, id):
+
+        url = "{}/{}" . format (self.base_url, id)
+        return self.client.write("delete", url, then=partial(self.index.record, removed=id))
+
+def prepare_plugin(item):
+    """Picks the known fields out of one plugin that isn't an API's own:
+    its name and config, the `api` (a name) and `consumer` (a username
+    or id) it is scoped to, and its state if that is absent"""
+
+    data = dict(name=item.get("name"), config=item.get("config"))
+    for field in ["api", "consumer"]:
+        if item.get(field) not in [None, ""]:
+            data[field] = item.get(field)
+    if item.get("state") == "absent":
+        data["state"] = "absent"
+    return data
+
+def validate_plugins(plugins):
+    """Returns an error message, or None if every plugin is usable"""
+
+    for plugin in plugins:
+        if plugin.get("name") is None:
+            return "Every plugin needs a name"
+        if plugin.get("api") is not None and plugin.get("consumer") is None:
+            return "Plugin {} of API {} goes with the API, in its plugins" . format (plugin.get("name"), plugin.get("api"))
+    return None
+
+class KongSharedPlugins:
+    """The plugins that aren't an API's own: the global plugins, and the
+    ones scoped to a consumer, on one API or on all of them. A plugin is
+    known by its name and its scope, the name of its `api` and the
+    username (or id) of its `consumer`, which are looked up in the
+    indexes of `apis` and `consumers`, a KongAPI and a KongConsumer."""
+
+    def __init__(self, apis, consumers):
+        self.base_url = apis.base_url
+        self.client = apis.client
+        self.apis = apis
+        self.consumers = consumers
+
+    def iterate(self, plugins=None):
+        """Yields the scope and entry of every plugin that isn't an API's
+        own, from one listing of plugins (unless `plugins` is that
+        listing)"""
+
+        if plugins is None:
+            plugins = self.client.iterate("{}/plugins" . format (self.base_url))
+        apis = self.apis._load_index()
+        consumers = self.consumers._load_index()
+        for plugin in plugins:
+            api_id, consumer_id = plugin.get("api_id"), plugin.get("consumer_id")
+            if api_id is not None and consumer_id is None:
+                continue
+            api = apis.get_by_id(api_id) if api_id is not None else None
+            consumer = consumers.get_by_id(consumer_id) if consumer_id is not None else None
+            scope = (
+                (api or {}).get("name", api_id),
+                (consumer or {}).get("username") or consumer_id,
+            )
+            yield scope, plugin
+
+    def export(self, plugins=None):
+        """Returns every plugin that isn't an API's own, in the form
+        converge takes"""
+
+        exported = []
+        for (api, consumer), plugin in self.iterate(plugins):
+            item = dict(name=plugin.get("name"), config=flatten(dict(config=plugin.get("config") or {})) or None)
+            if api is not None:
+                item["api"] = api
+            if consumer is not None:
+                item["consumer"] = consumer
+            exported.append(item)
+        return sorted(exported, key=lambda item: (item.get("api") or "", item.get("consumer") or "", item.get("name")))
+
+    def _scope(self, api, consumer):
+        """The scope of a plugin as it is given, by the names iterate
+        gives it: an API or a consumer can be named by its id too"""
+
+        if api is not None:
+            entry = self.apis._load_index().get(api) or self.apis.index.get_by_id(api)
+            api = (entry or {}).get("name", api)
+        if consumer is not None:
+            entry = self.consumers._load_index().get(consumer) or self.consumers.index.get_by_id(consumer)
+            consumer = (entry or {}).get("username") or (entry or {}).get("id") or consumer
+        return (api, consumer)
+
+    def _plugins(self, scope, existing):
+        """A KongPlugin for one scope, with its index loaded from the
+        plugins listed in it"""
+
+        api, consumer = scope
+        plugins = KongPlugin(self.base_url, api, client=self.client, consumer=consumer)
+        if consumer is not None:
+            entry = self.consumers.index.get(consumer) or self.consumers.index.get_by_id(consumer)
+            plugins._consumer_id = (entry or {}).get("id")
+        plugins.index.load(existing.get(scope, []))
+        return plugins
+
+    def converge(self, plugins, purge=False, engine=None, check_mode=False):
+        """Brings the plugins that aren't an API's own in line with
+        `plugins`, dicts of a name, config, scope (see prepare_plugin)
+        and state. With purge, the ones that are not in `plugins` are
+        deleted. The plan is made from one listing of plugins. Returns
+        one result dict per plugin, with a diff for each planned write."""
+
+        if engine is None:
+            engine = KongEngine()
+
+        existing = {}
+        for scope, plugin in self.iterate():
+            existing.setdefault(scope, []).append(plugin)
+
+        scopes = {}
+        operations = []
+        desired = set()
+        for plugin in plugins:
+            data = dict(plugin)
+            state = data.pop("state", "present")
+            scope = self._scope(data.pop("api", None), data.pop("consumer", None))
+            if scope not in scopes:
+                scopes[scope] = self._plugins(scope, existing)
+            scope_plugins = scopes[scope]
+            name = shared_plugin_name(scope, data.get("name"))
+            desired.add((scope, data.get("name")))
+
+            if scope[1] is not None and scope_plugins._consumer_id is None:
+                # The consumer isn't there yet, so neither is its plugin
+                # (in check mode, it would have been added before it)
+                action, diff = plan_entry(name, None, dict(data, consumer=scope[1]), state)
+            else:
+                action, diff = scope_plugins.plan(state=state, **data)
+            if action == "none":
+                operations.append(result(name, action))
+            elif action == "delete":
+                operations.append(Operation(name, action, partial(scope_plugins.delete, scope_plugins.find(data.get("name")).get("id")), diff))
+            else:
+                operations.append(Operation(name, action, partial(scope_plugins.add_or_update, **data), diff))
+
+        if purge:
+            for scope, entries in existing.items():
+                for plugin in entries:
+                    if (scope, plugin.get("name")) not in desired:
+                        name = shared_plugin_name(scope, plugin.get("name"))
+                        scope_plugins = scopes.get(scope) or self._plugins(scope, existing)
+                        operations.append(prune_operation(name, plugin, scope_plugins.delete))
+
+        return engine.run([operations], check_mode)
+
+def shared_plugin_name(scope, name):
+    """How a plugin that isn't an API's own is named in results: by its
+    API and consumer, if it has them, then its own name"""
+
+    return "/" . join (part for part in list(scope) + [name] if part is not None)
+
+def plan_credentials(consumer, username, custom_id, current, credentials, purge=False, grace=None, now=None):
+    """Yields the operations that give a consumer its credentials, and
+    results for the ones it already has. The operations call the
+    methods of `consumer`, a KongConsumer. A credential matches the one the consumer has with the same key (see
+    match_credential); it is updated if its other fields differ, and
+    deleted if its state is absent.
+
+    The other credentials the consumer has for the same plugins are
+    deleted with purge. With a `grace` period in seconds they are
+    deleted once the listed credentials of their plugin have all been
+    in place that long, and kept until then, so old keys keep working
+    while clients move to the new ones."""
+
+    name = username or custom_id
+    matched = set()
+    youngest = {}
+    for credential in credentials:
+        plugin = credential.get("plugin")
+        data = credential.get("data") or {}
+        credential_name = "{}/{}" . format (name, plugin)
+
+        existing = consumer._existing_credentials(plugin, current.get("id")) if current else []
+        match = match_credential(plugin, existing, data, matched)
+        if match is not None:
+            matched.add(match.get("id"))
+
+        if credential.get("state") == "absent":
+            if match is None:
+                yield result(credential_name, "none")
+            else:
+                diff = entry_diff(credential_name, match, {})
+                yield Operation(credential_name, "delete", partial(consumer.delete_credential, current.get("id"), plugin, match.get("id")), diff)
+            continue
+
+        if match is None:
+            youngest[plugin] = 0
+            action, diff = plan_entry(credential_name, None, data)
+            yield Operation(credential_name, action, partial(consumer._configure, username, custom_id, plugin, data), diff)
+            continue
+
+        age = entry_age(match, now if now is not None else time.time())
+        youngest[plugin] = min(age, youngest.get(plugin, age))
+        if credential_changes(plugin, match, data):
+            diff = entry_diff(credential_name, match, data)
+            yield Operation(credential_name, "update", partial(consumer.update_credential, current.get("id"), plugin, match.get("id"), data), diff)
+        else:
+            yield result(credential_name, "none")
+
+    if not current or (not purge and grace is None):
+        return
+    for plugin in youngest:
+        credential_name = "{}/{}" . format (name, plugin)
+        for candidate in consumer._existing_credentials(plugin, current.get("id")):
+            if candidate.get("id") in matched:
+                continue
+            if grace is not None and youngest[plugin] < grace:
+                yield result(credential_name, "keep")
+                continue
+            diff = entry_diff(credential_name, candidate, {})
+            yield Operation(credential_name, "delete", partial(consumer.delete_credential, current.get("id"), plugin, candidate.get("id")), diff)
+
+class KongConsumer:
+
+    def __init__(self, base_url, auth_username=None, auth_password=None, client=None):
+        self.admin_url = base_url
+        self.base_url = "{}/consumers" . format(base_url)
+        if client is None:
+            client = get_client(base_url, auth_username, auth_password)
+        self.client = client
+        self.index = KongIndex("username")
+        self.custom_ids = KongIndex("custom_id")
+        self._credentials = {}
+
+    def list(self):
+        return self.client.get(self.base_url)
+
+    def iterate(self, size=None):
+        """Yields every consumer, following Kong's pagination"""
+
+        return self.client.iterate(self.base_url, size)
+
+    def _load_index(self):
+        """Lists the consumers once into two indexes, by username and by
+        custom_id, as a consumer may have either"""
+
+        if not self.index.loaded:
+            consumers = list(self.iterate())
+            self.index.load(consumers)
+            self.custom_ids.load(consumers)
+        return self.index
+
+    def _record(self, response, removed=None):
+        self.index.record(response, removed)
+        self.custom_ids.record(response, removed)
+
+    @staticmethod
+    def _data(username=None, custom_id=None):
+
+        data = {}
+        if username is not None:
+            data['username'] = username
+        if custom_id is not None:
+            data['custom_id'] = custom_id
+        return data
+
+    def add(self, username=None, custom_id=None):
+
+        assert [username, custom_id] != [None, None], \
+            'Please provide at least one of username or custom_id'
+
+        data = self._data(username, custom_id)
+
+        current = self.find(username, custom_id)
+        if current is None:
+            return self.client.write("post", self.base_url, data, partial(self._fetch, username, custom_id), self._record)
+        elif not changed_fields(current, data):
+            return unchanged_response(self.base_url, current)
+        else:
+            url = "{}/{}" . format (self.base_url, current.get("id"))
+            return self.client.write("patch", url, data, then=self._record)
+
+    def find(self, username=None, custom_id=None):
+        """Returns the consumer with this username, or if no username is
+        given, the one with this custom_id. None if there is no match.
+        Uses the indexes if they are loaded."""
+
+        if self.index.loaded:
+            if username is None:
+                return self.custom_ids.get(custom_id)
+            return self.index.get(username)
+        return self._fetch(username, custom_id)
+
+    def _fetch(self, username=None, custom_id=None):
+        if username is None:
+            for consumer in self.client.iterate(self.base_url, params={"custom_id": custom_id}):
+                return consumer
+            return None
+
+        response = self.client.get("{}/{}" . format (self.base_url, username))
+        if response.status_code == 404:
+            return None
+        if not response.ok:
+            raise KongError(response)
+        return response.json()
+
+    def plan(self, username=None, custom_id=None, state="present"):
+        """Returns the action and diff that add (or, for absent, delete)
+        would carry out, without writing anything"""
+
+        current = self.find(username, custom_id)
+        return plan_entry(username or custom_id, current, self._data(username, custom_id), state)
+
+    def plan_credential(self, username_or_id, plugin, data, state="present"):
+        """Returns the action and diff configure_for_plugin (or, for absent,
+        unconfigure_for_plugin) would carry out: none if the consumer
+        already has the credential as it is, or doesn't have it to remove"""
+
+        current = match_credential(plugin, self.credentials(username_or_id, plugin), data)
+        if state == "absent":
+            return plan_entry(plugin, current, {}, state)
+        if current is not None and not credential_changes(plugin, current, data):
+            return ("none", None)
+        return plan_entry(plugin, current, data)
+
+    def delete(self, id):
+        url = "{}/{}" . format (self.base_url, id)
+        return self.client.write("delete", url, then=partial(self._record, removed=id))
+
+    def credentials(self, username_or_id, plugin):
+        """Lists the consumer's credentials for the plugin"""
+
+        url = "{}/{}/{}" . format (self.base_url, username_or_id, plugin)
+        return list(self.client.iterate(url))
+
+    def configure_for_plugin(self, username_or_id, api, data):
+        """Gives the consumer a credential for the plugin (`api`). The one
+        it has with the same key, username or client_id is updated if it
+        differs, so running this again doesn't add a duplicate."""
+
+        url = "{}/{}/{}" . format (self.base_url, username_or_id, api)
+        current = match_credential(api, self.credentials(username_or_id, api), data)
+        if current is None:
+            return self.add_credential(username_or_id, api, data)
+        if not credential_changes(api, current, data):
+            return unchanged_response(url, current)
+        return self.update_credential(username_or_id, api, current.get("id"), data)
+
+    def unconfigure_for_plugin(self, username_or_id, api, data):
+        """Removes the consumer's credential for the plugin that `data`
+        stands for, if it has one"""
+
+        url = "{}/{}/{}" . format (self.base_url, username_or_id, api)
+        current = match_credential(api, self.credentials(username_or_id, api), data)
+        if current is None:
+            return unchanged_response(url, {})
+        return self.delete_credential(username_or_id, api, current.get("id"))
+
+    def add_credential(self, username_or_id, plugin, data):
+
+        url = "{}/{}/{}" . format (self.base_url, username_or_id, plugin)
+        return self.client.write("post", url, data)
+
+    def update_credential(self, username_or_id, plugin, id, data):
+
+        url = "{}/{}/{}/{}" . format (self.base_url, username_or_id, plugin, id)
+        return self.client.write("patch", url, data)
+
+    def delete_credential(self, username_or_id, plugin, id):
+
+        url = "{}/{}/{}/{}" . format (self.base_url, username_or_id, plugin, id)
+        return self.client.write("delete", url)
+
+    def _existing_credentials(self, plugin, consumer_id):
+        """The credentials of one plugin the consumer has. Every credential
+        of the plugin is listed once from its own collection, such as
+        /key-auths; if Kong has no such collection, each consumer's
+        credentials are listed instead."""
+
+        if plugin not in self._credentials:
+            self._credentials[plugin] = self._credentials_by_consumer(plugin)
+
+        grouped = self._credentials[plugin]
+        if grouped is None:
+            url = "{}/{}/{}" . format (self.base_url, consumer_id, plugin)
+            return list(self.client.iterate(url))
+        return grouped.get(consumer_id, [])
+
+    def _credentials_by_consumer(self, plugin):
+        collection = CREDENTIAL_COLLECTIONS.get(plugin)
+        if collection is None:
+            return None
+
+        grouped = {}
+        try:
+            for credential in self.client.iterate("{}/{}" . format (self.admin_url, collection)):
+                grouped.setdefault(credential.get("consumer_id"), []).append(credential)
+        except KongError as error:
+            if error.response.status_code != 404:
+                raise
+            return None
+        return grouped
+
+    def _consumer_ref(self, username, custom_id):
+        """The username, or if there is none the id, to address a
+        consumer by once it exists"""
+
+        if username is not None:
+            return username
+        current = self.find(None, custom_id)
+        if current is None:
+            raise ValueError("There is no consumer with custom_id {}" . format (custom_id))
+        return current.get("id")
+
+    def _configure(self, username, custom_id, plugin, data):
+        return self.add_credential(self._consumer_ref(username, custom_id), plugin, data)
+
+    def converge(self, consumers, purge=False, engine=None, check_mode=False, grace=None):
+        """Brings the consumers in line with `consumers`, which may be any
+        iterable, such as a generator reading a file. Each entry is a dict
+        of CONSUMER_FIELDS plus an optional `state` of present or absent,
+        and an optional list of `credentials` (dicts with a plugin, such
+        as key-auth, the data to configure it with and an optional state).
+        With purge, consumers that are not in `consumers` are deleted, and
+        so are the credentials a listed consumer has beyond the ones given
+        for the same plugin. With a `grace` period, those credentials are
+        only deleted once the listed ones are that many seconds old, which
+        is how keys are rotated (see plan_credentials).
+
+        The plan is made from one listing of consumers, and one listing
+        per credential plugin where Kong has a collection for it. The
+        consumers are planned and written as they are read: consumers
+        first, then their credentials. Returns one result dict per
+        consumer or credential: the consumers in the order of `consumers`,
+        then the consumers purged, then the credentials in the same order."""
+
+        if engine is None:
+            engine = KongEngine()
+
+        now = time.time()
+        index = self._load_index()
+        existing = index.entries()
+        credentials_stage = []
+        desired = set()
+
+        def consumers_stage():
+            for consumer in consumers:
+                data = dict(consumer)
+                state = data.pop("state", "present")
+                credentials = data.pop("credentials", None) or []
+                username, custom_id = data.get("username"), data.get("custom_id")
+                name = username or custom_id
+                current = self.find(username, custom_id)
+                if current is not None:
+                    desired.add(current.get("id"))
+
+                action, diff = plan_entry(name, current, self._data(username, custom_id), state)
+                if action == "none":
+                    yield result(name, action)
+                elif action == "delete":
+                    yield Operation(name, action, partial(self.delete, current.get("id")), diff)
+                else:
+                    yield Operation(name, action, partial(self.add, username, custom_id), diff)
+
+                if state == "present":
+                    credentials_stage.extend(plan_credentials(self, username, custom_id, current, credentials, purge, grace, now))
+
+            if purge:
+                for current in existing:
+                    if current.get("id") not in desired:
+                        name = current.get("username") or current.get("custom_id")
+                        diff = entry_diff(name, current, {})
+                        yield Operation(name, "delete", partial(self.delete, current.get("id")), diff)
+
+        return engine.run([consumers_stage(), credentials_stage], check_mode)
+
+    def prune(self, selector, plugins=None, engine=None, check_mode=False):
+        """Deletes the consumers `selector` picks, with their credentials
+        for `plugins` (credential paths such as key-auth; by default every
+        one Kong has a collection for) and the plugins scoped to them.
+        The consumers are picked from one paginated scan. If any are,
+        each credential collection and the plugins are scanned once. The
+        credentials of a plugin without a collection on this Kong are
+        left for Kong to remove along with the consumer. The credentials
+        are deleted first, then the plugins, then the consumers, each
+        stage through `engine`.
+        In check mode nothing is deleted. Returns one result dict per
+        consumer, credential or plugin, tagged with its kind."""
+
+        if engine is None:
+            engine = KongEngine()
+
+        picked = sorted((consumer for consumer in self._load_index().entries()
+                         if selector.matches([consumer.get("username"), consumer.get("custom_id")], consumer)),
+                        key=lambda consumer: consumer.get("username") or consumer.get("custom_id") or "")
+        names = dict((consumer.get("id"), consumer.get("username") or consumer.get("custom_id")) for consumer in picked)
+        credentials_stage = []
+        plugins_stage = []
+        if picked:
+            for plugin in sorted(CREDENTIAL_COLLECTIONS) if plugins is None else plugins:
+                grouped = self._credentials_by_consumer(plugin) or {}
+                for consumer_id in names:
+                    for credential in grouped.get(consumer_id, []):
+                        credential_name = "{}/{}" . format (names[consumer_id], plugin)
+                        credentials_stage.append(prune_operation(credential_name, credential, partial(self.delete_credential, consumer_id, plugin)))
+
+            consumer_plugins = KongPlugin(self.admin_url, client=self.client)
+            for plugin in self.client.iterate("{}/plugins" . format (self.admin_url)):
+                if plugin.get("consumer_id") in names:
+                    plugin_name = "{}/{}" . format (names[plugin.get("consumer_id")], plugin.get("name"))
+                    plugins_stage.append(prune_operation(plugin_name, plugin, consumer_plugins.delete))
+
+        consumers_stage = [prune_operation(names[consumer.get("id")], consumer, self.delete) for consumer in picked]
+        stages = [("credential", credentials_stage), ("plugin", plugins_stage), ("consumer", consumers_stage)]
+        return run_stages(engine, stages, check_mode)
+
+    def export(self, plugins):
+        """Returns every consumer, with its credentials for `plugins`
+        (credential paths such as key-auth), in the form converge takes"""
+
+        consumers = []
+        for consumer in sorted(self._load_index().entries(), key=lambda consumer: consumer.get("username") or consumer.get("custom_id") or ""):
+            credentials = [(plugin, self._existing_credentials(plugin, consumer.get("id"))) for plugin in plugins]
+            consumers.append(self._export_item(consumer, credentials))
+        return consumers
+
+    def _export_item(self, consumer, credentials):
+        """One consumer in the form converge takes, given its credentials
+        as (plugin, credentials) pairs. The fields Kong only stores
+        hashed, such as basic-auth passwords, are left out."""
+
+        item = dict((field, consumer.get(field)) for field in CONSUMER_FIELDS if consumer.get(field) is not None)
+        exported = []
+        for plugin, entries in credentials:
+            secrets = CREDENTIAL_SECRETS.get(plugin, [])
+            for credential in entries:
+                data = dict((key, value) for key, value in credential.items() if key not in CREDENTIAL_METADATA and key not in secrets)
+                exported.append(dict(plugin=plugin, data=data))
+        if exported:
+            item["credentials"] = exported
+        return item
+
+    def stream(self, plugins=(), parallelism=1):
+        """Yields every consumer, with its credentials for `plugins`, in
+        the form converge takes, one page of consumers at a time. Unlike
+        export, nothing is kept beyond the current page: each consumer's
+        credentials are listed on their own, `parallelism` consumers at
+        once, rather than from the collection of every credential."""
+
+        consumers = self.client.iterate(self.base_url, cached=False)
+        if not plugins:
+            for consumer in consumers:
+                yield self._export_item(consumer, [])
+            return
+
+        def credentials(consumer):
+            url = "{}/{}/{{}}" . format (self.base_url, consumer.get("id"))
+            return [(plugin, list(self.client.iterate(url.format(plugin), cached=False))) for plugin in plugins]
+
+        pool = None
+        if parallelism > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(parallelism)
+        try:
+            while True:
+                page = list(islice(consumers, self.client.page_size))
+                if not page:
+                    return
+                found = pool.map(credentials, page) if pool is not None else [credentials(consumer) for consumer in page]
+                for consumer, consumer_credentials in zip(page, found):
+                    yield self._export_item(consumer, consumer_credentials)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+class KongUpstream:
+    """The upstreams Kong balances requests over, by name. Each has a
+    number of `slots` in its balancer and optional `healthchecks`,
+    given as a nested dict and sent as dotted form keys."""
+
+    def __init__(self, base_url, auth_username=None, auth_password=None, client=None):
+        self.admin_url = base_url
+        self.base_url = "{}/upstreams" . format(base_url)
+        if client is None:
+            client = get_client(base_url, auth_username, auth_password)
+        self.client = client
+        self.index = KongIndex("name")
+
+    def iterate(self, size=None):
+        """Yields every upstream, following Kong's pagination"""
+
+        return self.client.iterate(self.base_url, size)
+
+    def _load_index(self):
+        return self.index.ensure(self.iterate)
+
+    def find(self, name):
+        """Returns the upstream called `name`, or None. Uses the index if
+        it is loaded, otherwise a single GET by name."""
+
+        if self.index.loaded:
+            return self.index.get(name)
+        return self._fetch(name)
+
+    def _fetch(self, name):
+        response = self.client.get("{}/{}" . format (self.base_url, name))
+        if response.status_code == 404:
+            return None
+        if not response.ok:
+            raise KongError(response)
+        return response.json()
+
+    def _data(self, name, slots=None, healthchecks=None):
+
+        data = {
+            "name": name,
+        }
+        if slots is not None:
+            data["slots"] = slots
+        if healthchecks:
+            data.update(flatten(dict(healthchecks=healthchecks)))
+        return data
+
+    def plan(self, name, state="present", **fields):
+        """Returns the action and diff that add_or_update (or, for absent,
+        delete_by_name) would carry out, without writing anything"""
+
+        current = self.find(name)
+        if state == "absent":
+            return plan_entry(name, current, {}, state)
+        return plan_entry(name, current, self._data(name, **fields))
+
+    def add_or_update(self, name, slots=None, healthchecks=None):
+
+        current = self.find(name)
+        data = self._data(name, slots, healthchecks)
+
+        if current is None:
+            response = self.client.post("{}/" . format (self.base_url), data, recheck=partial(self._fetch, name))
+        else:
+            url = "{}/{}" . format (self.base_url, current.get("id"))
+            if not changed_fields(current, data):
+                return unchanged_response(url, current)
+            response = self.client.patch(url, data)
+
+        self.index.record(response)
+        return response
+
+    def delete_by_name(self, name):
+        current = self.find(name)
+        if current is None:
+            return self.client.get("{}/{}" . format (self.base_url, name))
+        return self.delete(current.get("id"))
+
+    def delete(self, id):
+        response = self.client.delete("{}/{}" . format (self.base_url, id))
+        self.index.record(response, removed=id)
+        return response
+
+    def prune(self, selector, engine=None, check_mode=False):
+        """Deletes the upstreams `selector` picks from one paginated scan,
+        through `engine`. Their targets are not deleted first: a target's
+        entries are its history, and Kong removes them with the upstream.
+        Returns one result dict per upstream, tagged with its kind."""
+
+        if engine is None:
+            engine = KongEngine()
+
+        picked = sorted((upstream for upstream in self._load_index().entries() if selector.matches([upstream.get("name")], upstream)),
+                        key=lambda upstream: upstream.get("name"))
+        operations = [prune_operation(upstream.get("name"), upstream, self.delete) for upstream in picked]
+        return run_stages(engine, [("upstream", operations)], check_mode)
+
+    def targets(self, name):
+        return KongTarget(self.admin_url, name, client=self.client)
+
+class KongTarget:
+    """The targets of one upstream, by address (host:port).
+
+    Kong keeps every change to a target as a new entry, so the listing
+    is a history: the newest entry of each address is its current
+    weight. A target with weight 0 gets no new requests but finishes
+    the ones it has, which is how it is drained before it is removed."""
+
+    def __init__(self, base_url, upstream_name, auth_username=None, auth_password=None, client=None):
+        self.admin_url = base_url
+        self.upstream = upstream_name
+        self.base_url = "{}/upstreams/{}/targets" . format(base_url, upstream_name)
+        if client is None:
+            client = get_client(base_url, auth_username, auth_password)
+        self.client = client
+        self.index = KongIndex("target")
+
+    def iterate(self, size=None):
+        """Yields the current entry of every target, newest first"""
+
+        latest = {}
+        for entry in self.client.iterate(self.base_url, size):
+            address = entry.get("target")
+            if address not in latest or entry.get("created_at", 0) >= latest[address].get("created_at", 0):
+                latest[address] = entry
+        return iter(sorted(latest.values(), key=lambda entry: entry.get("created_at", 0), reverse=True))
+
+    def _load_index(self):
+        return self.index.ensure(self.iterate)
+
+    def active(self):
+        """The targets that take requests, those with a weight above 0"""
+
+        return [entry for entry in self._load_index().entries() if entry.get("weight")]
+
+    def find(self, target):
+        return self._load_index().get(target_address(target))
+
+    def _data(self, target, weight=DEFAULT_TARGET_WEIGHT):
+        return dict(target=target_address(target), weight=weight)
+
+    def plan(self, target, weight=DEFAULT_TARGET_WEIGHT, state="present"):
+        """Returns the action and diff a write of this target would carry
+        out, without writing anything. A target that isn't there counts
+        as drained already."""
+
+        current = self.find(target)
+        if state == "absent":
+            return plan_entry(target_address(target), current, {}, state)
+        if state == "drained":
+            if current is None or not current.get("weight"):
+                return ("none", None)
+            weight = 0
+        return plan_entry(target_address(target), current, self._data(target, weight))
+
+    def add_or_update(self, target, weight=DEFAULT_TARGET_WEIGHT):
+        """Adds the target, or gives it a new weight. Either way Kong
+        records a new entry for it."""
+
+        current = self.find(target)
+        data = self._data(target, weight)
+        if current is not None and not changed_fields(current, data):
+            return unchanged_response(self.base_url, current)
+
+        response = self.client.post(self.base_url, data, recheck=partial(self._fetch, data["target"], weight))
+        if response.ok and self.index.loaded:
+            self.index.remove(data["target"])
+        self.index.record(response)
+        return response
+
+    def _fetch(self, target, weight):
+        """Looks for a current entry of the target with this weight on
+        Kong, to tell whether a POST that failed went through"""
+
+        for entry in self.iterate():
+            if entry.get("target") == target:
+                return entry if entry.get("weight") == weight else None
+        return None
+
+    def drain(self, target):
+        """Sets the target's weight to 0"""
+
+        return self.add_or_update(target, 0)
+
+    def delete(self, target):
+        current = self.find(target)
+        if current is None:
+            return unchanged_response(self.base_url, {})
+        response = self.client.delete("{}/{}" . format (self.base_url, current.get("id")))
+        self.index.record(response, removed=current.get("id"))
+        return response
+
+    def health(self):
+        """The health of each target, by address, as Kong's active and
+        passive health checks see it. None if this Kong has no health
+        endpoint."""
+
+        response = self.client.get("{}/upstreams/{}/health" . format (self.admin_url, self.upstream))
+        if response.status_code == 404:
+            return None
+        if not response.ok:
+            raise KongError(response)
+        return dict((entry.get("target"), entry.get("health")) for entry in response.json().get("data", []))
+
+    def converge(self, targets, purge=False, engine=None, check_mode=False):
+        """Brings the targets of the upstream in line with `targets`, dicts
+        of target, weight and state (present, drained or absent). With
+        purge, targets that take requests but are not listed are removed.
+
+        The plan is made from one listing of the targets. Returns one
+        result dict per target, with a diff for each planned write, in the
+        order of `targets`, then the targets purged."""
+
+        if engine is None:
+            engine = KongEngine()
+
+        index = self._load_index()
+        operations = []
+        desired = set()
+        for item in targets:
+            address = target_address(item.get("target"))
+            state = item.get("state", "present")
+            weight = 0 if state == "drained" else item.get("weight", DEFAULT_TARGET_WEIGHT)
+            desired.add(address)
+
+            action, diff = self.plan(address, weight, state)
+            if action == "none":
+                operations.append(result(address, action))
+            elif action == "delete":
+                operations.append(Operation(address, action, partial(self.delete, address), diff))
+            else:
+                operations.append(Operation(address, action, partial(self.add_or_update, address, weight), diff))
+
+        if purge:
+            for current in index.entries():
+                if current.get("target") not in desired and current.get("weight"):
+                    diff = entry_diff(current.get("target"), current, {})
+                    operations.append(Operation(current.get("target"), "delete", partial(self.delete, current.get("target")), diff))
+
+        return engine.run([operations], check_mode)
+
+class TargetRotation:
+    """Moves the requests of one upstream from its current targets to
+    `targets` (prepared dicts of target and weight) without dropping
+    any. The new targets are added first, and once Kong reports them
+    all healthy the old ones are drained (weight 0), then removed after
+    `drain_time` seconds. If the new targets are not healthy within
+    `timeout` seconds, the old targets are left as they are.
+
+    A rotation is an operation of a KongEngine stage, so the rotations
+    of independent upstreams run concurrently. `progress` is called
+    with the upstream, each phase as it ends and the seconds it took."""
+
+    def __init__(self, kong_target, targets, timeout=DEFAULT_ROTATION_TIMEOUT, interval=DEFAULT_ROTATION_INTERVAL,
+                 drain_time=0, progress=None, sleep=time.sleep):
+        self.target = kong_target
+        self.name = kong_target.upstream
+        self.targets = targets
+        self.timeout = timeout
+        self.interval = interval
+        self.drain_time = drain_time
+        self.progress = progress
+        self.sleep = sleep
+
+    def plan(self):
+        """Returns the targets to add (or re-weight) and the addresses of
+        the targets to retire, from one listing of the upstream's targets"""
+
+        index = self.target._load_index()
+        wanted = set(item["target"] for item in self.targets)
+        writes = []
+        for item in self.targets:
+            current = index.get(item["target"])
+            if current is None or current.get("weight") != item["weight"]:
+                writes.append(item)
+        retired = sorted(entry.get("target") for entry in index.entries()
+                         if entry.get("weight") and entry.get("target") not in wanted)
+        return writes, retired
+
+    def diff(self):
+        before = dict((entry.get("target"), entry.get("weight")) for entry in self.target.active())
+        after = dict((item["target"], item["weight"]) for item in self.targets if item["weight"])
+        return dict(before_header=self.name, after_header=self.name, before=before, after=after)
+
+    def preview(self):
+        """The result the rotation is expected to have, for check mode"""
+
+        try:
+            writes, retired = self.plan()
+        except KongError as error:
+            return self._result("rotate", msg=str(error), response=error.response)
+        action = "rotate" if writes or retired else "none"
+        outcome = self._result(action, added=[item["target"] for item in writes], removed=retired)
+        outcome["changed"] = action == "rotate"
+        outcome["diff"] = self.diff()
+        return outcome
+
+    def wait(self, addresses):
+        """Polls the upstream's health until every address is ready, or the
+        timeout is up. Returns the addresses that are not ready. Without a
+        health endpoint there is nothing to wait for."""
+
+        deadline = clock() + self.timeout
+        while True:
+            health = self.target.health()
+            if health is None:
+                return []
+            waiting = [address for address in addresses if health.get(address) not in READY_HEALTH]
+            if not waiting or clock() >= deadline:
+                return waiting
+            self.sleep(self.interval)
+
+    def __call__(self):
+        started = clock()
+        timings = {}
+        added, drained, removed = [], [], []
+
+        def done(phase, since):
+            timings[phase] = round(clock() - since, 3)
+            if self.progress is not None:
+                self.progress(self.name, phase, timings[phase])
+
+        def checked(response):
+            if not response.ok:
+                raise KongError(response)
+            return response
+
+        try:
+            since = clock()
+            writes, retired = self.plan()
+            done("plan", since)
+            if not writes and not retired:
+                return self._result("none", timings=timings, elapsed=clock() - started)
+
+            since = clock()
+            for item in writes:
+                checked(self.target.add_or_update(item["target"], item["weight"]))
+                added.append(item["target"])
+            done("add", since)
+
+            since = clock()
+            waiting = self.wait([item["target"] for item in self.targets if item["weight"]])
+            done("wait", since)
+            if waiting:
+                msg = "Targets {} were not healthy after {}s, the old targets were left in place" . format (", " . join (waiting), self.timeout)
+                return self._result("rotate", added=added, timings=timings, elapsed=clock() - started, msg=msg)
+
+            since = clock()
+            for address in retired:
+                checked(self.target.drain(address))
+                drained.append(address)
+            if retired and self.drain_time:
+                self.sleep(self.drain_time)
+            done("drain", since)
+
+            since = clock()
+            for address in retired:
+                checked(self.target.delete(address))
+                removed.append(address)
+            done("remove", since)
+        except KongError as error:
+            return self._result("rotate", added=added, drained=drained, removed=removed, timings=timings,
+                                elapsed=clock() - started, msg=str(error), response=error.response)
+
+        outcome = self._result("rotate", added=added, drained=drained, removed=removed, timings=timings, elapsed=clock() - started)
+        outcome["changed"] = True
+        return outcome
+
+    def _result(self, action, msg=None, response=None, elapsed=None, **details):
+        outcome = result(self.name, action, msg=msg)
+        if response is not None:
+            outcome.update(failed=True, status_code=response.status_code)
+        if elapsed is not None:
+            details["elapsed"] = round(elapsed, 3)
+        outcome.update(details)
+        return outcome
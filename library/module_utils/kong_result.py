@@ -0,0 +1,101 @@
+try:
+    from ansible.module_utils.six import string_types
+except ImportError:
+    from six import string_types
+
+# The fields of a bulk operation's result that compact mode keeps, and
+# only when they say something
+COMPACT_FIELDS = ("name", "action", "status_code", "msg")
+
+
+def response_meta(response):
+    """The entity in a response's body, decoded once: a dict (or whatever
+    JSON Kong sent), {} for an empty body, or the text of a body that is
+    not JSON"""
+
+    content = response.content
+    if not content:
+        return {}
+    try:
+        return response.json()
+    except ValueError:
+        return content.decode("utf-8", "replace") if isinstance(content, bytes) else content
+
+
+def field_paths(fields):
+    """Splits return_fields, such as ["id", "config.minute"], into
+    paths: a list of keys for each field"""
+
+    if isinstance(fields, string_types):
+        fields = fields.split(",")
+    return [field.strip().split(".") for field in fields if field.strip()]
+
+
+def project(value, paths):
+    """Keeps only the fields at `paths` of an entity. A listing keeps its
+    `total` and `next`, with each of its entries projected, and a list is
+    projected entry by entry. Missing fields are left out."""
+
+    if isinstance(value, list):
+        return [project(entry, paths) for entry in value]
+    if not isinstance(value, dict):
+        return value
+    if isinstance(value.get("data"), list):
+        return dict(value, data=project(value["data"], paths))
+
+    projected = {}
+    for path in paths:
+        source, target = value, projected
+        for key in path[:-1]:
+            source = source.get(key) if isinstance(source, dict) else None
+            if source is None:
+                break
+            target = target.setdefault(key, {})
+        else:
+            if isinstance(source, dict) and path[-1] in source:
+                target[path[-1]] = source[path[-1]]
+    return projected
+
+
+def compact(outcome):
+    """One bulk operation's result, cut down to what it says"""
+
+    return dict((field, outcome[field]) for field in COMPACT_FIELDS if outcome.get(field) is not None)
+
+
+def shape(result, return_fields=None, compact_results=False):
+    """Trims a module's result before it is sent back. With return_fields,
+    `meta` only keeps those fields. In compact mode, the operations of a
+    bulk run that succeeded are only counted in its summary, and the
+    failed ones only say what went wrong. The result of a run against
+    several endpoints is shaped endpoint by endpoint."""
+
+    if not return_fields and not compact_results:
+        return result
+
+    result = dict(result)
+    if isinstance(result.get("endpoints"), dict):
+        result["endpoints"] = dict(
+            (endpoint, shape(outcome, return_fields, compact_results))
+            for endpoint, outcome in result["endpoints"].items()
+        )
+    if return_fields and "meta" in result:
+        result["meta"] = project(result["meta"], field_paths(return_fields))
+    if compact_results and isinstance(result.get("results"), list):
+        result["results"] = [compact(outcome) for outcome in result["results"] if outcome.get("failed")]
+    return result
+
+
+def shape_params(result, params):
+    """shape() with the return_fields and compact params of a module"""
+
+    return shape(result, params.get("return_fields"), params.get("compact"))
+
+
+def result_argument_spec():
+    """Module arguments that trim the result: return_fields and compact"""
+
+    return dict(
+        return_fields = dict(required=False, type='list'),
+        compact = dict(required=False, default=False, type='bool'),
+    )
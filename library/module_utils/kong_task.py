@@ -0,0 +1,92 @@
+import os
+
+try:
+    from ansible.module_utils.six import string_types
+    from ansible.module_utils.kong_result import shape_params
+except ImportError:
+    from six import string_types
+    from .kong_result import shape_params
+
+BOOLEANS_TRUE = ("yes", "on", "true", "1")
+BOOLEANS_FALSE = ("no", "off", "false", "0")
+
+
+class KongTask:
+    """Stands in for AnsibleModule when a module's run() is called in
+    process, by the batch runner or the CLI. It carries what run()
+    reads from the module: the params, check mode and diff mode."""
+
+    def __init__(self, params, check_mode=False, diff=False):
+        self.params = params
+        self.check_mode = check_mode
+        self._diff = diff
+
+    def atomic_move(self, source, dest):
+        os.rename(source, dest)
+
+
+def convert(name, value, kind):
+    """Converts one param the way AnsibleModule would for its type"""
+
+    if value is None or kind in (None, 'raw'):
+        return value
+    try:
+        if kind == 'bool':
+            if isinstance(value, bool):
+                return value
+            lowered = str(value).lower()
+            if lowered in BOOLEANS_TRUE:
+                return True
+            if lowered in BOOLEANS_FALSE:
+                return False
+            raise ValueError(value)
+        if kind == 'int':
+            return int(value)
+        if kind == 'float':
+            return float(value)
+        if kind in ('str', 'path'):
+            if not isinstance(value, string_types):
+                raise ValueError(value)
+            return value
+        if kind == 'list':
+            if isinstance(value, string_types):
+                return value.split(",")
+            return list(value)
+        if kind == 'dict':
+            return dict(value)
+    except (TypeError, ValueError):
+        raise ValueError("{} should be of type {}, got {!r}" . format (name, kind, value))
+    return value
+
+
+def task_params(argument_spec, params):
+    """Checks and completes the params of an in-process task against the
+    module's argument spec, as AnsibleModule does: unknown params,
+    missing required ones and values outside the choices are errors,
+    values are converted to their type and defaults are filled in.
+    Raises ValueError."""
+
+    unknown = sorted(set(params) - set(argument_spec))
+    if unknown:
+        raise ValueError("Unsupported parameters: {}" . format (", " . join (unknown)))
+
+    checked = {}
+    for name, spec in argument_spec.items():
+        value = convert(name, params.get(name, spec.get('default')), spec.get('type', 'str'))
+        if value is None and spec.get('required'):
+            raise ValueError("missing required arguments: {}" . format (name))
+        if value is not None and spec.get('choices') and value not in spec['choices']:
+            raise ValueError("value of {} must be one of: {}, got: {}" . format (name, ", " . join (spec['choices']), value))
+        checked[name] = value
+    return checked
+
+
+def finish(module, result):
+    """Ends an Ansible run with the result of a module's run(), trimmed
+    as its return_fields and compact params ask"""
+
+    result = dict(shape_params(result, module.params))
+    if result.pop('failed', False):
+        module.fail_json(**result)
+    else:
+        module.exit_json(**result)
@@ -1,6 +1,7 @@
 import unittest, responses, json, mock, requests
 from urlparse import parse_qsl, parse_qs
-from kong_api import KongAPI, ModuleHelper, main
+from kong_api import KongAPI, KongError, ModuleHelper, main
+from module_utils.kong_client import KongClient
 from ansible.module_utils.basic import AnsibleModule
 
 mock_kong_admin_url = "http://192.168.99.100:8001"
@@ -78,11 +79,31 @@ class MainTestCase(unittest.TestCase):
 	def test_main_add(self, mock_prepare_inputs, mock_module, mock_add, mock_exit_json, mock_get_response):
 
 		mock_prepare_inputs.return_value = (mock_kong_admin_url, {}, "present", None, None)
+		mock_module.return_value.check_mode = False
+		mock_module.return_value.params = {}
 		mock_get_response.return_value = (True, {})
 		main()
 
 		assert mock_add.called		
 
+	@mock.patch.object(KongAPI, 'plan')
+	@mock.patch.object(AnsibleModule, 'exit_json')
+	@mock.patch.object(KongAPI, 'add_or_update')
+	@mock.patch.object(ModuleHelper, 'get_module')
+	@mock.patch.object(ModuleHelper, 'prepare_inputs')
+	def test_main_check_mode(self, mock_prepare_inputs, mock_module, mock_add, mock_exit_json, mock_plan):
+
+		mock_prepare_inputs.return_value = (mock_kong_admin_url, {"name": "mockbin"}, "present", None, None)
+		mock_module.return_value.check_mode = True
+		mock_module.return_value._diff = True
+		mock_module.return_value.params = {"kong_admin_cache": False}
+		diff = {"before": {}, "after": {"name": "mockbin"}}
+		mock_plan.return_value = ("create", diff)
+		main()
+
+		assert not mock_add.called, "Expect no write in check mode"
+		mock_module.return_value.exit_json.assert_called_once_with(changed=True, meta={"action": "create"}, diff=diff)
+
 	@mock.patch.object(ModuleHelper, 'get_response')
 	@mock.patch.object(AnsibleModule, 'exit_json')
 	@mock.patch.object(KongAPI, 'delete_by_name')
@@ -91,6 +112,8 @@ class MainTestCase(unittest.TestCase):
 	def test_main_delete(self, mock_prepare_inputs, mock_module, mock_delete, mock_exit_json, mock_get_response):
 
 		mock_prepare_inputs.return_value = (mock_kong_admin_url, {}, "absent", None, None)
+		mock_module.return_value.check_mode = False
+		mock_module.return_value.params = {}
 		mock_get_response.return_value = (True, {})
 		main()
 
@@ -98,12 +121,14 @@ class MainTestCase(unittest.TestCase):
 
 	@mock.patch.object(ModuleHelper, 'get_response')
 	@mock.patch.object(AnsibleModule, 'exit_json')
-	@mock.patch.object(KongAPI, 'list')
+	@mock.patch.object(KongAPI, 'iterate')
 	@mock.patch.object(ModuleHelper, 'get_module')
 	@mock.patch.object(ModuleHelper, 'prepare_inputs')
 	def test_main_add(self, mock_prepare_inputs, mock_module, mock_list, mock_exit_json, mock_get_response):
 
 		mock_prepare_inputs.return_value = (mock_kong_admin_url, {}, "list", None, None)
+		mock_module.return_value.check_mode = False
+		mock_module.return_value.params = {}
 		mock_get_response.return_value = (True, {})
 		main()
 
@@ -116,31 +141,26 @@ class KongAPITestCase(unittest.TestCase):
 	def setUp(self):
 		self.api = KongAPI(mock_kong_admin_url)
 
-	def test__api_exists(self):
-		api_list = [
-			{"name": "foo"},
-			{"name": "bar"},
-		]
-		exists = self.api._api_exists("foo", api_list)
-		assert exists == True
-
-	def test__api_doesnt_exist(self):
-		api_list = [
-			{"name": "foo"},
-			{"name": "bar"},
-		]
-		exists = self.api._api_exists("baz", api_list)
-		assert exists == False
+	@responses.activate
+	def test_find_in_index(self):
+		self.api.index.load([{"id": "1", "name": "foo"}, {"id": "2", "name": "bar"}])
+
+		assert self.api.find("foo") == {"id": "1", "name": "foo"}
+		assert self.api.index.get_by_id("2")["name"] == "bar"
+		assert len(responses.calls) == 0, "Expect a loaded index to be used without calling Kong"
+
+	@responses.activate
+	def test_find_missing_in_index(self):
+		self.api.index.load([{"id": "1", "name": "foo"}, {"id": "2", "name": "bar"}])
+
+		assert self.api.find("baz") is None
+		assert len(responses.calls) == 0
 
 	@responses.activate
 	def test_api_add_new(self):
 		
-		api_list = {'data': [
-			{"name": "foo"},
-			{"name": "bar"},
-		]}
-		expected_url = '{}/apis' . format (mock_kong_admin_url)
-		responses.add(responses.GET, expected_url, status=201, body=json.dumps(api_list))
+		expected_url = '{}/apis/mockbin' . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=404, body=json.dumps({"message": "Not found"}))
 
 		expected_url = '{}/apis/' . format (mock_kong_admin_url)
 		responses.add(responses.POST, expected_url, status=201)
@@ -161,18 +181,28 @@ class KongAPITestCase(unittest.TestCase):
 			assert data.get(key, None) is not None, \
 				"Expect all required data to have been sent. What was actually sent: {}" . format (data)
 
+	@responses.activate
+	def test_api_add_retry_finds_created(self):
+
+		expected_url = '{}/apis/mockbin' . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=404, body=json.dumps({"message": "Not found"}))
+		responses.add(responses.POST, '{}/apis/' . format (mock_kong_admin_url), body=requests.ConnectionError("reset"))
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps({"id": "1", "name": "mockbin"}))
+
+		api = KongAPI(mock_kong_admin_url, client=KongClient(mock_kong_admin_url, retry_backoff=0.001))
+		response = api.add_or_update(name="mockbin", upstream_url="http://mockbin.com")
+
+		assert response.status_code == 201
+		assert response.json()["id"] == "1"
+		methods = [call.request.method for call in responses.calls]
+		assert methods == ["GET", "POST", "GET"], \
+			"Expect the create to be checked for rather than sent again. Got: {}" . format (methods)
+
 	@responses.activate
 	def test_api_add_update(self):
 		
-		api_list = {'data': [
-			{"name": "foo"},
-			{"name": "bar"},
-			{"name": "mockbin"}
-		]}
-		expected_url = '{}/apis' . format (mock_kong_admin_url)
-		responses.add(responses.GET, expected_url, status=201, body=json.dumps(api_list))
-
 		expected_url = '{}/apis/mockbin' . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps({"id": "1", "name": "mockbin"}))
 		responses.add(responses.PATCH, expected_url, status=201)
 
 		request_data = {
@@ -191,6 +221,117 @@ class KongAPITestCase(unittest.TestCase):
 			assert data.get(key, None) is not None, \
 				"Expect all required data to have been sent. What was actually sent: {}" . format (data)
 
+	@responses.activate
+	def test_api_index_second_page(self):
+
+		expected_url = '{}/apis' . format (mock_kong_admin_url)
+		first_page = {'data': [{"name": "foo"}], 'offset': "abc"}
+		second_page = {'data': [{"name": "mockbin"}]}
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps(first_page))
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps(second_page))
+
+		expected_url = '{}/apis/mockbin' . format (mock_kong_admin_url)
+		responses.add(responses.PATCH, expected_url, status=200)
+
+		self.api._load_index()
+		response = self.api.add_or_update("mockbin", "http://mockbin.com")
+
+		assert response.status_code == 200, \
+			"Expect an API on a later page to be updated, not created again"
+		assert responses.calls[2].request.method == "PATCH"
+
+	@responses.activate
+	def test_api_add_with_index_lists_once(self):
+
+		expected_url = '{}/apis' . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps({'data': []}))
+
+		expected_url = '{}/apis/' . format (mock_kong_admin_url)
+		responses.add(responses.POST, expected_url, status=201, body=json.dumps({"id": "1", "name": "mockbin"}))
+
+		expected_url = '{}/apis/mockbin' . format (mock_kong_admin_url)
+		responses.add(responses.PATCH, expected_url, status=200, body=json.dumps({"id": "1", "name": "mockbin"}))
+
+		self.api._load_index()
+		self.api.add_or_update("mockbin", "http://mockbin.com")
+		response = self.api.add_or_update("mockbin", "http://mockbin.org")
+
+		methods = [call.request.method for call in responses.calls]
+		assert methods == ["GET", "POST", "PATCH"], \
+			"Expect the created API to be found without listing again. Got: {}" . format (methods)
+
+	@responses.activate
+	def test_api_add_does_not_list(self):
+
+		expected_url = '{}/apis/mockbin' . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=404)
+
+		expected_url = '{}/apis/' . format (mock_kong_admin_url)
+		responses.add(responses.POST, expected_url, status=201)
+
+		self.api.add_or_update("mockbin", "http://mockbin.com")
+
+		urls = [call.request.url for call in responses.calls]
+		assert urls[0] == '{}/apis/mockbin' . format (mock_kong_admin_url), \
+			"Expect a single GET by name instead of a listing. Got: {}" . format (urls)
+		assert len(urls) == 2
+
+	@responses.activate
+	def test_api_add_lookup_error(self):
+
+		expected_url = '{}/apis/mockbin' . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=401)
+
+		self.assertRaises(KongError, self.api.add_or_update, "mockbin", "http://mockbin.com")
+
+	@responses.activate
+	def test_api_delete_by_name_missing(self):
+
+		expected_url = '{}/apis/mockbin' . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=404)
+
+		response = self.api.delete_by_name("mockbin")
+
+		assert response.status_code == 404
+		assert len(responses.calls) == 1
+
+	@responses.activate
+	def test_api_add_unchanged(self):
+
+		current = {
+			"id": "1",
+			"name": "mockbin",
+			"upstream_url": "http://mockbin.com",
+			"request_host": "mockbin.com",
+			"strip_request_path": True,
+			"created_at": 1454348543000
+		}
+		expected_url = '{}/apis/mockbin' . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps(current))
+
+		response = self.api.add_or_update("mockbin", "http://mockbin.com", request_host="mockbin.com", strip_request_path="yes")
+
+		assert response.status_code == 304
+		assert response.json()["id"] == "1"
+		assert len(responses.calls) == 1, \
+			"Expect no PATCH for an unchanged API"
+
+	@responses.activate
+	def test_api_plan(self):
+
+		expected_url = '{}/apis/mockbin' . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps({"id": "1", "name": "mockbin", "upstream_url": "http://mockbin.com"}))
+
+		action, diff = self.api.plan("mockbin", upstream_url="http://mockbin.org")
+		assert action == "update"
+		assert diff["before"]["upstream_url"] == "http://mockbin.com"
+		assert diff["after"]["upstream_url"] == "http://mockbin.org"
+
+		action, diff = self.api.plan("mockbin", state="absent")
+		assert action == "delete"
+
+		assert all(call.request.method == "GET" for call in responses.calls)
+
 	@responses.activate
 	def test_list_apis(self):
 		expected_url = '{}/apis' . format (mock_kong_admin_url)
@@ -0,0 +1,229 @@
+import unittest, responses, json, mock
+from six.moves.urllib.parse import parse_qs
+from kong_apis import KongAPI, KongEngine, ModuleHelper, API_FIELDS, main
+from ansible.module_utils.basic import AnsibleModule
+
+mock_kong_admin_url = "http://192.168.99.100:8001"
+
+existing_apis = {'data': [
+	{"id": "1", "name": "same", "upstream_url": "http://same.com", "strip_request_path": False, "preserve_host": False},
+	{"id": "2", "name": "changed", "upstream_url": "http://old.com", "strip_request_path": False, "preserve_host": False},
+	{"id": "3", "name": "gone", "upstream_url": "http://gone.com", "strip_request_path": False, "preserve_host": False},
+	{"id": "4", "name": "unmanaged", "upstream_url": "http://other.com", "strip_request_path": False, "preserve_host": False},
+]}
+
+class ConvergeTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.api = KongAPI(mock_kong_admin_url)
+		self.apis = [
+			{"name": "same", "upstream_url": "http://same.com", "strip_request_path": False, "preserve_host": False},
+			{"name": "changed", "upstream_url": "http://new.com", "strip_request_path": False, "preserve_host": False},
+			{"name": "new", "upstream_url": "http://new.com", "strip_request_path": False, "preserve_host": False},
+			{"name": "gone", "state": "absent"},
+		]
+		responses.add(responses.GET, '{}/apis' . format (mock_kong_admin_url), status=200, body=json.dumps(existing_apis))
+		responses.add(responses.POST, '{}/apis/' . format (mock_kong_admin_url), status=201, body=json.dumps({"id": "5", "name": "new"}))
+		responses.add(responses.PATCH, '{}/apis/changed' . format (mock_kong_admin_url), status=200, body=json.dumps({"id": "2", "name": "changed"}))
+		responses.add(responses.DELETE, '{}/apis/3' . format (mock_kong_admin_url), status=204)
+		responses.add(responses.DELETE, '{}/apis/4' . format (mock_kong_admin_url), status=204)
+
+	@responses.activate
+	def test_converge(self):
+
+		results = self.api.converge(self.apis)
+
+		actions = dict((result['name'], result['action']) for result in results)
+		assert actions == {"same": "none", "changed": "update", "new": "create", "gone": "delete"}, \
+			"Unexpected plan: {}" . format (actions)
+
+		methods = [call.request.method for call in responses.calls]
+		assert methods.count("GET") == 1, \
+			"Expect the existing APIs to be listed once. Got: {}" . format (methods)
+		assert len(responses.calls) == 4
+
+		body = parse_qs(responses.calls[2].request.body)
+		assert body['upstream_url'] == ['http://new.com']
+
+	@responses.activate
+	def test_converge_reports_changed_per_item(self):
+
+		results = self.api.converge(self.apis)
+
+		changed = dict((result['name'], result['changed']) for result in results)
+		assert changed == {"same": False, "changed": True, "new": True, "gone": True}
+
+	@responses.activate
+	def test_converge_purge(self):
+
+		results = self.api.converge(self.apis, purge=True)
+
+		deleted = sorted(result['name'] for result in results if result['action'] == "delete")
+		assert deleted == ["gone", "unmanaged"]
+
+	@responses.activate
+	def test_converge_plugins_after_apis(self):
+		responses.add(responses.GET, '{}/plugins' . format (mock_kong_admin_url), status=200, body=json.dumps({"data": []}))
+		plugins_url = '{}/apis/new/plugins' . format (mock_kong_admin_url)
+		responses.add(responses.POST, plugins_url, status=201, body=json.dumps({"id": "9", "name": "key-auth"}))
+
+		apis = [{"name": "new", "upstream_url": "http://new.com", "plugins": [{"name": "key-auth", "config": None}]}]
+		results = self.api.converge(apis, engine=KongEngine(4))
+
+		urls = [call.request.url.split("?")[0] for call in responses.calls]
+		assert urls.index(plugins_url) > urls.index('{}/apis/' . format (mock_kong_admin_url)), \
+			"Expect the API to be created before its plugins. Got: {}" . format (urls)
+		assert results[-1]['name'] == "new/key-auth"
+		assert results[-1]['action'] == "create"
+
+	@responses.activate
+	def test_converge_parallel(self):
+
+		results = self.api.converge(self.apis, purge=True, engine=KongEngine(8))
+
+		actions = dict((result['name'], result['action']) for result in results)
+		assert actions == {"same": "none", "changed": "update", "new": "create", "gone": "delete", "unmanaged": "delete"}
+		assert not any(result['failed'] for result in results)
+
+	@responses.activate
+	def test_converge_keeps_input_order(self):
+
+		results = self.api.converge(self.apis, purge=True, engine=KongEngine(8))
+
+		names = [result['name'] for result in results]
+		assert names == ["same", "changed", "new", "gone", "unmanaged"], \
+			"Expect the APIs in the order given, then the ones purged. Got: {}" . format (names)
+
+	@responses.activate
+	def test_converge_check_mode(self):
+		existing_plugins = {"data": [
+			{"id": "7", "api_id": "1", "name": "key-auth", "config": {"hide_credentials": False}},
+			{"id": "8", "api_id": "2", "name": "cors", "config": {}},
+		]}
+		responses.add(responses.GET, '{}/plugins' . format (mock_kong_admin_url), status=200, body=json.dumps(existing_plugins))
+
+		apis = list(self.apis)
+		apis[0] = dict(apis[0], plugins=[
+			{"name": "key-auth", "config": {"config.hide_credentials": "no"}},
+			{"name": "rate-limiting", "config": {"config.minute": 20}},
+		])
+		results = self.api.converge(apis, purge=True, check_mode=True)
+
+		methods = [call.request.method for call in responses.calls]
+		assert methods == ["GET", "GET"], \
+			"Expect one listing of APIs and one of plugins, and no writes. Got: {}" . format (methods)
+
+		outcomes = dict((outcome['name'], (outcome['action'], outcome['changed'])) for outcome in results)
+		assert outcomes == {
+			"same": ("none", False),
+			"same/key-auth": ("none", False),
+			"same/rate-limiting": ("create", True),
+			"changed": ("update", True),
+			"new": ("create", True),
+			"gone": ("delete", True),
+			"unmanaged": ("delete", True),
+		}, "Unexpected plan: {}" . format (outcomes)
+
+		diffs = dict((outcome['name'], outcome.get('diff')) for outcome in results)
+		assert diffs["changed"]["before"]["upstream_url"] == "http://old.com"
+		assert diffs["changed"]["after"]["upstream_url"] == "http://new.com"
+		assert diffs["gone"]["after"] == {}
+		assert diffs["same"] is None
+
+class ModuleHelperTestCase(unittest.TestCase):
+
+	def setUp(self):
+		class MockModule:
+			pass
+
+		self.helper = ModuleHelper(API_FIELDS)
+		self.module = MockModule()
+		self.module.params = {
+			"kong_admin_uri": mock_kong_admin_url,
+			"kong_admin_username": None,
+			"kong_admin_password": None,
+			"purge": False,
+			"apis": [
+				{"name": "mockbin", "upstream_url": "http://mockbin.com", "unknown": "x"},
+				{"name": "keyed", "upstream_url": "http://keyed.com", "plugins": [{"name": "key-auth", "unknown": "x"}]},
+				{"name": "legacy", "upstream_url": "http://legacy.com", "state": "absent"},
+			]
+		}
+
+	def test_prepare_inputs(self):
+
+		url, apis, purge, auth_user, auth_password = self.helper.prepare_inputs(self.module)
+
+		assert url == mock_kong_admin_url
+		assert purge == False
+		assert apis[0] == {
+			"name": "mockbin",
+			"upstream_url": "http://mockbin.com",
+			"strip_request_path": False,
+			"preserve_host": False
+		}, "Expect defaults to be filled in and unknown fields dropped. Got: {}" . format (apis[0])
+		assert apis[1]["plugins"] == [{"name": "key-auth", "config": None}]
+		assert apis[2] == {"name": "legacy", "state": "absent"}
+
+	def test_validate(self):
+		assert self.helper.validate([{"name": "mockbin", "upstream_url": "http://mockbin.com"}]) is None
+		assert self.helper.validate([{"upstream_url": "http://mockbin.com"}]) is not None
+		assert self.helper.validate([{"name": "mockbin"}]) is not None
+		assert self.helper.validate([{"name": "mockbin", "state": "absent"}]) is None
+		assert self.helper.validate([{"name": "mockbin", "upstream_url": "http://mockbin.com", "plugins": [{"config": {}}]}]) is not None
+
+	def test_get_response(self):
+		results = [
+			{"name": "a", "action": "none", "changed": False, "failed": False, "status_code": None},
+			{"name": "b", "action": "create", "changed": False, "failed": True, "status_code": 409},
+		]
+		has_changed, failed, results, summary = self.helper.get_response(results)
+
+		assert has_changed == False
+		assert [result['name'] for result in failed] == ["b"]
+		assert len(results) == 2
+		assert summary == {"none": 1, "create": 1}
+
+class MainTestCase(unittest.TestCase):
+
+	@mock.patch.object(AnsibleModule, 'exit_json')
+	@mock.patch.object(KongAPI, 'converge')
+	@mock.patch.object(ModuleHelper, 'get_module')
+	@mock.patch.object(ModuleHelper, 'prepare_inputs')
+	def test_main(self, mock_prepare_inputs, mock_module, mock_converge, mock_exit_json):
+
+		apis = [{"name": "mockbin", "upstream_url": "http://mockbin.com"}]
+		mock_prepare_inputs.return_value = (mock_kong_admin_url, apis, True, None, None)
+		mock_module.return_value.check_mode = False
+		mock_module.return_value.params = {"parallelism": 1}
+		mock_converge.return_value = [{"name": "mockbin", "action": "create", "changed": True, "failed": False, "status_code": 201}]
+		main()
+
+		args = mock_converge.call_args[0]
+		assert args[0] == apis
+		assert args[1] == True
+		assert isinstance(args[2], KongEngine)
+
+	@mock.patch.object(KongAPI, 'converge')
+	@mock.patch.object(ModuleHelper, 'get_module')
+	def test_main_compact(self, mock_module, mock_converge):
+
+		mock_module.return_value.check_mode = False
+		mock_module.return_value._diff = False
+		mock_module.return_value.params = {
+			"kong_admin_uri": mock_kong_admin_url, "kong_admin_username": None, "kong_admin_password": None,
+			"apis": [{"name": "mockbin", "upstream_url": "http://mockbin.com"}, {"name": "same", "upstream_url": "http://same.com"}],
+			"purge": False, "parallelism": 1, "compact": True,
+		}
+		mock_converge.return_value = [
+			{"name": "mockbin", "action": "create", "changed": True, "failed": False, "status_code": 201, "msg": None},
+			{"name": "same", "action": "none", "changed": False, "failed": False, "status_code": None, "msg": None},
+		]
+		main()
+
+		exited = mock_module.return_value.exit_json.call_args[1]
+		assert exited["results"] == []
+		assert exited["summary"] == {"create": 1, "none": 1}, "Expect compact results to be counted in the summary"
+
+if __name__ == '__main__':
+    unittest.main()
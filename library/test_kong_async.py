@@ -0,0 +1,242 @@
+import unittest, os, sys, threading, time
+from module_utils.kong_async import AsyncKongClient, AsyncKongEngine, has_asyncio
+from module_utils.kong_engine import Operation, result, summarize
+from module_utils.kong_resources import KongAPI, KongConsumer
+from module_utils.kong_task import KongTask
+import kong_consumers
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+from fake_admin import FakeAdminServer
+
+def consumers(size, plugin="key-auth"):
+	return [dict(username="user{}" . format (number), credentials=[dict(plugin=plugin, data=dict(key="key{}" . format (number)))])
+		for number in range(size)]
+
+class Response:
+	def __init__(self, status_code=201):
+		self.status_code = status_code
+
+def settle(future, response=None, error=None):
+	if future.done():
+		return
+	if error is not None:
+		future.set_exception(error)
+	else:
+		future.set_result(response)
+
+@unittest.skipUnless(has_asyncio(), "The asyncio engine needs Python 3.6 or later")
+class AsyncKongEngineTestCase(unittest.TestCase):
+
+	def setUp(self):
+		import asyncio
+		self.loop = asyncio.new_event_loop()
+
+	def tearDown(self):
+		self.loop.close()
+
+	def respond(self, delay, status_code=201):
+		def call():
+			future = self.loop.create_future()
+			self.loop.call_later(delay, settle, future, Response(status_code))
+			return future
+		return call
+
+	def unreachable(self, delay=0):
+		def call():
+			future = self.loop.create_future()
+			self.loop.call_later(delay, settle, future, None, IOError("Connection refused"))
+			return future
+		return call
+
+	def test_order_and_concurrency(self):
+		operations = [Operation(str(number), "create", self.respond(0.05 if number % 2 else 0.01)) for number in range(20)]
+
+		started = time.time()
+		results = AsyncKongEngine(20).run([operations])
+
+		assert [outcome["name"] for outcome in results] == [str(number) for number in range(20)]
+		assert all(outcome["changed"] for outcome in results)
+		assert time.time() - started < 0.5, "Expect the operations to run at once"
+
+	def test_parallelism(self):
+		operations = [Operation(str(number), "create", self.respond(0.05)) for number in range(8)]
+
+		started = time.time()
+		AsyncKongEngine(4).run([operations])
+
+		assert time.time() - started >= 0.1, "Expect no more than 4 operations in flight"
+
+	def test_results_pass_through_in_order(self):
+		operations = [Operation("0", "create", self.respond(0.05)), result("1", "none"), Operation("2", "create", lambda: Response(201)), result("3", "none")]
+
+		results = AsyncKongEngine(4).run([operations])
+
+		assert [(outcome["name"], outcome["changed"]) for outcome in results] == [("0", True), ("1", False), ("2", True), ("3", False)]
+
+	def test_check_mode(self):
+		operations = [Operation("unreachable", "create", self.unreachable())]
+
+		results = AsyncKongEngine(4).run([operations], check_mode=True)
+
+		assert results[0]["changed"] == True and results[0]["failed"] == False
+
+	def test_stop_on_unreachable(self):
+		def stage():
+			yield Operation("slow", "create", self.respond(5))
+			yield Operation("unreachable", "create", self.unreachable(0.01))
+			for number in range(100):
+				yield Operation(str(number), "create", self.respond(0))
+
+		engine = AsyncKongEngine(2)
+		started = time.time()
+		results = engine.run([stage(), [Operation("later", "create", self.respond(0))]])
+
+		assert [outcome["name"] for outcome in results] == ["slow", "unreachable"], \
+			"Expect nothing more to start. Got: {}" . format (results)
+		assert results[0]["failed"] == True and results[0]["msg"].startswith("Cancelled after")
+		assert time.time() - started < 1, "Expect the call in flight to be cancelled"
+		assert engine.stopped["name"] == "unreachable"
+
+	def test_stop_on_unauthorized(self):
+		operations = [Operation("refused", "create", self.respond(0, 401))] + [Operation(str(number), "create", self.respond(0.01)) for number in range(10)]
+
+		engine = AsyncKongEngine(1)
+		results = engine.run([operations])
+
+		assert [outcome["name"] for outcome in results] == ["refused"]
+		assert engine.stopped["status_code"] == 401
+
+	def test_other_errors_are_not_fatal(self):
+		consumer = KongConsumer("http://127.0.0.1:1")
+		consumer.index.load([])
+		consumer.custom_ids.load([])
+		operations = [
+			Operation("missing", "create", lambda: consumer._configure(None, "missing", "key-auth", {})),
+			Operation("conflict", "create", self.respond(0.01, 409)),
+			Operation("fine", "create", self.respond(0.01)),
+		]
+
+		engine = AsyncKongEngine(10)
+		results = engine.run([operations])
+
+		assert [outcome["failed"] for outcome in results] == [True, True, False]
+		assert "missing" in results[0]["msg"]
+		assert engine.stopped is None
+
+@unittest.skipUnless(has_asyncio(), "The asyncio client needs Python 3.6 or later")
+class AsyncKongClientTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.server = FakeAdminServer().start()
+		self.client = AsyncKongClient(self.server.url, parallelism=20, retry_backoff=0.01)
+
+	def tearDown(self):
+		self.client.close()
+		self.server.stop()
+
+	def test_iterate_over_one_connection(self):
+		for number in range(25):
+			self.server.store.consumers.add(dict(username="user{}" . format (number)))
+
+		entries = list(self.client.iterate("{}/consumers" . format (self.server.url), 10))
+
+		assert len(entries) == 25
+		assert self.server.requests["GET"] == 3
+		assert self.client.connections == 1, "Expect the pages to share a kept-alive connection"
+
+	def test_writes(self):
+		api = KongAPI(self.server.url, client=self.client)
+
+		response = self.client.run(api.add_or_update("mockbin", "http://mockbin.com"))
+		assert response.status_code == 201
+		assert self.client.run(api.add_or_update("mockbin", "http://mockbin.com")).status_code == 304
+		assert self.client.run(api.add_or_update("mockbin", "http://mockbin.org")).status_code == 200
+		assert api.find("mockbin")["upstream_url"] == "http://mockbin.org"
+
+		assert self.client.run(api.delete(response.json()["id"])).status_code == 204
+		assert len(self.server.store.apis) == 0
+
+	def test_writes_in_flight(self):
+		self.server.latency = 0.05
+		api = KongAPI(self.server.url, client=self.client)
+		api.index.load([])
+
+		started = time.time()
+		futures = [api.add_or_update("api{}" . format (number), "http://mockbin.com") for number in range(40)]
+		responses = [self.client.run(future) for future in futures]
+
+		assert [response.status_code for response in responses] == [201] * 40
+		assert time.time() - started < 1.5, "Expect 20 writes in flight at a time"
+		assert self.client.connections <= 20
+
+	def test_retries(self):
+		self.server.error_rate = 1
+		self.client.retries = 2
+
+		response = self.client.run(self.client.write("patch", "{}/apis/missing" . format (self.server.url), dict(name="missing")))
+
+		assert response.status_code == 503
+		assert self.client.retry_count == 2
+		assert self.server.requests["PATCH"] == 3
+
+	def test_request_from_another_thread(self):
+		self.server.store.apis.add(dict(name="mockbin"))
+		url = "{}/apis/mockbin" . format (self.server.url)
+
+		response = self.client.run(self.client.loop.run_in_executor(None, lambda: self.client.get(url)))
+
+		assert response.status_code == 200
+		assert threading.current_thread() is self.client._thread
+
+	def test_unreachable(self):
+		client = AsyncKongClient("http://127.0.0.1:1", retries=0)
+		try:
+			self.assertRaises(OSError, client.run, client.write("post", "http://127.0.0.1:1/apis/", dict(name="mockbin")))
+		finally:
+			client.close()
+
+@unittest.skipUnless(has_asyncio(), "The asyncio engine needs Python 3.6 or later")
+class AsyncConvergeTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.server = FakeAdminServer().start()
+
+	def tearDown(self):
+		self.server.stop()
+
+	def converge(self, items):
+		client = AsyncKongClient(self.server.url, parallelism=50)
+		try:
+			return KongConsumer(self.server.url, client=client).converge(items, True, AsyncKongEngine(50))
+		finally:
+			client.close()
+
+	def test_converge(self):
+		self.server.store.consumers.add(dict(username="leaver"))
+
+		results = self.converge(consumers(200))
+		has_changed, failed, _, summary = summarize(results)
+
+		assert failed == []
+		assert summary == {"create": 400, "delete": 1}
+		assert len(self.server.store.consumers) == 200
+		assert len(self.server.store.credentials["key-auth"]) == 200
+
+		assert summarize(self.converge(consumers(200)))[3] == {"none": 400}
+
+	def test_kong_consumers(self):
+		params = dict(
+			kong_admin_uri=self.server.url, kong_admin_username=None, kong_admin_password=None,
+			consumers=consumers(20), src=None, purge=False, credential_grace=None, engine="asyncio", parallelism=10,
+			kong_admin_metrics=True,
+		)
+		helper = kong_consumers.ModuleHelper(kong_consumers.CONSUMER_FIELDS)
+
+		result = kong_consumers.run(helper, KongTask(params))
+
+		assert result["changed"] == True
+		assert result["summary"] == {"create": 40}
+		assert result["metrics"]["calls"] > 0, "Expect the calls to be measured by the asyncio client"
+
+if __name__ == '__main__':
+    unittest.main()
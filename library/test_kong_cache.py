@@ -0,0 +1,145 @@
+import unittest, responses, json, mock, os, shutil, tempfile, time
+from module_utils.kong_cache import SnapshotCache, default_cache_dir
+from module_utils.kong_client import KongClient
+from module_utils.kong_resources import KongPlugin
+
+mock_kong_admin_url = "http://192.168.99.100:8001"
+
+class SnapshotCacheTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.cache = SnapshotCache(mock_kong_admin_url, 60, self.directory)
+		self.url = "{}/apis" . format (mock_kong_admin_url)
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_miss_then_hit(self):
+		assert self.cache.get(self.url) is None
+
+		self.cache.put(self.url, None, [{"id": "1"}], time.time())
+
+		assert self.cache.get(self.url) == [{"id": "1"}]
+		assert self.cache.stats() == {"hits": 1, "misses": 1}
+
+	def test_keyed_by_params(self):
+		self.cache.put(self.url, {"custom_id": "a"}, [{"id": "1"}], time.time())
+
+		assert self.cache.get(self.url) is None
+		assert self.cache.get(self.url, {"custom_id": "a"}) == [{"id": "1"}]
+
+	def test_shared_between_instances(self):
+		self.cache.put(self.url, None, [{"id": "1"}], time.time())
+
+		other = SnapshotCache(mock_kong_admin_url, 60, self.directory)
+		assert other.get(self.url) == [{"id": "1"}]
+		assert SnapshotCache("http://other:8001", 60, self.directory).get(self.url) is None
+
+	def test_expires(self):
+		self.cache.put(self.url, None, [{"id": "1"}], time.time() - 61)
+
+		assert self.cache.get(self.url) is None
+
+	def test_invalidate(self):
+		self.cache.put(self.url, None, [{"id": "1"}], time.time())
+		self.cache.invalidate()
+
+		assert self.cache.get(self.url) is None
+
+	def test_put_after_write_is_dropped(self):
+		fetched = time.time()
+		self.cache.invalidate()
+		self.cache.put(self.url, None, [{"id": "1"}], fetched)
+
+		assert self.cache.get(self.url) is None, \
+			"Expect a listing started before a write not to be stored"
+
+	def test_unreadable_snapshot(self):
+		self.cache.put(self.url, None, [{"id": "1"}], time.time())
+		with open(self.cache._path(self.url, None), "w") as snapshot:
+			snapshot.write("{")
+
+		assert self.cache.get(self.url) is None
+
+	def test_default_directory_per_user(self):
+		cache = SnapshotCache(mock_kong_admin_url)
+
+		assert os.path.dirname(cache.directory) == default_cache_dir()
+		assert default_cache_dir().endswith("-{}" . format (os.getuid()))
+
+	def test_shared_directory_is_not_read(self):
+		self.cache.put(self.url, None, [{"id": "1"}], time.time())
+		os.chmod(self.cache.directory, 0o777)
+
+		assert self.cache.get(self.url) is None, "Expect a directory others can write to not to be trusted"
+
+		self.cache.put(self.url, {"custom_id": "a"}, [{"id": "1"}], time.time())
+
+		assert len(os.listdir(self.cache.directory)) == 1, "Expect nothing to be written to it"
+
+	@mock.patch("os.getuid")
+	def test_directory_of_another_user_is_not_read(self, mock_getuid):
+		self.cache.put(self.url, None, [{"id": "1"}], time.time())
+		mock_getuid.return_value = os.stat(self.cache.directory).st_uid + 1
+
+		assert self.cache.get(self.url) is None
+
+class CachedClientTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.client = KongClient(mock_kong_admin_url, cache=True, cache_dir=self.directory)
+		self.url = "{}/apis/mockbin/plugins" . format (mock_kong_admin_url)
+		responses.add(responses.GET, self.url, status=200, body=json.dumps({"data": [{"id": "1", "name": "key-auth"}]}))
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	@responses.activate
+	def test_listing_is_reused(self):
+		list(self.client.iterate(self.url))
+		other = KongClient(mock_kong_admin_url, cache=True, cache_dir=self.directory)
+		entries = list(other.iterate(self.url))
+
+		assert entries == [{"id": "1", "name": "key-auth"}]
+		assert len(responses.calls) == 1, \
+			"Expect a later invocation to reuse the listing"
+		assert other.stats() == {"cache": {"hits": 1, "misses": 0}}
+
+	@responses.activate
+	def test_write_invalidates(self):
+		responses.add(responses.POST, self.url, status=201, body=json.dumps({"id": "2", "name": "cors"}))
+
+		list(self.client.iterate(self.url))
+		self.client.post(self.url, data={"name": "cors"})
+		list(self.client.iterate(self.url))
+
+		methods = [call.request.method for call in responses.calls]
+		assert methods == ["GET", "POST", "GET"]
+
+	@responses.activate
+	def test_plugin_lookups_share_the_listing(self):
+		for name in ["key-auth", "cors", "key-auth"]:
+			client = KongClient(mock_kong_admin_url, cache=True, cache_dir=self.directory)
+			KongPlugin(mock_kong_admin_url, "mockbin", client=client).find(name)
+
+		assert len(responses.calls) == 1, \
+			"Expect the lookups of one scope's plugins to reuse its listing"
+		assert client.stats() == {"cache": {"hits": 1, "misses": 0}}
+
+	@responses.activate
+	def test_partial_listing_is_not_stored(self):
+		next(self.client.iterate(self.url))
+		list(self.client.iterate(self.url))
+
+		assert len(responses.calls) == 2
+
+	def test_no_cache_by_default(self):
+		client = KongClient(mock_kong_admin_url)
+
+		assert client.cache is None
+		assert client.stats() == {}
+
+if __name__ == '__main__':
+    unittest.main()
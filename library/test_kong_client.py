@@ -0,0 +1,359 @@
+import unittest, responses, requests, json, time, mock, io
+from six.moves.urllib.error import HTTPError, URLError
+from six.moves.urllib.parse import parse_qs
+from module_utils.kong_client import KongClient, KongError, KongIndex, OpenUrlSession, RateLimiter, form_encode, get_client, get_rate_limiter, retry_after, unchanged_response
+from kong_api import KongAPI
+from kong_consumer import KongConsumer
+from kong_plugin import KongPlugin
+
+mock_kong_admin_url = "http://192.168.99.100:8001"
+
+class KongClientTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.client = KongClient(mock_kong_admin_url, "admin", "secret", pool_size=4)
+
+	def test_session_is_lazy(self):
+		assert self.client._session is None
+
+	def test_session_is_configured(self):
+		session = self.client.session
+		adapter = session.get_adapter(mock_kong_admin_url)
+
+		assert session.auth == ("admin", "secret")
+		assert adapter._pool_maxsize == 4
+		assert self.client.session is session, \
+			"Expect the same session to be reused"
+
+	def test_no_auth_without_password(self):
+		client = KongClient(mock_kong_admin_url, "admin")
+		assert client.auth is None
+
+	@responses.activate
+	def test_request_sends_auth(self):
+		expected_url = "{}/apis" . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200)
+
+		response = self.client.get(expected_url)
+
+		assert response.status_code == 200
+		assert responses.calls[0].request.headers.get("Authorization", "").startswith("Basic ")
+
+	def test_close(self):
+		self.client.session
+		self.client.close()
+		assert self.client._session is None
+
+class RetryTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.client = KongClient(mock_kong_admin_url, retries=2, retry_backoff=0.001)
+		self.url = "{}/apis" . format (mock_kong_admin_url)
+
+	def test_timeouts(self):
+		assert self.client.timeout == (5, 30)
+		assert KongClient(mock_kong_admin_url, connect_timeout=1, read_timeout=2).timeout == (1, 2)
+
+	@responses.activate
+	def test_retries_idempotent(self):
+		responses.add(responses.GET, self.url, status=503)
+		responses.add(responses.GET, self.url, status=200, body=json.dumps({"data": []}))
+
+		response = self.client.get(self.url)
+
+		assert response.status_code == 200
+		assert len(responses.calls) == 2
+		assert self.client.stats()["retries"]["count"] == 1
+
+	@responses.activate
+	def test_retries_connection_error(self):
+		responses.add(responses.DELETE, self.url, body=requests.ConnectionError("reset"))
+		responses.add(responses.DELETE, self.url, status=204)
+
+		assert self.client.delete(self.url).status_code == 204
+
+	@responses.activate
+	def test_gives_up(self):
+		responses.add(responses.PATCH, self.url, status=502)
+
+		response = self.client.patch(self.url, {})
+
+		assert response.status_code == 502
+		assert len(responses.calls) == 3, \
+			"Expect the first attempt and two retries"
+
+	@responses.activate
+	def test_no_retry_on_client_error(self):
+		responses.add(responses.GET, self.url, status=409)
+
+		self.client.get(self.url)
+
+		assert len(responses.calls) == 1
+		assert self.client.stats() == {}
+
+	@responses.activate
+	def test_post_not_retried_without_recheck(self):
+		responses.add(responses.POST, self.url, status=503)
+
+		assert self.client.post(self.url, {}).status_code == 503
+		assert len(responses.calls) == 1
+
+	@responses.activate
+	def test_post_recheck_finds_entry(self):
+		responses.add(responses.POST, self.url, body=requests.ConnectionError("reset"))
+
+		response = self.client.post(self.url, {}, recheck=lambda: {"id": "1", "name": "mockbin"})
+
+		assert response.status_code == 201
+		assert response.json()["id"] == "1"
+		assert len(responses.calls) == 1, \
+			"Expect the create not to be sent again once it is found"
+
+	@responses.activate
+	def test_post_recheck_retries(self):
+		responses.add(responses.POST, self.url, status=503)
+		responses.add(responses.POST, self.url, status=201, body=json.dumps({"id": "1"}))
+
+		response = self.client.post(self.url, {}, recheck=lambda: None)
+
+		assert response.status_code == 201
+		assert len(responses.calls) == 2
+
+	@responses.activate
+	def test_retry_after(self):
+		responses.add(responses.GET, self.url, status=429, headers={"Retry-After": "2"})
+		responses.add(responses.GET, self.url, status=200)
+
+		with mock.patch.object(time, "sleep") as sleep:
+			self.client.get(self.url)
+
+		sleep.assert_called_once_with(2.0)
+		assert self.client.stats()["retries"] == {"count": 1, "backoff": 2.0}
+
+	def test_retry_after_date(self):
+		response = requests.Response()
+		response.headers["Retry-After"] = "Wed, 21 Oct 2015 07:28:00 GMT"
+		assert retry_after(response) == 0
+
+		response.headers["Retry-After"] = "soon"
+		assert retry_after(response) is None
+
+class OpenUrlTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.client = KongClient(mock_kong_admin_url, "admin", "secret", retries=1, retry_backoff=0.001, transport="open_url")
+		self.url = "{}/apis/" . format (mock_kong_admin_url)
+		self.open_url = mock.MagicMock()
+		self.client.session._open_url = self.open_url
+
+	def reply(self, status, body):
+		reply = mock.MagicMock()
+		reply.geturl.return_value = self.url
+		reply.getcode.return_value = status
+		reply.read.return_value = json.dumps(body).encode("utf-8")
+		reply.info.return_value = {}
+		return reply
+
+	def test_transport(self):
+		assert isinstance(self.client.session, OpenUrlSession)
+
+	def test_request(self):
+		self.open_url.return_value = self.reply(201, {"id": "1", "name": "mockbin"})
+
+		response = self.client.post(self.url, {"name": "mockbin", "request_host": None, "methods": ["GET", "POST"]})
+
+		assert response.ok
+		assert response.status_code == 201
+		assert response.json() == {"id": "1", "name": "mockbin"}
+
+		args, kwargs = self.open_url.call_args
+		assert args == (self.url,)
+		assert kwargs["method"] == "POST"
+		assert kwargs["timeout"] == 30
+		assert kwargs["url_username"] == "admin" and kwargs["force_basic_auth"]
+		assert kwargs["headers"]["Content-Type"] == "application/x-www-form-urlencoded"
+		assert parse_qs(kwargs["data"].decode("utf-8")) == {"name": ["mockbin"], "methods": ["GET", "POST"]}
+
+	def test_params(self):
+		self.open_url.return_value = self.reply(200, {"data": []})
+
+		self.client.get(self.url, params={"size": 10})
+
+		assert self.open_url.call_args[0] == ("{}?size=10" . format (self.url),)
+
+	def test_error_status(self):
+		body = io.BytesIO(json.dumps({"message": "Not found"}).encode("utf-8"))
+		self.open_url.side_effect = HTTPError(self.url, 404, "Not Found", {}, body)
+
+		response = self.client.get(self.url)
+
+		assert not response.ok
+		assert response.status_code == 404
+		assert response.json() == {"message": "Not found"}
+
+	def test_retries_connection_error(self):
+		self.open_url.side_effect = [URLError("refused"), self.reply(200, {"data": []})]
+
+		response = self.client.get(self.url)
+
+		assert response.status_code == 200
+		assert self.client.retry_count == 1
+
+	def test_form_encode(self):
+		assert form_encode({"name": u"caf\u00e9"}) == "name=caf%C3%A9"
+		assert form_encode({"name": None}) == ""
+
+class IterateTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.client = KongClient(mock_kong_admin_url, page_size=2)
+		self.url = "{}/consumers" . format (mock_kong_admin_url)
+
+	def add_pages(self):
+		first_page = {"data": [{"id": "1"}, {"id": "2"}], "offset": "abc", "next": "{}?size=2&offset=abc" . format (self.url)}
+		second_page = {"data": [{"id": "3"}]}
+		responses.add(responses.GET, self.url, body=json.dumps(first_page))
+		responses.add(responses.GET, self.url, body=json.dumps(second_page))
+
+	@responses.activate
+	def test_iterate_follows_offset(self):
+		self.add_pages()
+
+		ids = [entry["id"] for entry in self.client.iterate(self.url)]
+
+		assert ids == ["1", "2", "3"]
+		assert "offset=abc" in responses.calls[1].request.url
+		assert "size=2" in responses.calls[1].request.url
+
+	@responses.activate
+	def test_iterate_follows_next(self):
+		first_page = {"data": [{"id": "1"}], "next": "{}?size=2&offset=xyz" . format (self.url)}
+		responses.add(responses.GET, self.url, body=json.dumps(first_page))
+		responses.add(responses.GET, self.url, body=json.dumps({"data": []}))
+
+		list(self.client.iterate(self.url))
+
+		assert "offset=xyz" in responses.calls[1].request.url
+
+	@responses.activate
+	def test_iterate_is_lazy(self):
+		self.add_pages()
+
+		entries = self.client.iterate(self.url)
+		next(entries)
+
+		assert len(responses.calls) == 1, \
+			"Expect the second page not to be fetched before it is needed"
+
+	@responses.activate
+	def test_iterate_size(self):
+		responses.add(responses.GET, self.url, body=json.dumps({"data": []}))
+
+		list(self.client.iterate(self.url, size=500))
+
+		assert "size=500" in responses.calls[0].request.url
+
+	@responses.activate
+	def test_iterate_error(self):
+		responses.add(responses.GET, self.url, status=401, body=json.dumps({"message": "Unauthorized"}))
+
+		try:
+			list(self.client.iterate(self.url))
+		except KongError as error:
+			assert error.response.status_code == 401
+		else:
+			self.fail("Expect KongError to be raised")
+
+class KongIndexTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.index = KongIndex("name")
+		self.index.load([{"id": "1", "name": "foo"}, {"id": "2", "name": "bar"}])
+
+	def response(self, status_code, body=None):
+		response = requests.Response()
+		response.status_code = status_code
+		response._content = b"" if body is None else json.dumps(body).encode("utf-8")
+		return response
+
+	def test_lookup(self):
+		assert self.index.get("foo")["id"] == "1"
+		assert self.index.get_by_id("2")["name"] == "bar"
+		assert self.index.get("baz") is None
+
+	def test_record_write(self):
+		self.index.record(self.response(201, {"id": "3", "name": "baz"}))
+		assert self.index.get("baz")["id"] == "3"
+
+	def test_record_rename(self):
+		self.index.record(self.response(200, {"id": "1", "name": "renamed"}))
+		assert self.index.get("foo") is None
+		assert self.index.get("renamed")["id"] == "1"
+
+	def test_record_delete(self):
+		self.index.record(self.response(204), removed="1")
+		assert self.index.get("foo") is None
+		assert self.index.get_by_id("1") is None
+
+		self.index.record(self.response(204), removed="bar")
+		assert self.index.entries() == []
+
+	def test_record_error_invalidates(self):
+		self.index.record(self.response(409, {"message": "conflict"}))
+		assert not self.index.loaded
+
+	def test_record_without_body_invalidates(self):
+		self.index.record(self.response(201))
+		assert not self.index.loaded
+
+class RateLimiterTestCase(unittest.TestCase):
+
+	def test_wait_spaces_requests(self):
+		limiter = RateLimiter(50)
+
+		start = time.time()
+		for _ in range(5):
+			limiter.wait()
+
+		assert time.time() - start >= 0.07, \
+			"Expect 5 requests at 50/s to take at least 80ms"
+
+	def test_limiter_per_host(self):
+		first = get_rate_limiter("http://kong:8001/apis", 10)
+
+		assert get_rate_limiter("http://kong:8001/consumers", 10) is first
+		assert get_rate_limiter("http://other:8001/apis", 10) is not first
+
+	def test_client_without_limit(self):
+		assert KongClient(mock_kong_admin_url).rate_limiter is None
+		assert KongClient(mock_kong_admin_url, rate_limit=5).rate_limiter is not None
+
+class UnchangedResponseTestCase(unittest.TestCase):
+
+	def test_unchanged_response(self):
+		response = unchanged_response("http://kong/apis/1", {"id": "1"})
+
+		assert response.status_code == 304
+		assert response.ok
+		assert response.json() == {"id": "1"}
+
+class GetClientTestCase(unittest.TestCase):
+
+	def test_get_client_is_shared(self):
+		client = get_client(mock_kong_admin_url)
+		assert get_client(mock_kong_admin_url) is client
+
+	def test_get_client_per_credentials(self):
+		client = get_client(mock_kong_admin_url)
+		assert get_client(mock_kong_admin_url, "admin", "secret") is not client
+
+	def test_classes_share_client(self):
+		api = KongAPI(mock_kong_admin_url)
+		consumer = KongConsumer(mock_kong_admin_url)
+		plugin = KongPlugin(mock_kong_admin_url, "mockbin")
+
+		assert api.client is consumer.client
+		assert api.client is plugin.client
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest, responses, json
+from module_utils.kong_cluster import admin_endpoints, fan_out, combine
+from module_utils.kong_task import KongTask
+import kong_api
+
+first_admin_url = "http://192.168.99.100:8001"
+second_admin_url = "http://192.168.99.101:8001"
+
+class AdminEndpointsTestCase(unittest.TestCase):
+
+	def test_admin_endpoints(self):
+		assert admin_endpoints(None) == []
+		assert admin_endpoints(first_admin_url) == [first_admin_url]
+		assert admin_endpoints("{}, {}" . format (first_admin_url, second_admin_url)) == [first_admin_url, second_admin_url]
+		assert admin_endpoints([first_admin_url, second_admin_url, first_admin_url, ""]) == [first_admin_url, second_admin_url]
+
+class FanOutTestCase(unittest.TestCase):
+
+	def module(self, endpoints, quorum=None, check_mode=False, diff=False):
+		params = dict(
+			kong_admin_uri=endpoints, kong_admin_username=None, kong_admin_password=None, kong_admin_quorum=quorum,
+			name="mockbin", upstream_url="http://mockbin.com", request_host=None, request_path=None,
+			strip_request_path=False, preserve_host=False, state="present",
+		)
+		return KongTask(params, check_mode, diff)
+
+	def add_api(self, base_url, status=201):
+		responses.add(responses.GET, '{}/apis/mockbin' . format (base_url), status=404, body=json.dumps({"message": "Not found"}))
+		responses.add(responses.POST, '{}/apis/' . format (base_url), status=status, body=json.dumps({"id": "1", "name": "mockbin"}))
+
+	@responses.activate
+	def test_single_endpoint(self):
+		self.add_api(first_admin_url)
+
+		result = fan_out(kong_api.run, kong_api.ModuleHelper(), self.module([first_admin_url]))
+
+		assert result["changed"] == True
+		assert "endpoints" not in result, "Expect a single endpoint's result as it is"
+
+	@responses.activate
+	def test_every_endpoint(self):
+		self.add_api(first_admin_url)
+		self.add_api(second_admin_url)
+
+		result = fan_out(kong_api.run, kong_api.ModuleHelper(), self.module([first_admin_url, second_admin_url]))
+
+		assert result["changed"] == True
+		assert result.get("failed", False) == False
+		assert sorted(result["endpoints"]) == [first_admin_url, second_admin_url]
+		assert all(outcome["meta"]["name"] == "mockbin" for outcome in result["endpoints"].values())
+		assert len([call for call in responses.calls if call.request.method == "POST"]) == 2
+
+	@responses.activate
+	def test_failed_endpoint(self):
+		self.add_api(first_admin_url)
+		self.add_api(second_admin_url, status=403)
+
+		result = fan_out(kong_api.run, kong_api.ModuleHelper(), self.module([first_admin_url, second_admin_url]))
+
+		assert result["failed"] == True
+		assert result["failed_endpoints"] == [second_admin_url]
+		assert result["endpoints"][first_admin_url]["changed"] == True, "Expect the other endpoint to be changed still"
+		assert "2 had to succeed" in result["msg"]
+
+	@responses.activate
+	def test_quorum(self):
+		self.add_api(first_admin_url)
+		self.add_api(second_admin_url, status=403)
+
+		result = fan_out(kong_api.run, kong_api.ModuleHelper(), self.module([first_admin_url, second_admin_url], quorum=1))
+
+		assert result.get("failed", False) == False
+		assert result["changed"] == True
+		assert result["warnings"] == ["1 of 2 admin endpoints failed: {}" . format (second_admin_url)]
+
+	@responses.activate
+	def test_endpoint_with_server_error(self):
+		self.add_api(first_admin_url)
+		self.add_api(second_admin_url, status=500)
+
+		result = fan_out(kong_api.run, kong_api.ModuleHelper(), self.module([first_admin_url, second_admin_url], quorum=2))
+
+		assert result["failed"] == True, "Expect a 500 to count against the quorum"
+		assert result["failed_endpoints"] == [second_admin_url]
+		assert result["endpoints"][second_admin_url]["msg"] == "Kong admin API returned 500"
+
+	@responses.activate
+	def test_absent_endpoint(self):
+		for base_url in [first_admin_url, second_admin_url]:
+			responses.add(responses.GET, '{}/apis/mockbin' . format (base_url), status=404, body=json.dumps({"message": "Not found"}))
+		module = self.module([first_admin_url, second_admin_url])
+		module.params["state"] = "absent"
+
+		result = fan_out(kong_api.run, kong_api.ModuleHelper(), module)
+
+		assert result.get("failed", False) == False, "Expect an API that is already gone not to fail"
+		assert result["changed"] == False
+
+	def test_endpoint_that_raises(self):
+
+		def run(helper, module):
+			if module.params["kong_admin_uri"] == second_admin_url:
+				raise ValueError("broken")
+			return dict(changed=False)
+
+		result = fan_out(run, None, self.module([first_admin_url, second_admin_url], quorum=1))
+
+		assert result["endpoints"][second_admin_url] == {"failed": True, "msg": "broken"}
+		assert result["changed"] == False
+
+	def test_combine_diffs(self):
+		results = [
+			dict(changed=True, diff=dict(before_header="mockbin", after_header="mockbin", before={}, after={"name": "mockbin"})),
+			dict(changed=True, diff=[dict(before_header="a", after_header="a", before={}, after={})]),
+		]
+
+		combined = combine([first_admin_url, second_admin_url], results)
+
+		assert [change["before_header"] for change in combined["diff"]] == [
+			"{} mockbin" . format (first_admin_url),
+			"{} a" . format (second_admin_url),
+		]
+		assert "diff" not in combined["endpoints"][first_admin_url]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
-import unittest, responses, requests, json, mock
+import unittest, responses, requests, json, mock, gzip, os, shutil, tempfile
 from mock import call
 from urlparse import parse_qsl, parse_qs
-from kong_consumer import KongConsumer, ModuleHelper, main
+from kong_consumer import KongConsumer, ModuleHelper, main, run
+from module_utils.kong_task import KongTask
+from module_utils.kong_resources import basic_auth_hash
 
 from ansible.module_utils.basic import *
 
@@ -35,17 +37,57 @@ class KongPluginTestCase(unittest.TestCase):
 	@responses.activate 
 	def test_add(self):
 
+		expected_url = "{}/consumers/joesoap" . format(mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=404)
+
 		expected_url = "{}/consumers" . format(mock_kong_admin_url)
 		responses.add(responses.POST, expected_url, status=201)
 
 		response = self.api.add(username='joesoap')
 		assert response.status_code == 201
 
+	@responses.activate 
+	def test_add_existing_unchanged(self):
+
+		expected_url = "{}/consumers/joesoap" . format(mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps({"id": "1", "username": "joesoap", "custom_id": "42"}))
+
+		response = self.api.add(username='joesoap', custom_id=42)
+
+		assert response.status_code == 304
+		assert len(responses.calls) == 1, \
+			"Expect no write for an unchanged consumer"
+
+	@responses.activate 
+	def test_add_existing_changed(self):
+
+		expected_url = "{}/consumers/joesoap" . format(mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps({"id": "1", "username": "joesoap"}))
+
+		expected_url = "{}/consumers/1" . format(mock_kong_admin_url)
+		responses.add(responses.PATCH, expected_url, status=200)
+
+		response = self.api.add(username='joesoap', custom_id='42')
+
+		assert response.status_code == 200
+
+	@responses.activate 
+	def test_add_by_custom_id(self):
+
+		expected_url = "{}/consumers" . format(mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps({"data": [{"id": "1", "custom_id": "42"}]}))
+
+		response = self.api.add(custom_id='42')
+
+		assert response.status_code == 304
+		assert "custom_id=42" in responses.calls[0].request.url
+
 
 	@responses.activate
 	def test_configure_for_plugin(self):
 
 		expected_url = "{}/consumers/joe/auth-key" . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps({"data": []}))
 		responses.add(responses.POST, expected_url, status=201)
 
 		data = { "key": "123" }
@@ -53,11 +95,104 @@ class KongPluginTestCase(unittest.TestCase):
 
 		assert response.status_code == 201
 
-		body = parse_qs(responses.calls[0].request.body)
-		body_exactly = parse_qsl(responses.calls[0].request.body)
+		body = parse_qs(responses.calls[1].request.body)
+		body_exactly = parse_qsl(responses.calls[1].request.body)
 		assert body['key'][0] == "123", \
 			"Expect correct. data to be sent. Got: {}" . format (body_exactly)
 
+	@responses.activate
+	def test_configure_existing_key(self):
+
+		expected_url = "{}/consumers/joe/key-auth" . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps({"data": [{"id": "1", "key": "123", "consumer_id": "c1"}]}))
+
+		response = self.api.configure_for_plugin("joe", "key-auth", {"key": "123"})
+
+		assert response.status_code == 304, "Expect no duplicate key"
+		assert len(responses.calls) == 1
+
+	@responses.activate
+	def test_configure_updates_by_username(self):
+
+		expected_url = "{}/consumers/joe/hmac-auth" . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps({"data": [{"id": "1", "username": "joe", "secret": "old"}]}))
+		responses.add(responses.PATCH, "{}/1" . format (expected_url), status=200, body=json.dumps({"id": "1", "username": "joe", "secret": "new"}))
+
+		response = self.api.configure_for_plugin("joe", "hmac-auth", {"username": "joe", "secret": "new"})
+
+		assert response.status_code == 200
+		assert parse_qs(responses.calls[1].request.body)["secret"] == ["new"]
+
+	@responses.activate
+	def test_unconfigure_for_plugin(self):
+
+		expected_url = "{}/consumers/joe/oauth2" . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps({"data": [{"id": "1", "client_id": "app"}]}))
+		responses.add(responses.DELETE, "{}/1" . format (expected_url), status=204)
+
+		assert self.api.unconfigure_for_plugin("joe", "oauth2", {"client_id": "app"}).status_code == 204
+		assert self.api.unconfigure_for_plugin("joe", "oauth2", {"client_id": "other"}).status_code == 304
+
+	@responses.activate
+	def test_plan_credential(self):
+
+		expected_url = "{}/consumers/joe/key-auth" . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps({"data": [{"id": "1", "key": "123"}]}))
+
+		action, diff = self.api.plan_credential("joe", "key-auth", {"key": "123"})
+		assert action == "none"
+
+		action, diff = self.api.plan_credential("joe", "key-auth", {"key": "456"})
+		assert action == "create"
+		assert diff["after"] == {"key": "456"}
+
+	@responses.activate
+	def test_plan_missing_consumer(self):
+
+		expected_url = "{}/consumers/joe" . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=404)
+
+		action, diff = self.api.plan(username="joe")
+		assert action == "create"
+
+		action, diff = self.api.plan(username="joe", state="absent")
+		assert action == "none"
+
+	@responses.activate
+	def test_stream(self):
+
+		responses.add(responses.GET, "{}/consumers" . format (mock_kong_admin_url), status=200, body=json.dumps({"data": [
+			{"id": "1", "username": "joe", "created_at": 1},
+			{"id": "2", "custom_id": "app", "created_at": 2},
+		]}))
+		responses.add(responses.GET, "{}/consumers/1/key-auth" . format (mock_kong_admin_url), status=200,
+			body=json.dumps({"data": [{"id": "3", "key": "123", "consumer_id": "1", "created_at": 3}]}))
+		responses.add(responses.GET, "{}/consumers/2/key-auth" . format (mock_kong_admin_url), status=200, body=json.dumps({"data": []}))
+
+		consumers = list(self.api.stream(["key-auth"], parallelism=2))
+
+		assert consumers == [
+			{"username": "joe", "credentials": [{"plugin": "key-auth", "data": {"key": "123"}}]},
+			{"custom_id": "app"},
+		]
+
+	@responses.activate
+	def test_stream_basic_auth(self):
+		credential = {"id": "3", "username": "joe", "password": basic_auth_hash("secret", "1"), "consumer_id": "1", "created_at": 3}
+		responses.add(responses.GET, "{}/consumers" . format (mock_kong_admin_url), status=200, body=json.dumps({"data": [{"id": "1", "username": "joe"}]}))
+		responses.add(responses.GET, "{}/consumers/1/basic-auth" . format (mock_kong_admin_url), status=200, body=json.dumps({"data": [credential]}))
+		responses.add(responses.GET, "{}/basic-auths" . format (mock_kong_admin_url), status=200, body=json.dumps({"data": [credential]}))
+
+		consumers = list(self.api.stream(["basic-auth"]))
+
+		assert consumers == [{"username": "joe", "credentials": [{"plugin": "basic-auth", "data": {"username": "joe"}}]}], \
+			"Expect the hashed password to be left out. Got: {}" . format (consumers)
+
+		results = KongConsumer(mock_kong_admin_url).converge(consumers)
+
+		assert [result["action"] for result in results] == ["none", "none"], \
+			"Expect the export to import without a write. Got: {}" . format (results)
+
 	@responses.activate 
 	def test_add_invalid_inputs(self):
 		self.assertRaises(AssertionError, self.api.add)
@@ -75,6 +210,8 @@ class ModuleHelperTestCase(unittest.TestCase):
 	def test_main_add(self, mock_prepare_inputs, mock_module, mock_add, mock_exit_json, mock_get_response):
 
 		mock_prepare_inputs.return_value = (mock_kong_admin_url, "1","joesoap", "present", None, None, None, None)
+		mock_module.return_value.check_mode = False
+		mock_module.return_value.params = {}
 		mock_get_response.return_value = (True, requests.Response())
 		main()
 
@@ -88,6 +225,8 @@ class ModuleHelperTestCase(unittest.TestCase):
 	def test_main_delete(self, mock_prepare_inputs, mock_module, mock_delete, mock_exit_json, mock_get_response):
 
 		mock_prepare_inputs.return_value = (mock_kong_admin_url, "1","joesoap", "absent", None, None, None, None)
+		mock_module.return_value.check_mode = False
+		mock_module.return_value.params = {}
 		mock_get_response.return_value = (True, requests.Response())
 		main()
 
@@ -95,12 +234,14 @@ class ModuleHelperTestCase(unittest.TestCase):
 	
 	@mock.patch.object(ModuleHelper, 'get_response')
 	@mock.patch.object(AnsibleModule, 'exit_json')
-	@mock.patch.object(KongConsumer, 'list')
+	@mock.patch.object(KongConsumer, 'iterate')
 	@mock.patch.object(ModuleHelper, 'get_module')
 	@mock.patch.object(ModuleHelper, 'prepare_inputs')
 	def test_main_list(self, mock_prepare_inputs, mock_module, mock_list, mock_exit_json, mock_get_response):
 
 		mock_prepare_inputs.return_value = (mock_kong_admin_url, "1","joesoap", "list", None, None, None, None)
+		mock_module.return_value.check_mode = False
+		mock_module.return_value.params = {}
 		mock_get_response.return_value = (True, requests.Response())
 		main()
 
@@ -114,6 +255,8 @@ class ModuleHelperTestCase(unittest.TestCase):
 	def test_main_list(self, mock_prepare_inputs, mock_module, mock_configure_for_plugin, mock_exit_json, mock_get_response):
 
 		mock_prepare_inputs.return_value = (mock_kong_admin_url, "1","joesoap", "configure", "auth-key", {"key": "123"}, None, None)
+		mock_module.return_value.check_mode = False
+		mock_module.return_value.params = {}
 		mock_get_response.return_value = (True, requests.Response())
 		main()
 
@@ -145,5 +288,69 @@ class ModuleHelperTestCase(unittest.TestCase):
 
 
 
+class ExportTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def module(self, dest, check_mode=False):
+		params = dict(
+			kong_admin_uri=mock_kong_admin_url, kong_admin_username=None, kong_admin_password=None,
+			state="export", dest=dest, credentials=["acls"], parallelism=1,
+		)
+		return KongTask(params, check_mode)
+
+	def add_consumers(self):
+		responses.add(responses.GET, "{}/consumers" . format (mock_kong_admin_url), status=200, body=json.dumps({"data": [
+			{"id": "1", "username": "joe"},
+			{"id": "2", "username": "jane"},
+		]}))
+		responses.add(responses.GET, "{}/consumers/1/acls" . format (mock_kong_admin_url), status=200, body=json.dumps({"data": [{"id": "3", "group": "admin"}]}))
+		responses.add(responses.GET, "{}/consumers/2/acls" . format (mock_kong_admin_url), status=200, body=json.dumps({"data": []}))
+
+	@responses.activate
+	def test_export(self):
+		self.add_consumers()
+		dest = os.path.join(self.directory, "consumers.jsonl.gz")
+
+		result = run(ModuleHelper(), self.module(dest))
+
+		assert result["changed"] == True
+		assert result["total"] == {"consumers": 2, "credentials": {"acls": 1}}
+		with gzip.open(dest, "rb") as exported:
+			lines = [json.loads(line.decode("utf-8")) for line in exported]
+		assert lines == [
+			{"username": "joe", "credentials": [{"plugin": "acls", "data": {"group": "admin"}}]},
+			{"username": "jane"},
+		]
+
+		result = run(ModuleHelper(), self.module(dest))
+
+		assert result["changed"] == False, "Expect the same export to leave the file alone"
+		assert os.listdir(self.directory) == ["consumers.jsonl.gz"]
+
+	@responses.activate
+	def test_export_check_mode(self):
+		self.add_consumers()
+		dest = os.path.join(self.directory, "consumers.jsonl")
+
+		result = run(ModuleHelper(), self.module(dest, check_mode=True))
+
+		assert result["changed"] == True
+		assert result["total"]["consumers"] == 2
+		assert os.listdir(self.directory) == []
+
+	def test_export_unknown_credentials(self):
+		module = self.module(os.path.join(self.directory, "consumers.jsonl"))
+		module.params["credentials"] = ["passwords"]
+
+		result = run(ModuleHelper(), module)
+
+		assert result["failed"] == True
+		assert "passwords" in result["msg"]
+
 if __name__ == '__main__':
     unittest.main()   
\ No newline at end of file
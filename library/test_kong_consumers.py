@@ -0,0 +1,331 @@
+import unittest, responses, json, mock, gzip, os, shutil, subprocess, sys, tempfile, time
+from six.moves.urllib.parse import parse_qs
+from kong_consumers import KongConsumer, KongEngine, ModuleHelper, CONSUMER_FIELDS, main
+from module_utils.kong_resources import basic_auth_hash, prepare_consumer, validate_consumers
+from ansible.module_utils.basic import AnsibleModule
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "benchmarks"))
+from fake_admin import FakeAdminServer
+
+mock_kong_admin_url = "http://192.168.99.100:8001"
+
+existing_consumers = {'data': [
+	{"id": "1", "username": "same"},
+	{"id": "2", "username": "changed", "custom_id": "old"},
+	{"id": "3", "username": "gone"},
+	{"id": "4", "custom_id": "unmanaged"},
+]}
+
+existing_keys = {'data': [
+	{"id": "k1", "consumer_id": "1", "key": "abc"},
+	{"id": "k2", "consumer_id": "1", "key": "stale"},
+]}
+
+class ConvergeTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.api = KongConsumer(mock_kong_admin_url)
+		self.consumers = [
+			{"username": "same", "credentials": [{"plugin": "key-auth", "data": {"key": "abc"}}]},
+			{"username": "changed", "custom_id": "new"},
+			{"username": "new", "credentials": [{"plugin": "key-auth", "data": {"key": "def"}}]},
+			{"username": "gone", "state": "absent"},
+		]
+		self.consumers_url = '{}/consumers' . format (mock_kong_admin_url)
+		responses.add(responses.GET, self.consumers_url, status=200, body=json.dumps(existing_consumers))
+		responses.add(responses.GET, '{}/key-auths' . format (mock_kong_admin_url), status=200, body=json.dumps(existing_keys))
+		responses.add(responses.POST, self.consumers_url, status=201, body=json.dumps({"id": "5", "username": "new"}))
+		responses.add(responses.PATCH, '{}/2' . format (self.consumers_url), status=200, body=json.dumps({"id": "2", "username": "changed", "custom_id": "new"}))
+		responses.add(responses.DELETE, '{}/3' . format (self.consumers_url), status=204)
+		responses.add(responses.DELETE, '{}/4' . format (self.consumers_url), status=204)
+		responses.add(responses.POST, '{}/new/key-auth' . format (self.consumers_url), status=201, body=json.dumps({"id": "k3", "key": "def"}))
+		responses.add(responses.DELETE, '{}/1/key-auth/k2' . format (self.consumers_url), status=204)
+
+	@responses.activate
+	def test_converge(self):
+
+		results = self.api.converge(iter(self.consumers))
+
+		actions = dict((result['name'], result['action']) for result in results)
+		assert actions == {
+			"same": "none",
+			"same/key-auth": "none",
+			"changed": "update",
+			"new": "create",
+			"new/key-auth": "create",
+			"gone": "delete",
+		}, "Unexpected plan: {}" . format (actions)
+
+		gets = [call.request.url.split("?")[0] for call in responses.calls if call.request.method == "GET"]
+		assert gets == [self.consumers_url, '{}/key-auths' . format (mock_kong_admin_url)], \
+			"Expect one listing of consumers and one of keys. Got: {}" . format (gets)
+		assert not any(result['failed'] for result in results)
+
+	@responses.activate
+	def test_credentials_after_consumers(self):
+
+		self.api.converge(self.consumers, engine=KongEngine(4))
+
+		urls = [call.request.url for call in responses.calls if call.request.method == "POST"]
+		assert urls == [self.consumers_url, '{}/new/key-auth' . format (self.consumers_url)], \
+			"Expect the consumer to be created before its key. Got: {}" . format (urls)
+		body = parse_qs(responses.calls[-1].request.body)
+		assert body['key'] == ['def']
+
+	@responses.activate
+	def test_converge_purge(self):
+
+		results = self.api.converge(self.consumers, purge=True)
+
+		deleted = sorted(result['name'] for result in results if result['action'] == "delete")
+		assert deleted == ["gone", "same/key-auth", "unmanaged"]
+
+	@responses.activate
+	def test_credentials_without_collection(self):
+		responses.replace(responses.GET, '{}/key-auths' . format (mock_kong_admin_url), status=404, body=json.dumps({"message": "Not found"}))
+		responses.add(responses.GET, '{}/1/key-auth' . format (self.consumers_url), status=200, body=json.dumps({"data": [{"id": "k1", "key": "abc"}]}))
+
+		results = self.api.converge(self.consumers[:1])
+
+		assert [result['action'] for result in results] == ["none", "none"]
+
+	@responses.activate
+	def test_converge_check_mode(self):
+
+		results = self.api.converge(self.consumers, purge=True, check_mode=True)
+
+		methods = [call.request.method for call in responses.calls]
+		assert methods == ["GET", "GET"], \
+			"Expect no writes in check mode. Got: {}" . format (methods)
+
+		outcomes = dict((outcome['name'], outcome['action']) for outcome in results)
+		assert outcomes["unmanaged"] == "delete"
+		assert outcomes["new/key-auth"] == "create"
+		diffs = dict((outcome['name'], outcome.get('diff')) for outcome in results)
+		assert diffs["changed"]["after"]["custom_id"] == "new"
+
+class CredentialsTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.api = KongConsumer(mock_kong_admin_url)
+		self.consumers_url = '{}/consumers' . format (mock_kong_admin_url)
+		self.now = time.time()
+		keys = {'data': [
+			{"id": "k1", "consumer_id": "1", "key": "new", "created_at": int((self.now - 60) * 1000)},
+			{"id": "k2", "consumer_id": "1", "key": "old", "created_at": int((self.now - 3600) * 1000)},
+		]}
+		responses.add(responses.GET, self.consumers_url, status=200, body=json.dumps({"data": [{"id": "1", "username": "same"}]}))
+		responses.add(responses.GET, '{}/key-auths' . format (mock_kong_admin_url), status=200, body=json.dumps(keys))
+		responses.add(responses.DELETE, '{}/1/key-auth/k2' . format (self.consumers_url), status=204)
+
+	def converge(self, credentials, **options):
+		return self.api.converge([{"username": "same", "credentials": credentials}], **options)
+
+	@responses.activate
+	def test_update_by_key(self):
+		responses.add(responses.PATCH, '{}/1/basic-auth/b1' . format (self.consumers_url), status=200, body=json.dumps({"id": "b1"}))
+		responses.add(responses.GET, '{}/basic-auths' . format (mock_kong_admin_url), status=200, body=json.dumps({"data": [
+			{"id": "b1", "consumer_id": "1", "username": "joe", "password": basic_auth_hash("secret", "1")},
+		]}))
+
+		unchanged = self.converge([{"plugin": "basic-auth", "data": {"username": "joe", "password": "secret"}}])
+		changed = self.converge([{"plugin": "basic-auth", "data": {"username": "joe", "password": "other"}}])
+
+		assert [result["action"] for result in unchanged] == ["none", "none"], "Expect the hashed password to match"
+		assert [result["action"] for result in changed] == ["none", "update"]
+		assert parse_qs(responses.calls[-1].request.body) == {"username": ["joe"], "password": ["other"]}
+
+	@responses.activate
+	def test_absent(self):
+
+		results = self.converge([{"plugin": "key-auth", "data": {"key": "old"}, "state": "absent"}, {"plugin": "key-auth", "data": {"key": "gone"}, "state": "absent"}])
+
+		assert [(result["name"], result["action"]) for result in results] == [("same", "none"), ("same/key-auth", "delete"), ("same/key-auth", "none")], \
+			"Expect the results in the order of the credentials"
+		assert responses.calls[-1].request.method == "DELETE"
+
+	@responses.activate
+	def test_rotation_keeps_old_keys_during_grace(self):
+		responses.add(responses.POST, '{}/same/key-auth' . format (self.consumers_url), status=201, body=json.dumps({"id": "k3", "key": "newer"}))
+
+		results = self.converge([{"plugin": "key-auth", "data": {"key": "newer"}}], grace=600)
+		actions = sorted(result["action"] for result in results)
+
+		assert actions == ["create", "keep", "keep", "none"], "Expect the old keys kept while the new one is added. Got: {}" . format (actions)
+		assert not any(call.request.method == "DELETE" for call in responses.calls)
+
+	@responses.activate
+	def test_rotation_prunes_after_grace(self):
+
+		within = self.converge([{"plugin": "key-auth", "data": {"key": "new"}}], grace=600)
+		after = self.converge([{"plugin": "key-auth", "data": {"key": "new"}}], grace=30)
+
+		assert sorted(result["action"] for result in within) == ["keep", "none", "none"]
+		assert sorted(result["action"] for result in after) == ["delete", "none", "none"]
+		assert responses.calls[-1].request.url == '{}/1/key-auth/k2' . format (self.consumers_url)
+
+	def test_validate(self):
+		consumers = [prepare_consumer({"username": "joe", "credentials": [{"plugin": "key-auth", "state": "absent"}]})]
+
+		assert validate_consumers(consumers) == "A credential of consumer joe to remove needs its key"
+
+class ModuleHelperTestCase(unittest.TestCase):
+
+	def setUp(self):
+		class MockModule:
+			pass
+
+		self.helper = ModuleHelper(CONSUMER_FIELDS)
+		self.module = MockModule()
+		self.module.params = {
+			"kong_admin_uri": mock_kong_admin_url,
+			"kong_admin_username": None,
+			"kong_admin_password": None,
+			"purge": False,
+			"src": None,
+			"consumers": [
+				{"username": "joesoap", "unknown": "x", "credentials": [{"plugin": "key-auth"}]},
+				{"custom_id": "1234", "state": "absent"},
+			]
+		}
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def write(self, name, content):
+		path = os.path.join(self.directory, name)
+		with open(path, "w") as output:
+			output.write(content)
+		return path
+
+	def test_items(self):
+
+		items = list(self.helper.items(self.module))
+
+		assert items == [
+			{"username": "joesoap", "credentials": [{"plugin": "key-auth", "data": {}}]},
+			{"custom_id": "1234", "state": "absent"},
+		], "Unexpected items: {}" . format (items)
+
+	def test_read_json_lines(self):
+		self.module.params['src'] = self.write("consumers.jsonl", '{"username": "a"}\n\n{"custom_id": "b"}\n')
+
+		items = list(self.helper.items(self.module))
+
+		assert items == [{"username": "a"}, {"custom_id": "b"}]
+
+	def test_read_gzipped_json_lines(self):
+		path = os.path.join(self.directory, "consumers.jsonl.gz")
+		with gzip.open(path, "wb") as output:
+			output.write(b'{"username": "a"}\n')
+		self.module.params['src'] = path
+
+		items = list(self.helper.items(self.module))
+
+		assert items == [{"username": "a"}]
+
+	def test_read_json_lines_error(self):
+		path = self.write("consumers.jsonl", '{"username": "a"}\n{\n')
+
+		try:
+			list(self.helper.read_items(path))
+		except ValueError as error:
+			assert "line 2" in str(error)
+		else:
+			self.fail("Expect ValueError to be raised")
+
+	def test_read_csv(self):
+		self.module.params['src'] = self.write("consumers.csv", "username,custom_id,key-auth.key\njoesoap,,abc\n,1234,\n")
+
+		items = list(self.helper.items(self.module))
+
+		assert items == [
+			{"username": "joesoap", "credentials": [{"plugin": "key-auth", "data": {"key": "abc"}}]},
+			{"custom_id": "1234"},
+		], "Unexpected items: {}" . format (items)
+
+	def test_read_gzipped_csv(self):
+		path = os.path.join(self.directory, "consumers.csv.gz")
+		with gzip.open(path, "wb") as output:
+			output.write(b"username,key-auth.key\njoesoap,abc\n")
+		self.module.params['src'] = path
+
+		items = list(self.helper.items(self.module))
+
+		assert items == [{"username": "joesoap", "credentials": [{"plugin": "key-auth", "data": {"key": "abc"}}]}], \
+			"Expect the file to be read as CSV. Got: {}" . format (items)
+
+	def test_validate(self):
+		assert self.helper.validate([{"username": "a"}, {"custom_id": "b"}]) is None
+		assert self.helper.validate([{"state": "absent"}]) is not None
+		assert self.helper.validate([{"username": "a", "credentials": [{"data": {}}]}]) is not None
+
+	def test_get_response(self):
+		results = [
+			{"name": "a", "action": "none", "changed": False, "failed": False, "status_code": None},
+			{"name": "b", "action": "create", "changed": True, "failed": False, "status_code": 201},
+			{"name": "c", "action": "create", "changed": False, "failed": True, "status_code": 409},
+		]
+		has_changed, failed, results, summary = self.helper.get_response(results)
+
+		assert has_changed == True
+		assert [result['name'] for result in failed] == ["c"]
+		assert [result['name'] for result in results] == ["b", "c"]
+		assert summary == {"none": 1, "create": 2}
+
+class MainTestCase(unittest.TestCase):
+
+	@mock.patch.object(AnsibleModule, 'exit_json')
+	@mock.patch.object(KongConsumer, 'converge')
+	@mock.patch.object(ModuleHelper, 'get_module')
+	@mock.patch.object(ModuleHelper, 'prepare_inputs')
+	def test_main(self, mock_prepare_inputs, mock_module, mock_converge, mock_exit_json):
+
+		mock_prepare_inputs.return_value = (mock_kong_admin_url, True, None, None)
+		mock_module.return_value.check_mode = False
+		mock_module.return_value.params = {"src": None, "consumers": [{"username": "joesoap"}], "parallelism": 4}
+		mock_converge.return_value = [{"name": "joesoap", "action": "create", "changed": True, "failed": False, "status_code": 201}]
+		main()
+
+		args = mock_converge.call_args[0]
+		assert list(args[0]) == [{"username": "joesoap"}]
+		assert args[1] == True
+		assert isinstance(args[2], KongEngine)
+
+ANSIBLE_PLAYBOOK = os.path.join(os.path.dirname(sys.executable), "ansible-playbook")
+
+@unittest.skipUnless(os.path.exists(ANSIBLE_PLAYBOOK), "Needs the ansible-playbook command of this Python")
+class AnsibleTestCase(unittest.TestCase):
+	"""Runs the module the way Ansible does, packaged with the module_utils
+	it imports, on the Python running the tests"""
+
+	def setUp(self):
+		self.server = FakeAdminServer().start()
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		self.server.stop()
+		shutil.rmtree(self.directory)
+
+	def playbook(self, **params):
+		path = os.path.join(self.directory, "playbook.yml")
+		with open(path, "w") as playbook:
+			json.dump([dict(hosts="localhost", connection="local", gather_facts=False, vars=dict(ansible_python_interpreter=sys.executable),
+				tasks=[dict(kong_consumers=dict(params, kong_admin_uri=self.server.url))])], playbook)
+		return path
+
+	def test_run_through_ansible(self):
+		env = dict(os.environ, ANSIBLE_LIBRARY=HERE, ANSIBLE_MODULE_UTILS=os.path.join(HERE, "module_utils"),
+			ANSIBLE_LOCAL_TEMP=self.directory, ANSIBLE_REMOTE_TEMP=self.directory, ANSIBLE_INVENTORY_UNPARSED_WARNING="false")
+		playbook = self.playbook(consumers=[dict(username="joesoap")], engine="threads")
+		process = subprocess.Popen([ANSIBLE_PLAYBOOK, "-i", "localhost,", playbook], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+		output = process.communicate()[0].decode("utf-8")
+
+		assert process.returncode == 0, "Expect the module to be packaged and run. Got: {}" . format (output)
+		assert "changed=1" in output
+		assert len(self.server.store.consumers) == 1
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest, threading, time, requests
+from functools import partial
+from module_utils.kong_engine import KongEngine, Operation, result
+
+def response(status_code):
+	response = requests.Response()
+	response.status_code = status_code
+	return response
+
+class OperationTestCase(unittest.TestCase):
+
+	def test_result_from_response(self):
+		outcome = Operation("mockbin", "create", partial(response, 201))()
+
+		assert outcome['name'] == "mockbin"
+		assert outcome['action'] == "create"
+		assert outcome['changed'] == True
+		assert outcome['failed'] == False
+
+	def test_action_from_status(self):
+		assert Operation("a", None, partial(response, 304))()['action'] == "none"
+		assert Operation("a", None, partial(response, 200))()['action'] == "update"
+		assert Operation("a", None, partial(response, 409))()['failed'] == True
+
+	def test_exception(self):
+		def broken():
+			raise requests.ConnectionError("reset")
+
+		outcome = Operation("mockbin", "update", broken)()
+
+		assert outcome['failed'] == True
+		assert outcome['changed'] == False
+		assert "reset" in outcome['msg']
+
+	def test_result_without_response(self):
+		assert result("mockbin", "none") == dict(
+			name="mockbin", action="none", changed=False, failed=False, status_code=None, msg=None)
+
+class KongEngineTestCase(unittest.TestCase):
+
+	def test_results_keep_order(self):
+		stage = [Operation(str(i), None, partial(response, 201)) for i in range(20)]
+
+		results = KongEngine(4).run([stage])
+
+		assert [outcome['name'] for outcome in results] == [str(i) for i in range(20)]
+
+	def test_runs_concurrently(self):
+		lock = threading.Lock()
+		running = [0, 0]
+
+		def call():
+			with lock:
+				running[0] += 1
+				running[1] = max(running)
+			time.sleep(0.05)
+			with lock:
+				running[0] -= 1
+			return response(201)
+
+		KongEngine(4).run([[Operation(str(i), None, call) for i in range(8)]])
+
+		assert running[1] > 1, "Expect operations to overlap"
+		assert running[1] <= 4, "Expect no more than 4 operations at once"
+
+	def test_stages_in_order(self):
+		calls = []
+
+		def call(name):
+			time.sleep(0.01 if name.startswith("api") else 0)
+			calls.append(name)
+			return response(201)
+
+		stages = [
+			[Operation("api1", None, partial(call, "api1")), Operation("api2", None, partial(call, "api2"))],
+			[Operation("plugin1", None, partial(call, "plugin1"))],
+		]
+		KongEngine(4).run(stages)
+
+		assert calls[-1] == "plugin1", \
+			"Expect the second stage to start after the first one. Got: {}" . format (calls)
+
+if __name__ == '__main__':
+    unittest.main()
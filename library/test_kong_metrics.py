@@ -0,0 +1,96 @@
+import unittest, responses, json, os, shutil, tempfile
+from module_utils.kong_metrics import Metrics, endpoint
+from module_utils.kong_client import KongClient, entry_response
+
+mock_kong_admin_url = "http://192.168.99.100:8001"
+
+class EndpointTestCase(unittest.TestCase):
+
+	def test_endpoint(self):
+		assert endpoint("", "{}/apis" . format (mock_kong_admin_url)) == "/apis"
+		assert endpoint("", "{}/apis/mockbin/plugins/1?size=10" . format (mock_kong_admin_url)) == "/apis/{}/plugins/{}"
+		assert endpoint("/admin", "http://kong/admin/consumers/joe/key-auth") == "/consumers/{}/key-auth"
+
+class MetricsTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.metrics = Metrics(mock_kong_admin_url, slowest=2)
+		self.url = "{}/apis/mockbin" . format (mock_kong_admin_url)
+
+	def test_summary(self):
+		self.metrics.record("get", self.url, entry_response(self.url, {"id": "1"}, 200), 0.1)
+		self.metrics.record("get", self.url, None, 0.3)
+		self.metrics.record("get", "{}/apis/other" . format (mock_kong_admin_url), entry_response(self.url, {}, 404), 0.2, retry=True)
+		self.metrics.record("patch", self.url, entry_response(self.url, {}, 200), 0.05, sent=12)
+
+		summary = self.metrics.summary()
+
+		assert summary["calls"] == 4
+		assert summary["time"] == 0.65
+		assert summary["retries"] == 1
+		assert summary["bytes_sent"] == 12
+		assert summary["bytes_received"] == len('{"id": "1"}') + 4
+		assert summary["statuses"] == {"200": 2, "404": 1, "error": 1}
+		assert summary["endpoints"]["GET /apis/{}"] == {"calls": 3, "time": 0.6, "max": 0.3, "retries": 1}
+		assert summary["endpoints"]["PATCH /apis/{}"]["calls"] == 1
+		assert [call["time"] for call in summary["slowest"]] == [0.3, 0.2]
+		assert summary["slowest"][0] == {"method": "GET", "url": self.url, "status": "error", "time": 0.3}
+
+	def test_write(self):
+		directory = tempfile.mkdtemp()
+		try:
+			path = os.path.join(directory, "trace.jsonl")
+			self.metrics.record("get", self.url, entry_response(self.url, {}, 200), 0.1)
+			self.metrics.write(path)
+			self.metrics.write(path)
+
+			with open(path) as trace:
+				lines = [json.loads(line) for line in trace]
+			assert len(lines) == 2
+			assert lines[0]["calls"] == 1
+			assert lines[0]["admin"] == mock_kong_admin_url
+			assert "timestamp" in lines[0]
+
+			self.metrics.write(os.path.join(directory, "missing", "trace.jsonl"))
+		finally:
+			shutil.rmtree(directory)
+
+class ClientMetricsTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.trace = os.path.join(self.directory, "trace.jsonl")
+		self.url = "{}/apis/" . format (mock_kong_admin_url)
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_off_by_default(self):
+		client = KongClient(mock_kong_admin_url)
+		assert client.metrics is None
+		assert "metrics" not in client.stats()
+
+	@responses.activate
+	def test_client_metrics(self):
+		responses.add(responses.GET, self.url, status=503)
+		responses.add(responses.GET, self.url, status=200, body=json.dumps({"data": []}))
+		responses.add(responses.POST, self.url, status=201, body=json.dumps({"id": "1"}))
+
+		client = KongClient(mock_kong_admin_url, retry_backoff=0.001, trace=self.trace)
+		client.get(self.url)
+		client.post(self.url, {"name": "mockbin"})
+		stats = client.stats()
+
+		metrics = stats["metrics"]
+		assert metrics["calls"] == 3
+		assert metrics["retries"] == 1
+		assert metrics["bytes_sent"] == len("name=mockbin")
+		assert metrics["endpoints"]["GET /apis"]["calls"] == 2
+		assert metrics["endpoints"]["POST /apis"]["calls"] == 1
+		assert metrics["statuses"] == {"503": 1, "200": 1, "201": 1}
+
+		with open(self.trace) as trace:
+			assert json.loads(trace.readline())["calls"] == 3
+
+if __name__ == '__main__':
+    unittest.main()
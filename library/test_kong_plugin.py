@@ -1,5 +1,5 @@
 import unittest, responses, requests, json, mock
-from urlparse import parse_qsl, parse_qs
+from urlparse import parse_qsl, parse_qs, urlparse
 from kong_plugin import KongPlugin, ModuleHelper, main
 
 from ansible.module_utils.basic import *
@@ -38,27 +38,31 @@ class KongPluginTestCase(unittest.TestCase):
 		assert response.status_code == 201, \
 			"Expect 201 Created, got: {}: {}" . format (response.status_code, response.content)
 
-	def test__get_plugin_id(self):
+	@responses.activate
+	def test_find_in_index(self):
 
-		plugins_list = [
+		self.api.index.load([
 			{"name":"needle", "id": 123},
-			{"name":"request-transformer"}
-		]
+			{"name":"request-transformer", "id": 456}
+		])
 
-		plugin_id = self.api._get_plugin_id("needle", plugins_list)
-		assert plugin_id == 123, \
-			'Expect the correct plugin_id to be returned. Expected 123. Got: {}' . format (plugin_id)
+		plugin = self.api.find("needle")
+		assert plugin["id"] == 123, \
+			'Expect the correct plugin to be returned. Expected 123. Got: {}' . format (plugin)
+		assert len(responses.calls) == 0, "Expect a loaded index to be used without calling Kong"
 
-	def test__get_plugin_id_plugin_doesnt_exist(self):
+	@responses.activate
+	def test_find_in_index_plugin_doesnt_exist(self):
 
-		plugins_list = [
-			{"name":"haystack"},
-			{"name":"request-transformer"}
-		]
+		self.api.index.load([
+			{"name":"haystack", "id": 123},
+			{"name":"request-transformer", "id": 456}
+		])
 
-		plugin = self.api._get_plugin_id("needle", plugins_list)
+		plugin = self.api.find("needle")
 		assert plugin is None, \
 			'Expect it to return None if no plugin is found. Expected None. Got: {}' . format (plugin)
+		assert len(responses.calls) == 0
 
 
 	@responses.activate
@@ -75,10 +79,102 @@ class KongPluginTestCase(unittest.TestCase):
 		expected_url = "{}/apis/mockbin/plugins/1" . format (mock_kong_admin_url)
 		responses.add(responses.PATCH, expected_url, status=200)
 
-		response = self.api.add_or_update("basic-auth")
+		response = self.api.add_or_update("basic-auth", {"config.hide_credentials": "true"})
 
 		assert response.status_code == 200
 
+	@responses.activate
+	def test_plugin_unchanged(self):
+		example_response = {"data":[
+								{"id":"1", "name":"request-transformer", "enabled": True,
+								 "config": {"add": {"headers": ["x-new-header:some_value", "x-another-header:some_value"]}}}
+							  ]
+							}
+
+		expected_url = "{}/apis/mockbin/plugins" . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps(example_response))
+
+		config = {"config.add.headers": "x-new-header:some_value, x-another-header:some_value"}
+		response = self.api.add_or_update("request-transformer", config)
+
+		assert response.status_code == 304
+		assert len(responses.calls) == 1, \
+			"Expect no PATCH for an unchanged plugin"
+
+
+	@responses.activate
+	def test_plugin_update_after_delete(self):
+		example_response = {"data":[{"id":"1", "name":"basic-auth"}]}
+
+		expected_url = "{}/apis/mockbin/plugins" . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps(example_response))
+		responses.add(responses.POST, expected_url, status=201, body=json.dumps({"id":"2", "name":"basic-auth"}))
+
+		expected_url = "{}/apis/mockbin/plugins/1" . format (mock_kong_admin_url)
+		responses.add(responses.PATCH, expected_url, status=200, body=json.dumps({"id":"1", "name":"basic-auth"}))
+		responses.add(responses.DELETE, expected_url, status=204)
+
+		self.api._load_index()
+		self.api.add_or_update("basic-auth", {"config.hide_credentials": "true"})
+		self.api.delete("1")
+		response = self.api.add_or_update("basic-auth")
+
+		methods = [call.request.method for call in responses.calls]
+		assert methods == ["GET", "PATCH", "DELETE", "POST"], \
+			"Expect the index to follow the delete without listing again. Got: {}" . format (methods)
+
+	@responses.activate
+	def test_plugin_plan(self):
+		example_response = {"data":[{"id":"1", "name":"rate-limiting", "config": {"minute": 20}}]}
+
+		expected_url = "{}/apis/mockbin/plugins" . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps(example_response))
+
+		self.api._load_index()
+		assert self.api.plan("rate-limiting", {"config.minute": 20})[0] == "none"
+		assert self.api.plan("rate-limiting", {"config.minute": 30})[0] == "update"
+		assert self.api.plan("key-auth")[0] == "create"
+		assert len(responses.calls) == 1
+
+	@responses.activate
+	def test_plugin_lookup_is_filtered(self):
+		expected_url = "{}/apis/mockbin/plugins" . format (mock_kong_admin_url)
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps({"data": [{"id": "1", "name": "cors"}]}))
+
+		assert self.api.find("cors")["id"] == "1"
+		assert parse_qs(urlparse(responses.calls[0].request.url).query)["name"] == ["cors"]
+
+	@responses.activate
+	def test_global_plugin(self):
+		plugin = KongPlugin(mock_kong_admin_url)
+		expected_url = "{}/plugins" . format (mock_kong_admin_url)
+		existing = {"data": [{"id": "1", "name": "cors", "api_id": "a1"}, {"id": "2", "name": "cors", "consumer_id": "c1"}]}
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps(existing))
+		responses.add(responses.POST, expected_url, status=201, body=json.dumps({"id": "3", "name": "cors"}))
+
+		response = plugin.add_or_update("cors", {"config.origin": "*"})
+
+		assert response.status_code == 201, \
+			"Expect the plugins of an API or consumer not to count as the global plugin"
+		assert parse_qs(urlparse(responses.calls[0].request.url).query)["name"] == ["cors"]
+		assert parse_qs(responses.calls[1].request.body) == {"name": ["cors"], "config.origin": ["*"]}
+
+	@responses.activate
+	def test_consumer_plugin(self):
+		plugin = KongPlugin(mock_kong_admin_url, consumer="joe")
+		responses.add(responses.GET, "{}/consumers/joe" . format (mock_kong_admin_url), status=200, body=json.dumps({"id": "c1", "username": "joe"}))
+		expected_url = "{}/plugins" . format (mock_kong_admin_url)
+		existing = {"data": [{"id": "1", "name": "rate-limiting", "consumer_id": "c1", "api_id": "a1"}, {"id": "2", "name": "rate-limiting", "consumer_id": "c1", "config": {"minute": 20}}]}
+		responses.add(responses.GET, expected_url, status=200, body=json.dumps(existing))
+		responses.add(responses.PATCH, "{}/plugins/2" . format (mock_kong_admin_url), status=200, body=json.dumps({"id": "2"}))
+
+		response = plugin.add_or_update("rate-limiting", {"config.minute": 30})
+
+		assert response.status_code == 200
+		query = parse_qs(urlparse(responses.calls[1].request.url).query)
+		assert query["name"] == ["rate-limiting"]
+		assert query["consumer_id"] == ["c1"]
+		assert responses.calls[2].request.method == "PATCH"
 
 	@responses.activate
 	def test_plugin_delete(self):
@@ -114,6 +210,8 @@ class MainTestCase(unittest.TestCase):
 	def test_main_present(self, mock_prepare_inputs, mock_module, mock_add_or_update, mock_exit_json, mock_get_response):
 
 		mock_prepare_inputs.return_value = ("","mockbin", {}, "present", None, None)
+		mock_module.return_value.check_mode = False
+		mock_module.return_value.params = {}
 		mock_get_response.return_value = (True, requests.Response())
 		main()
 
@@ -127,6 +225,8 @@ class MainTestCase(unittest.TestCase):
 	def test_main_delete(self, mock_prepare_inputs, mock_module, mock_delete, mock_exit_json, mock_get_response):
 
 		mock_prepare_inputs.return_value = ("","mockbin", {}, "absent", None, None)
+		mock_module.return_value.check_mode = False
+		mock_module.return_value.params = {"plugin_id": "1"}
 		mock_get_response.return_value = (True, requests.Response())
 		main()
 
@@ -134,12 +234,14 @@ class MainTestCase(unittest.TestCase):
 
 	@mock.patch.object(ModuleHelper, 'get_response')
 	@mock.patch.object(AnsibleModule, 'exit_json')
-	@mock.patch.object(KongPlugin, 'list')
+	@mock.patch.object(KongPlugin, 'iterate')
 	@mock.patch.object(ModuleHelper, 'get_module')
 	@mock.patch.object(ModuleHelper, 'prepare_inputs')
 	def test_main_list(self, mock_prepare_inputs, mock_module, mock_list, mock_exit_json, mock_get_response):
 
 		mock_prepare_inputs.return_value = ("","mockbin", {}, "list", None, None)
+		mock_module.return_value.check_mode = False
+		mock_module.return_value.params = {}
 		mock_get_response.return_value = (True, requests.Response())
 		main()
 
@@ -170,6 +272,15 @@ class MainTestCase(unittest.TestCase):
 
 		assert has_changed == True
 
+	def test_handle_response_present_unchanged(self):
+		
+		mock_response = requests.Response()
+		mock_response.status_code = 304
+
+		has_changed, meta = ModuleHelper().get_response(mock_response, "present")
+
+		assert has_changed == False
+
 	def test_handle_response_present_not_201(self, ):
 		
 		mock_response = requests.Response()
@@ -0,0 +1,177 @@
+import unittest, responses, json, mock
+import kong_prune
+from kong_prune import KongAPI, KongConsumer, KongUpstream, KongEngine, ModuleHelper, Selector, main
+from module_utils.kong_task import KongTask
+
+mock_kong_admin_url = "http://192.168.99.100:8001"
+
+live_apis = {'data': [
+	{"id": "a1", "name": "pr-1-users", "upstream_url": "http://users.com"},
+	{"id": "a2", "name": "pr-1-orders", "upstream_url": "http://orders.com"},
+	{"id": "a3", "name": "orders", "upstream_url": "http://orders.com"},
+]}
+
+live_plugins = {'data': [
+	{"id": "p1", "api_id": "a1", "name": "key-auth", "config": {}},
+	{"id": "p2", "api_id": "a1", "consumer_id": "c1", "name": "rate-limiting", "config": {}},
+	{"id": "p3", "api_id": "a3", "name": "cors", "config": {}},
+	{"id": "p4", "consumer_id": "c2", "name": "rate-limiting", "config": {}},
+]}
+
+live_consumers = {'data': [
+	{"id": "c1", "username": "joesoap"},
+	{"id": "c2", "username": "leaver"},
+	{"id": "c3", "custom_id": "1234"},
+]}
+
+live_keys = {'data': [
+	{"id": "k1", "consumer_id": "c1", "key": "abc"},
+	{"id": "k2", "consumer_id": "c2", "key": "def"},
+]}
+
+class SelectorTestCase(unittest.TestCase):
+
+	def test_matches(self):
+		entry = {"name": "pr-1-users", "tags": ["ephemeral", "pr-1"]}
+
+		assert Selector(prefix="pr-1-").matches(["pr-1-users"], entry)
+		assert not Selector(prefix="pr-2-").matches(["pr-1-users"], entry)
+		assert Selector(regex="-users$").matches(["pr-1-users"], entry)
+		assert Selector(tags=["ephemeral"]).matches(["pr-1-users"], entry)
+		assert not Selector(tags=["ephemeral", "pr-2"]).matches(["pr-1-users"], entry)
+		assert not Selector(tags=["ephemeral"]).matches(["orders"], {"name": "orders"})
+		assert not Selector(prefix="pr-", keep=["pr-1-users"]).matches(["pr-1-users"], entry)
+
+	def test_matches_any_name(self):
+		selector = Selector(keep=["joesoap", "1234"])
+
+		assert not selector.matches([None, "1234"], {})
+		assert selector.matches(["leaver", None], {})
+
+	def test_given(self):
+		assert not Selector().given
+		assert Selector(keep=[]).given, "Expect an empty keep list to pick everything"
+		assert Selector().matches(["anything"], {})
+
+class PruneTestCase(unittest.TestCase):
+
+	def setUp(self):
+		responses.add(responses.GET, '{}/apis' . format (mock_kong_admin_url), status=200, body=json.dumps(live_apis))
+		responses.add(responses.GET, '{}/plugins' . format (mock_kong_admin_url), status=200, body=json.dumps(live_plugins))
+		responses.add(responses.GET, '{}/consumers' . format (mock_kong_admin_url), status=200, body=json.dumps(live_consumers))
+		responses.add(responses.GET, '{}/key-auths' . format (mock_kong_admin_url), status=200, body=json.dumps(live_keys))
+		for path in ["plugins/p1", "plugins/p2", "plugins/p4", "apis/a1", "apis/a2", "consumers/c2", "consumers/c2/key-auth/k2"]:
+			responses.add(responses.DELETE, '{}/{}' . format (mock_kong_admin_url, path), status=204)
+
+	def deleted(self):
+		return [call.request.url.replace(mock_kong_admin_url, "") for call in responses.calls if call.request.method == "DELETE"]
+
+	@responses.activate
+	def test_prune_apis(self):
+
+		results = KongAPI(mock_kong_admin_url).prune(Selector(prefix="pr-1-"), KongEngine(4))
+
+		outcomes = [(result['kind'], result['name'], result['action']) for result in results]
+		assert outcomes == [
+			("plugin", "pr-1-users/key-auth", "delete"),
+			("plugin", "pr-1-users/rate-limiting", "delete"),
+			("api", "pr-1-orders", "delete"),
+			("api", "pr-1-users", "delete"),
+		], "Expect the plugins to go first. Got: {}" . format (outcomes)
+		assert sorted(self.deleted()[:2]) == ["/plugins/p1", "/plugins/p2"]
+		assert sorted(self.deleted()[2:]) == ["/apis/a1", "/apis/a2"], "Expect the APIs to be deleted by id, without a GET by name"
+		assert [call.request.method for call in responses.calls].count("GET") == 2, \
+			"Expect one scan of the APIs and one of the plugins"
+
+	@responses.activate
+	def test_prune_check_mode(self):
+
+		results = KongAPI(mock_kong_admin_url).prune(Selector(regex="orders"), check_mode=True)
+
+		assert [(result['name'], result['changed']) for result in results] == [("orders/cors", True), ("orders", True), ("pr-1-orders", True)]
+		assert self.deleted() == []
+		assert ModuleHelper().get_matched(results) == {"plugin": 1, "api": 2}
+
+	@responses.activate
+	def test_prune_nothing(self):
+
+		results = KongAPI(mock_kong_admin_url).prune(Selector(prefix="pr-2-"))
+
+		assert results == []
+		assert len(responses.calls) == 1, "Expect the plugins not to be listed when no API is picked"
+
+	@responses.activate
+	def test_prune_consumers(self):
+
+		results = KongConsumer(mock_kong_admin_url).prune(Selector(keep=["joesoap", "1234"]), ["key-auth"])
+
+		outcomes = [(result['kind'], result['name'], result['action'], result['failed']) for result in results]
+		assert outcomes == [
+			("credential", "leaver/key-auth", "delete", False),
+			("plugin", "leaver/rate-limiting", "delete", False),
+			("consumer", "leaver", "delete", False),
+		], "Unexpected results: {}" . format (outcomes)
+		assert self.deleted() == ["/consumers/c2/key-auth/k2", "/plugins/p4", "/consumers/c2"]
+
+	@responses.activate
+	def test_prune_upstreams(self):
+		responses.add(responses.GET, '{}/upstreams' . format (mock_kong_admin_url), status=200, body=json.dumps({'data': [
+			{"id": "u1", "name": "load-1.service", "tags": ["load-test"]},
+			{"id": "u2", "name": "load-2.service"},
+		]}))
+		responses.add(responses.DELETE, '{}/upstreams/u1' . format (mock_kong_admin_url), status=204)
+
+		results = KongUpstream(mock_kong_admin_url).prune(Selector(regex=r"^load-[0-9]+\.", tags=["load-test"]))
+
+		assert [(result['kind'], result['name'], result['status_code']) for result in results] == [("upstream", "load-1.service", 204)]
+
+class ModuleHelperTestCase(unittest.TestCase):
+
+	def test_get_selector(self):
+		helper = ModuleHelper()
+
+		assert helper.get_selector({"name_prefix": "pr-1-"}).prefix == "pr-1-"
+		with self.assertRaises(ValueError) as raised:
+			helper.get_selector({})
+		assert "at least one" in str(raised.exception)
+		with self.assertRaises(ValueError) as raised:
+			helper.get_selector({"name_regex": "pr-("})
+		assert "not a valid regular expression" in str(raised.exception)
+
+	def test_run_without_selector(self):
+		params = dict(kong_admin_uri=mock_kong_admin_url, kong_admin_username=None, kong_admin_password=None, resource="apis")
+
+		result = kong_prune.run(ModuleHelper(), KongTask(params))
+
+		assert result["failed"] == True
+		assert "at least one" in result["msg"]
+
+class MainTestCase(unittest.TestCase):
+
+	@mock.patch.object(KongConsumer, 'prune')
+	@mock.patch.object(ModuleHelper, 'get_module')
+	def test_main(self, mock_module, mock_prune):
+
+		mock_module.return_value.check_mode = True
+		mock_module.return_value._diff = False
+		mock_module.return_value.params = {
+			"kong_admin_uri": mock_kong_admin_url, "kong_admin_username": None, "kong_admin_password": None,
+			"resource": "consumers", "keep": ["joesoap"], "credentials": ["key-auth"], "parallelism": 8,
+		}
+		mock_prune.return_value = [
+			{"name": "leaver/key-auth", "kind": "credential", "action": "delete", "changed": True, "failed": False, "status_code": None},
+			{"name": "leaver", "kind": "consumer", "action": "delete", "changed": True, "failed": False, "status_code": None},
+		]
+		main()
+
+		args = mock_prune.call_args[0]
+		assert args[0].keep == set(["joesoap"])
+		assert args[1] == ["key-auth"]
+		assert args[2].parallelism == 8
+		assert args[3] == True
+		exited = mock_module.return_value.exit_json.call_args[1]
+		assert exited["matched"] == {"credential": 1, "consumer": 1}
+		assert exited["summary"] == {"delete": 2}
+
+if __name__ == '__main__':
+    unittest.main()
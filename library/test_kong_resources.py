@@ -0,0 +1,53 @@
+import unittest
+from module_utils.kong_resources import flatten, normalise, changed_fields
+
+class FlattenTestCase(unittest.TestCase):
+
+	def test_flatten(self):
+		entry = {"name": "rate-limiting", "config": {"minute": 20, "limits": {"hour": 100}}}
+
+		assert flatten(entry) == {
+			"name": "rate-limiting",
+			"config.minute": 20,
+			"config.limits.hour": 100
+		}
+
+class NormaliseTestCase(unittest.TestCase):
+
+	def test_booleans(self):
+		assert normalise("yes") is True
+		assert normalise("False") is False
+		assert normalise(True) is True
+
+	def test_numbers(self):
+		assert normalise(20) == normalise("20")
+
+	def test_lists(self):
+		assert normalise("b, a") == normalise(["a", "b"])
+		assert normalise(["a"]) == normalise("a")
+
+class ChangedFieldsTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.current = {
+			"id": "1",
+			"name": "mockbin",
+			"upstream_url": "http://mockbin.com",
+			"preserve_host": False,
+			"config": {"minute": 20}
+		}
+
+	def test_unchanged(self):
+		desired = {"name": "mockbin", "upstream_url": "http://mockbin.com", "config.minute": "20"}
+		assert changed_fields(self.current, desired) == []
+
+	def test_defaults(self):
+		desired = {"name": "mockbin", "strip_request_path": False, "preserve_host": "no"}
+		assert changed_fields(self.current, desired) == []
+
+	def test_changed(self):
+		desired = {"upstream_url": "http://mockbin.org", "strip_request_path": True, "config.minute": 30}
+		assert changed_fields(self.current, desired) == ["config.minute", "strip_request_path", "upstream_url"]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest, json
+from module_utils.kong_client import KongResponse, unchanged_response
+from module_utils.kong_result import response_meta, project, field_paths, shape
+from kong_consumer import ModuleHelper
+
+mock_kong_admin_url = "http://192.168.99.100:8001"
+
+plugin = {"id": "1", "name": "rate-limiting", "config": {"minute": 20, "hour": 500}, "created_at": 1}
+
+class ResponseMetaTestCase(unittest.TestCase):
+
+	def test_response_meta(self):
+		assert response_meta(KongResponse(mock_kong_admin_url, 201, json.dumps(plugin).encode("utf-8"))) == plugin
+		assert response_meta(unchanged_response(mock_kong_admin_url, plugin)) == plugin
+		assert response_meta(KongResponse(mock_kong_admin_url, 204, b"")) == {}
+		assert response_meta(KongResponse(mock_kong_admin_url, 502, b"Bad gateway")) == "Bad gateway"
+
+	def test_meta_is_decoded_once(self):
+		has_changed, meta = ModuleHelper().get_response(unchanged_response(mock_kong_admin_url, plugin), "present")
+
+		assert has_changed == False
+		assert meta == plugin, "Expect the entity itself, not its JSON text"
+
+class ProjectTestCase(unittest.TestCase):
+
+	def test_project(self):
+		paths = field_paths(["id", "config.minute", "config.second", "missing.field"])
+
+		assert project(plugin, paths) == {"id": "1", "config": {"minute": 20}}
+		assert project(plugin, field_paths("id, name")) == {"id": "1", "name": "rate-limiting"}
+
+	def test_project_listing(self):
+		listing = {"data": [plugin, {"id": "2"}], "total": 2}
+
+		assert project(listing, field_paths(["id"])) == {"data": [{"id": "1"}, {"id": "2"}], "total": 2}
+
+class ShapeTestCase(unittest.TestCase):
+
+	def bulk_result(self):
+		return dict(changed=True, summary={"create": 1, "error": 1}, results=[
+			dict(name="a", action="create", changed=True, failed=False, status_code=201, msg=None),
+			dict(name="b", action="error", changed=False, failed=True, status_code=400, msg="bad"),
+		])
+
+	def test_unshaped(self):
+		result = dict(changed=True, meta=plugin)
+
+		assert shape(result) is result
+
+	def test_return_fields(self):
+		shaped = shape(dict(changed=True, meta=plugin), ["id"])
+
+		assert shaped == dict(changed=True, meta={"id": "1"})
+
+	def test_compact(self):
+		shaped = shape(self.bulk_result(), compact_results=True)
+
+		assert shaped["summary"] == {"create": 1, "error": 1}
+		assert shaped["results"] == [dict(name="b", action="error", status_code=400, msg="bad")]
+
+	def test_shape_endpoints(self):
+		result = dict(changed=True, endpoints={mock_kong_admin_url: dict(changed=True, meta=plugin)})
+
+		shaped = shape(result, ["name"])
+
+		assert shaped["endpoints"][mock_kong_admin_url]["meta"] == {"name": "rate-limiting"}
+		assert result["endpoints"][mock_kong_admin_url]["meta"] == plugin, "Expect the result itself to be left alone"
+
+if __name__ == '__main__':
+    unittest.main()
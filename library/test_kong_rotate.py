@@ -0,0 +1,215 @@
+import unittest, responses, json, mock, os, sys
+from six.moves.urllib.parse import parse_qs
+from kong_rotate import KongTarget, KongEngine, TargetRotation, ModuleHelper, main
+from module_utils.kong_client import KongClient
+from module_utils.kong_resources import prepare_target
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+from fake_admin import FakeAdminServer
+
+mock_kong_admin_url = "http://192.168.99.100:8001"
+
+old_targets = {'data': [
+	{"id": "2", "target": "10.0.0.2:8080", "weight": 100, "created_at": 2},
+	{"id": "1", "target": "10.0.0.1:8080", "weight": 100, "created_at": 1},
+]}
+
+class TargetRotationTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.url = '{}/upstreams/mockbin.service/targets' . format (mock_kong_admin_url)
+		self.health_url = '{}/upstreams/mockbin.service/health' . format (mock_kong_admin_url)
+		self.sleep = mock.Mock()
+		self.progress = mock.Mock()
+
+	def rotation(self, *targets, **options):
+		target = KongTarget(mock_kong_admin_url, "mockbin.service")
+		return TargetRotation(target, [prepare_target(item) for item in targets], sleep=self.sleep, progress=self.progress, **options)
+
+	def add_created(self, *entries):
+		for entry in entries:
+			responses.add(responses.POST, self.url, status=201, body=json.dumps(entry))
+
+	def add_health(self, health):
+		data = [{"target": target, "health": state} for target, state in health.items()]
+		responses.add(responses.GET, self.health_url, status=200, body=json.dumps({"data": data}))
+
+	@responses.activate
+	def test_rotate(self):
+		responses.add(responses.GET, self.url, status=200, body=json.dumps(old_targets))
+		self.add_created({"id": "3", "target": "10.0.1.1:8080", "weight": 100, "created_at": 3})
+		self.add_health({"10.0.1.1:8080": "HEALTHY", "10.0.0.1:8080": "HEALTHY", "10.0.0.2:8080": "HEALTHY"})
+		self.add_created(
+			{"id": "4", "target": "10.0.0.1:8080", "weight": 0, "created_at": 4},
+			{"id": "5", "target": "10.0.0.2:8080", "weight": 0, "created_at": 5},
+		)
+		responses.add(responses.DELETE, '{}/4' . format (self.url), status=204)
+		responses.add(responses.DELETE, '{}/5' . format (self.url), status=204)
+
+		outcome = self.rotation("10.0.1.1:8080", drain_time=5)()
+
+		assert outcome["changed"] == True and outcome["failed"] == False, outcome
+		assert outcome["added"] == ["10.0.1.1:8080"]
+		assert outcome["drained"] == ["10.0.0.1:8080", "10.0.0.2:8080"]
+		assert outcome["removed"] == ["10.0.0.1:8080", "10.0.0.2:8080"]
+		assert sorted(outcome["timings"]) == ["add", "drain", "plan", "remove", "wait"]
+
+		calls = [(call.request.method, call.request.url.split("?")[0]) for call in responses.calls]
+		assert calls == [
+			("GET", self.url),
+			("POST", self.url),
+			("GET", self.health_url),
+			("POST", self.url),
+			("POST", self.url),
+			("DELETE", '{}/4' . format (self.url)),
+			("DELETE", '{}/5' . format (self.url)),
+		], "Expect the old targets drained only once the new one is healthy. Got: {}" . format (calls)
+		assert parse_qs(responses.calls[3].request.body)["weight"] == ["0"]
+		self.sleep.assert_called_once_with(5)
+		assert [call[0][1] for call in self.progress.call_args_list] == ["plan", "add", "wait", "drain", "remove"]
+
+	@responses.activate
+	def test_unhealthy_targets_keep_the_old_ones(self):
+		responses.add(responses.GET, self.url, status=200, body=json.dumps(old_targets))
+		self.add_created({"id": "3", "target": "10.0.1.1:8080", "weight": 100, "created_at": 3})
+		self.add_health({"10.0.1.1:8080": "UNHEALTHY"})
+
+		outcome = self.rotation("10.0.1.1:8080", timeout=0)()
+
+		assert outcome["failed"] == True
+		assert outcome["added"] == ["10.0.1.1:8080"]
+		assert "were not healthy" in outcome["msg"]
+		assert not any(call.request.method == "DELETE" for call in responses.calls)
+		assert len([call for call in responses.calls if call.request.method == "POST"]) == 1
+
+	@responses.activate
+	def test_wait_polls_health(self):
+		self.add_health({"10.0.1.1:8080": "UNHEALTHY"})
+		self.add_health({"10.0.1.1:8080": "HEALTHCHECKS_OFF"})
+
+		assert self.rotation("10.0.1.1:8080", interval=2).wait(["10.0.1.1:8080"]) == []
+		self.sleep.assert_called_once_with(2)
+
+	@responses.activate
+	def test_wait_without_health_endpoint(self):
+		responses.add(responses.GET, self.health_url, status=404)
+
+		assert self.rotation("10.0.1.1:8080").wait(["10.0.1.1:8080"]) == []
+		assert not self.sleep.called
+
+	@responses.activate
+	def test_nothing_to_rotate(self):
+		responses.add(responses.GET, self.url, status=200, body=json.dumps(old_targets))
+
+		outcome = self.rotation("10.0.0.1:8080", "10.0.0.2:8080")()
+
+		assert outcome["action"] == "none"
+		assert outcome["changed"] == False
+		assert len(responses.calls) == 1
+
+	@responses.activate
+	def test_failed_write(self):
+		responses.add(responses.GET, self.url, status=200, body=json.dumps(old_targets))
+		responses.add(responses.POST, self.url, status=400, body=json.dumps({"message": "bad target"}))
+
+		outcome = self.rotation("10.0.1.1:8080")()
+
+		assert outcome["failed"] == True
+		assert outcome["status_code"] == 400
+		assert outcome["added"] == []
+
+	@responses.activate
+	def test_preview(self):
+		responses.add(responses.GET, self.url, status=200, body=json.dumps(old_targets))
+
+		outcome = KongEngine(4).run([[self.rotation("10.0.1.1:8080")]], check_mode=True)[0]
+
+		assert outcome["action"] == "rotate"
+		assert outcome["changed"] == True
+		assert outcome["removed"] == ["10.0.0.1:8080", "10.0.0.2:8080"]
+		assert outcome["diff"]["after"] == {"10.0.1.1:8080": 100}
+		assert len(responses.calls) == 1
+
+class RotateAgainTestCase(unittest.TestCase):
+	"""Rotates the targets of an upstream on the fake admin server, which
+	keeps the history of each target like Kong 0.x does"""
+
+	def setUp(self):
+		self.server = FakeAdminServer().start()
+		upstream = self.server.store.upstreams.add(dict(name="mockbin.service"))
+		for address in ["10.0.0.1:8080", "10.0.0.2:8080"]:
+			self.server.store.targets.add(dict(target=address, weight=100, upstream_id=upstream["id"]))
+
+	def tearDown(self):
+		self.server.stop()
+
+	def rotate(self):
+		target = KongTarget(self.server.url, "mockbin.service", client=KongClient(self.server.url))
+		return TargetRotation(target, [prepare_target("10.0.1.1:8080")], interval=0.01)()
+
+	def test_rotate_again(self):
+		outcome = self.rotate()
+
+		assert outcome["changed"] == True and outcome["failed"] == False, outcome
+		assert outcome["removed"] == ["10.0.0.1:8080", "10.0.0.2:8080"]
+
+		outcome = self.rotate()
+
+		assert outcome["action"] == "none", "Expect the removed targets to stay removed. Got: {}" . format (outcome)
+		assert outcome["changed"] == False
+
+class ModuleHelperTestCase(unittest.TestCase):
+
+	def test_prepare_item(self):
+		item = ModuleHelper().prepare_item("mockbin.service", ["10.0.1.1"])
+
+		assert item == {"name": "mockbin.service", "targets": [{"target": "10.0.1.1:8000", "weight": 100, "state": "present"}]}
+
+	def test_validate(self):
+		helper = ModuleHelper()
+
+		assert helper.validate([], []) == "Please give the upstreams or apis to rotate"
+		assert helper.validate([helper.prepare_item("a", None)], []) == "a needs targets to rotate to"
+		assert "can't have a state" in helper.validate([helper.prepare_item("a", [{"target": "10.0.1.1", "state": "absent"}])], [])
+		assert helper.validate([helper.prepare_item("a", ["10.0.1.1"])], []) is None
+
+	@responses.activate
+	def test_resolve_apis(self):
+		apis = {"data": [
+			{"id": "1", "name": "orders", "upstream_url": "http://orders.service/v1"},
+			{"id": "2", "name": "billing", "upstream_url": "https://billing.service"},
+		]}
+		responses.add(responses.GET, '{}/apis' . format (mock_kong_admin_url), status=200, body=json.dumps(apis))
+		helper = ModuleHelper()
+		targets = ["10.0.1.1:8080"]
+
+		upstreams, failed = helper.resolve(
+			[helper.prepare_item(name, targets) for name in ["orders", "missing"]],
+			[helper.prepare_item("billing.service", targets)],
+			KongTarget(mock_kong_admin_url, "unused").client, mock_kong_admin_url)
+
+		assert [item["name"] for item in upstreams] == ["billing.service", "orders.service"]
+		assert [(outcome["name"], outcome["msg"]) for outcome in failed] == [("missing", "No API called missing")]
+
+class MainTestCase(unittest.TestCase):
+
+	@mock.patch.object(TargetRotation, '__call__')
+	@mock.patch.object(ModuleHelper, 'get_module')
+	def test_main(self, mock_module, mock_call):
+
+		mock_module.return_value.check_mode = False
+		mock_module.return_value.params = {
+			"kong_admin_uri": mock_kong_admin_url, "kong_admin_username": None, "kong_admin_password": None,
+			"upstreams": ["a.service", "b.service"], "apis": [], "targets": ["10.0.1.1:8080"],
+			"timeout": 60, "interval": 1, "drain_time": 0, "parallelism": 2,
+		}
+		mock_call.return_value = {"name": "a.service", "action": "rotate", "changed": True, "failed": False, "status_code": None}
+		main()
+
+		assert mock_call.call_count == 2
+		exit_args = mock_module.return_value.exit_json.call_args[1]
+		assert exit_args["changed"] == True
+		assert exit_args["summary"] == {"rotate": 2}
+
+if __name__ == '__main__':
+    unittest.main()
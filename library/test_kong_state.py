@@ -0,0 +1,260 @@
+import unittest, responses, json, mock, os, shutil, tempfile
+import kong_state
+from kong_state import KongAPI, KongConsumer, ModuleHelper, apply, export, credential_plugins, main
+from module_utils.kong_resources import basic_auth_hash
+from ansible.module_utils.basic import AnsibleModule
+
+mock_kong_admin_url = "http://192.168.99.100:8001"
+
+live_apis = {'data': [
+	{"id": "a1", "name": "mockbin", "upstream_url": "http://mockbin.com", "request_host": "mockbin.com", "strip_request_path": False, "preserve_host": False, "created_at": 1},
+]}
+
+live_plugins = {'data': [
+	{"id": "p1", "api_id": "a1", "name": "key-auth", "config": {"hide_credentials": False, "key_names": ["apikey"]}},
+	{"id": "p2", "api_id": "a1", "name": "cors", "config": {}},
+]}
+
+live_consumers = {'data': [
+	{"id": "c1", "username": "joesoap", "created_at": 1},
+	{"id": "c2", "custom_id": "1234"},
+]}
+
+live_keys = {'data': [
+	{"id": "k1", "consumer_id": "c1", "key": "abc", "created_at": 1},
+]}
+
+class StateTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.apis = KongAPI(mock_kong_admin_url)
+		self.consumers = KongConsumer(mock_kong_admin_url)
+		responses.add(responses.GET, '{}/apis' . format (mock_kong_admin_url), status=200, body=json.dumps(live_apis))
+		responses.add(responses.GET, '{}/plugins' . format (mock_kong_admin_url), status=200, body=json.dumps(live_plugins))
+		responses.add(responses.GET, '{}/consumers' . format (mock_kong_admin_url), status=200, body=json.dumps(live_consumers))
+		responses.add(responses.GET, '{}/key-auths' . format (mock_kong_admin_url), status=200, body=json.dumps(live_keys))
+
+	@responses.activate
+	def test_export(self):
+
+		exported = export(self.apis, self.consumers)
+
+		assert exported["apis"] == [{
+			"name": "mockbin",
+			"upstream_url": "http://mockbin.com",
+			"request_host": "mockbin.com",
+			"strip_request_path": False,
+			"preserve_host": False,
+			"plugins": [
+				{"name": "cors", "config": None},
+				{"name": "key-auth", "config": {"config.hide_credentials": False, "config.key_names": ["apikey"]}},
+			],
+		}], "Unexpected APIs: {}" . format (exported["apis"])
+		assert exported["consumers"] == [
+			{"custom_id": "1234"},
+			{"username": "joesoap", "credentials": [{"plugin": "key-auth", "data": {"key": "abc"}}]},
+		], "Unexpected consumers: {}" . format (exported["consumers"])
+		assert exported["plugins"] == []
+		assert len(responses.calls) == 4, \
+			"Expect one listing per collection"
+
+	@responses.activate
+	def test_export_applies_cleanly(self):
+
+		document = ModuleHelper().prepare_config(export(self.apis, self.consumers))
+		results = apply(KongAPI(mock_kong_admin_url), KongConsumer(mock_kong_admin_url), document, prune=True, check_mode=True)
+
+		assert set(result['action'] for result in results) == set(["none"]), \
+			"Expect an export to match the state it came from. Got: {}" . format (results)
+
+	@responses.activate
+	def test_apply_order_and_prune(self):
+		responses.add(responses.DELETE, '{}/apis/mockbin/plugins/p2' . format (mock_kong_admin_url), status=204)
+		responses.add(responses.DELETE, '{}/consumers/c2' . format (mock_kong_admin_url), status=204)
+		responses.add(responses.POST, '{}/consumers' . format (mock_kong_admin_url), status=201, body=json.dumps({"id": "c3", "username": "new"}))
+
+		document = ModuleHelper().prepare_config({
+			"apis": [{"name": "mockbin", "upstream_url": "http://mockbin.com", "request_host": "mockbin.com", "plugins": [{"name": "key-auth", "config": {"config.hide_credentials": False, "config.key_names": "apikey"}}]}],
+			"consumers": [{"username": "joesoap"}, {"username": "new"}],
+		})
+		results = apply(self.apis, self.consumers, document, prune=True)
+
+		outcomes = [(result['section'], result['name'], result['action']) for result in results]
+		assert ("apis", "mockbin/cors", "delete") in outcomes
+		assert ("consumers", "1234", "delete") in outcomes
+		assert ("consumers", "new", "create") in outcomes
+		assert not any(result['failed'] for result in results), \
+			"Unexpected failures: {}" . format (results)
+
+		writes = [call.request.url for call in responses.calls if call.request.method != "GET"]
+		assert writes[0].endswith("/plugins/p2"), \
+			"Expect the APIs to be applied before the consumers. Got: {}" . format (writes)
+
+	@responses.activate
+	def test_apply_leaves_missing_sections(self):
+
+		results = apply(self.apis, self.consumers, {"apis": []}, prune=True, check_mode=True)
+
+		assert [result['section'] for result in results] == ["apis"]
+		urls = [call.request.url for call in responses.calls]
+		assert not any("/consumers" in url for url in urls), \
+			"Expect consumers not to be read when they aren't managed"
+
+class SharedPluginsTestCase(unittest.TestCase):
+
+	def setUp(self):
+		apis = {'data': [{"id": "a1", "name": "mockbin", "upstream_url": "http://mockbin.com", "strip_request_path": False, "preserve_host": False}]}
+		plugins = {'data': [
+			{"id": "p1", "name": "key-auth", "config": {"key_names": ["apikey"]}},
+			{"id": "p2", "consumer_id": "c1", "name": "rate-limiting", "config": {"minute": 20}},
+			{"id": "p3", "api_id": "a1", "consumer_id": "c1", "name": "cors", "config": {}},
+		]}
+		consumers = {'data': [{"id": "c1", "username": "joesoap"}]}
+		keys = {'data': [{"id": "k1", "consumer_id": "c1", "key": "abc", "created_at": 1}]}
+		responses.add(responses.GET, '{}/apis' . format (mock_kong_admin_url), status=200, body=json.dumps(apis))
+		responses.add(responses.GET, '{}/plugins' . format (mock_kong_admin_url), status=200, body=json.dumps(plugins))
+		responses.add(responses.GET, '{}/consumers' . format (mock_kong_admin_url), status=200, body=json.dumps(consumers))
+		responses.add(responses.GET, '{}/key-auths' . format (mock_kong_admin_url), status=200, body=json.dumps(keys))
+
+	@responses.activate
+	def test_export(self):
+
+		exported = export(KongAPI(mock_kong_admin_url), KongConsumer(mock_kong_admin_url))
+
+		assert exported["apis"][0]["plugins"] == []
+		assert exported["plugins"] == [
+			{"name": "key-auth", "config": {"config.key_names": ["apikey"]}},
+			{"name": "rate-limiting", "consumer": "joesoap", "config": {"config.minute": 20}},
+			{"name": "cors", "api": "mockbin", "consumer": "joesoap", "config": None},
+		], "Unexpected plugins: {}" . format (exported["plugins"])
+		assert exported["consumers"] == [{"username": "joesoap", "credentials": [{"plugin": "key-auth", "data": {"key": "abc"}}]}], \
+			"Expect the keys of a global key-auth to be exported. Got: {}" . format (exported["consumers"])
+		assert len([call for call in responses.calls if call.request.url.split("?")[0].endswith("/plugins")]) == 1, \
+			"Expect one listing of plugins for the APIs and the global ones"
+
+	@responses.activate
+	def test_export_applies_without_writes(self):
+
+		document = ModuleHelper().prepare_config(export(KongAPI(mock_kong_admin_url), KongConsumer(mock_kong_admin_url)))
+		results = apply(KongAPI(mock_kong_admin_url), KongConsumer(mock_kong_admin_url), document, prune=True)
+
+		assert [(result['section'], result['action']) for result in results if result['section'] == "plugins"] == [("plugins", "none")] * 3, \
+			"Expect the export to apply cleanly. Got: {}" . format (results)
+		assert [call.request.method for call in responses.calls if call.request.method != "GET"] == []
+
+	@responses.activate
+	def test_apply(self):
+		responses.add(responses.POST, '{}/plugins' . format (mock_kong_admin_url), status=201, body=json.dumps({"id": "p4", "name": "cors", "config": {}}))
+		responses.add(responses.PATCH, '{}/plugins/p2' . format (mock_kong_admin_url), status=200, body=json.dumps({"id": "p2", "consumer_id": "c1", "name": "rate-limiting", "config": {"minute": 50}}))
+		responses.add(responses.DELETE, '{}/plugins/p1' . format (mock_kong_admin_url), status=204)
+		responses.add(responses.DELETE, '{}/apis/mockbin/plugins/p3' . format (mock_kong_admin_url), status=204)
+
+		document = ModuleHelper().prepare_config({"plugins": [
+			{"name": "cors"},
+			{"name": "rate-limiting", "consumer": "joesoap", "config": {"config.minute": 50}},
+		]})
+		results = apply(KongAPI(mock_kong_admin_url), KongConsumer(mock_kong_admin_url), document, prune=True)
+
+		outcomes = sorted((result['name'], result['action']) for result in results)
+		assert outcomes == [("cors", "create"), ("joesoap/rate-limiting", "update"), ("key-auth", "delete"), ("mockbin/joesoap/cors", "delete")], \
+			"Unexpected results: {}" . format (results)
+		assert not any(result['failed'] for result in results)
+		posted = [call.request.body for call in responses.calls if call.request.method == "POST"]
+		assert posted == ["name=cors"]
+		patched = [call.request.body for call in responses.calls if call.request.method == "PATCH"][0]
+		assert "consumer_id=c1" in patched
+
+class BasicAuthRoundTripTestCase(unittest.TestCase):
+
+	def setUp(self):
+		apis = {'data': [{"id": "a1", "name": "mockbin", "upstream_url": "http://mockbin.com", "strip_request_path": False, "preserve_host": False}]}
+		plugins = {'data': [{"id": "p1", "api_id": "a1", "name": "basic-auth", "config": {}}]}
+		consumers = {'data': [{"id": "c1", "username": "joesoap"}]}
+		credentials = {'data': [{"id": "b1", "consumer_id": "c1", "username": "joe", "password": basic_auth_hash("secret", "c1"), "created_at": 1}]}
+		responses.add(responses.GET, '{}/apis' . format (mock_kong_admin_url), status=200, body=json.dumps(apis))
+		responses.add(responses.GET, '{}/plugins' . format (mock_kong_admin_url), status=200, body=json.dumps(plugins))
+		responses.add(responses.GET, '{}/consumers' . format (mock_kong_admin_url), status=200, body=json.dumps(consumers))
+		responses.add(responses.GET, '{}/basic-auths' . format (mock_kong_admin_url), status=200, body=json.dumps(credentials))
+
+	@responses.activate
+	def test_export_applies_without_writes(self):
+
+		exported = export(KongAPI(mock_kong_admin_url), KongConsumer(mock_kong_admin_url))
+
+		assert exported["consumers"] == [{"username": "joesoap", "credentials": [{"plugin": "basic-auth", "data": {"username": "joe"}}]}], \
+			"Expect the hashed password to be left out. Got: {}" . format (exported["consumers"])
+
+		document = ModuleHelper().prepare_config(exported)
+		results = apply(KongAPI(mock_kong_admin_url), KongConsumer(mock_kong_admin_url), document, prune=True)
+
+		assert set(result['action'] for result in results) == set(["none"]), \
+			"Expect the export to apply cleanly. Got: {}" . format (results)
+		assert [call.request.method for call in responses.calls if call.request.method != "GET"] == []
+
+class ModuleHelperTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.helper = ModuleHelper()
+
+	def test_prepare_config(self):
+		document = self.helper.prepare_config({"apis": [{"name": "a", "upstream_url": "http://a.com"}]})
+
+		assert document == {"apis": [{"name": "a", "upstream_url": "http://a.com", "strip_request_path": False, "preserve_host": False}]}
+
+	def test_validate(self):
+		assert self.helper.validate({"apis": [{"name": "a", "upstream_url": "http://a.com"}], "consumers": [{"username": "a"}]}) is None
+		assert self.helper.validate({"apis": [{"upstream_url": "http://a.com"}]}) is not None
+		assert self.helper.validate({"consumers": [{}]}) is not None
+		assert self.helper.validate({"plugins": [{"name": "cors", "api": "a"}]}) is not None
+
+	def test_credential_plugins(self):
+		apis = [{"plugins": [{"name": "acl"}, {"name": "cors"}]}, {"plugins": [{"name": "key-auth"}]}]
+
+		assert credential_plugins(apis) == ["acls", "key-auth"]
+		assert credential_plugins([], [{"name": "jwt"}, {"name": "cors", "consumer": "joesoap"}]) == ["jwt"]
+
+class MainTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	@mock.patch.object(kong_state, 'export')
+	@mock.patch.object(ModuleHelper, 'get_module')
+	@mock.patch.object(ModuleHelper, 'prepare_inputs')
+	def test_main_export(self, mock_prepare_inputs, mock_module, mock_export):
+
+		dest = os.path.join(self.directory, "gateway.json")
+		mock_prepare_inputs.return_value = (mock_kong_admin_url, {}, "export", None, None)
+		mock_module.return_value.check_mode = False
+		mock_module.return_value.params = {"dest": dest}
+		mock_module.return_value.atomic_move.side_effect = os.rename
+		mock_export.return_value = {"apis": [], "consumers": [{"username": "joesoap"}], "plugins": []}
+		main()
+
+		with open(dest) as exported:
+			assert json.load(exported) == mock_export.return_value
+		mock_module.return_value.exit_json.assert_called_once_with(changed=True, dest=dest, total={"apis": 0, "consumers": 1, "plugins": 0})
+
+	@mock.patch.object(kong_state, 'apply')
+	@mock.patch.object(ModuleHelper, 'get_module')
+	@mock.patch.object(ModuleHelper, 'prepare_inputs')
+	def test_main_apply(self, mock_prepare_inputs, mock_module, mock_apply):
+
+		document = {"apis": [{"name": "a", "upstream_url": "http://a.com"}]}
+		mock_prepare_inputs.return_value = (mock_kong_admin_url, document, "apply", None, None)
+		mock_module.return_value.check_mode = False
+		mock_module.return_value._diff = False
+		mock_module.return_value.params = {"prune": True, "parallelism": 4}
+		mock_apply.return_value = [{"name": "a", "action": "create", "changed": True, "failed": False, "status_code": 201, "section": "apis"}]
+		main()
+
+		args = mock_apply.call_args[0]
+		assert args[2] == document
+		assert args[3] == True
+		mock_module.return_value.exit_json.assert_called_once_with(changed=True, results=mock_apply.return_value, summary={"create": 1})
+
+if __name__ == '__main__':
+    unittest.main()
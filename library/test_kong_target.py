@@ -0,0 +1,187 @@
+import unittest, responses, json, mock
+from six.moves.urllib.parse import parse_qs
+from kong_target import KongTarget, KongEngine, ModuleHelper, main
+from module_utils.kong_resources import prepare_target, validate_targets, target_address
+
+mock_kong_admin_url = "http://192.168.99.100:8001"
+
+# Kong lists every change to a target, newest first
+target_history = {'data': [
+	{"id": "4", "target": "10.0.0.2:8080", "weight": 0, "created_at": 4},
+	{"id": "3", "target": "10.0.0.3:8080", "weight": 50, "created_at": 3},
+	{"id": "2", "target": "10.0.0.2:8080", "weight": 100, "created_at": 2},
+	{"id": "1", "target": "10.0.0.1:8080", "weight": 100, "created_at": 1},
+]}
+
+class KongTargetTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.target = KongTarget(mock_kong_admin_url, "mockbin.service")
+		self.url = '{}/upstreams/mockbin.service/targets' . format (mock_kong_admin_url)
+
+	def add_history(self):
+		responses.add(responses.GET, self.url, status=200, body=json.dumps(target_history))
+
+	@responses.activate
+	def test_iterate_keeps_the_newest_entry(self):
+		self.add_history()
+
+		targets = dict((entry["target"], entry["weight"]) for entry in self.target.iterate())
+
+		assert targets == {"10.0.0.1:8080": 100, "10.0.0.2:8080": 0, "10.0.0.3:8080": 50}
+		assert sorted(entry["target"] for entry in self.target.active()) == ["10.0.0.1:8080", "10.0.0.3:8080"]
+
+	@responses.activate
+	def test_reweight(self):
+		self.add_history()
+		responses.add(responses.POST, self.url, status=201, body=json.dumps({"id": "5", "target": "10.0.0.3:8080", "weight": 100, "created_at": 5}))
+
+		response = self.target.add_or_update("10.0.0.3:8080", 100)
+
+		assert response.status_code == 201
+		assert parse_qs(responses.calls[1].request.body) == {"target": ["10.0.0.3:8080"], "weight": ["100"]}
+		assert self.target.find("10.0.0.3:8080")["id"] == "5"
+
+	@responses.activate
+	def test_unchanged(self):
+		self.add_history()
+
+		response = self.target.add_or_update("10.0.0.1:8080", 100)
+
+		assert response.status_code == 304
+		assert len(responses.calls) == 1
+
+	@responses.activate
+	def test_drain(self):
+		self.add_history()
+		responses.add(responses.POST, self.url, status=201, body=json.dumps({"id": "5", "target": "10.0.0.1:8080", "weight": 0, "created_at": 5}))
+
+		response = self.target.drain("10.0.0.1:8080")
+
+		assert response.status_code == 201
+		assert parse_qs(responses.calls[1].request.body)["weight"] == ["0"]
+		assert [entry["target"] for entry in self.target.active()] == ["10.0.0.3:8080"]
+
+	@responses.activate
+	def test_delete(self):
+		self.add_history()
+		responses.add(responses.DELETE, '{}/3' . format (self.url), status=204)
+
+		response = self.target.delete("10.0.0.3:8080")
+
+		assert response.status_code == 204
+		assert self.target.find("10.0.0.3:8080") is None
+
+	@responses.activate
+	def test_delete_missing(self):
+		self.add_history()
+
+		response = self.target.delete("10.0.0.9:8080")
+
+		assert response.status_code == 304
+		assert len(responses.calls) == 1
+
+	@responses.activate
+	def test_health(self):
+		health = {"data": [{"target": "10.0.0.1:8080", "health": "HEALTHY"}, {"target": "10.0.0.3:8080", "health": "UNHEALTHY"}]}
+		responses.add(responses.GET, '{}/upstreams/mockbin.service/health' . format (mock_kong_admin_url), status=200, body=json.dumps(health))
+
+		assert self.target.health() == {"10.0.0.1:8080": "HEALTHY", "10.0.0.3:8080": "UNHEALTHY"}
+
+	@responses.activate
+	def test_health_not_supported(self):
+		responses.add(responses.GET, '{}/upstreams/mockbin.service/health' . format (mock_kong_admin_url), status=404)
+
+		assert self.target.health() is None
+
+	@responses.activate
+	def test_converge(self):
+		self.add_history()
+		responses.add(responses.POST, self.url, status=201, body=json.dumps({"id": "5", "target": "10.0.0.4:8000", "weight": 100, "created_at": 5}))
+		responses.add(responses.DELETE, '{}/3' . format (self.url), status=204)
+
+		targets = [
+			prepare_target("10.0.0.1:8080"),
+			prepare_target("10.0.0.4"),
+			prepare_target({"target": "10.0.0.2:8080", "state": "drained"}),
+		]
+		results = self.target.converge(targets, purge=True, engine=KongEngine(1))
+
+		actions = [(result["name"], result["action"]) for result in results]
+		assert actions == [
+			("10.0.0.1:8080", "none"),
+			("10.0.0.4:8000", "create"),
+			("10.0.0.2:8080", "none"),
+			("10.0.0.3:8080", "delete"),
+		], "Expect the targets in the order given, then the unlisted one purged. Got: {}" . format (actions)
+
+	@responses.activate
+	def test_converge_check_mode(self):
+		self.add_history()
+
+		results = self.target.converge([prepare_target({"target": "10.0.0.1:8080", "state": "drained"})], check_mode=True)
+
+		assert results[0]["action"] == "update"
+		assert results[0]["changed"] == True
+		assert len(responses.calls) == 1
+
+class PrepareTargetTestCase(unittest.TestCase):
+
+	def test_address(self):
+		assert target_address("10.0.0.1") == "10.0.0.1:8000"
+		assert target_address("10.0.0.1:8080") == "10.0.0.1:8080"
+		assert target_address("[::1]") == "[::1]:8000"
+		assert target_address("[::1]:8080") == "[::1]:8080"
+
+	def test_prepare(self):
+		assert prepare_target("10.0.0.1") == {"target": "10.0.0.1:8000", "weight": 100, "state": "present"}
+		assert prepare_target({"target": "10.0.0.1:8080", "state": "drained"}) == {"target": "10.0.0.1:8080", "weight": 0, "state": "drained"}
+
+	def test_validate(self):
+		assert validate_targets([prepare_target("10.0.0.1")]) is None
+		assert validate_targets([prepare_target({"target": None})]) == "Every target needs an address"
+		assert "between 0 and 1000" in validate_targets([prepare_target({"target": "10.0.0.1", "weight": 2000})])
+		assert "must be one of" in validate_targets([prepare_target({"target": "10.0.0.1", "state": "gone"})])
+
+class MainTestCase(unittest.TestCase):
+
+	@mock.patch.object(KongTarget, 'converge')
+	@mock.patch.object(ModuleHelper, 'get_module')
+	def test_main(self, mock_module, mock_converge):
+
+		mock_module.return_value.check_mode = False
+		mock_module.return_value.params = {
+			"kong_admin_uri": mock_kong_admin_url, "kong_admin_username": None, "kong_admin_password": None,
+			"upstream": "mockbin.service", "targets": ["10.0.0.1:8080"], "purge": True, "parallelism": 1,
+		}
+		mock_converge.return_value = [{"name": "10.0.0.1:8080", "action": "create", "changed": True, "failed": False, "status_code": 201}]
+		main()
+
+		args = mock_converge.call_args[0]
+		assert args[0] == [{"target": "10.0.0.1:8080", "weight": 100, "state": "present"}]
+		assert args[1] == True
+		assert isinstance(args[2], KongEngine)
+		assert mock_module.return_value.exit_json.call_args[1]["changed"] == True
+
+	@mock.patch.object(KongTarget, 'converge')
+	@mock.patch.object(ModuleHelper, 'get_module')
+	def test_main_compact(self, mock_module, mock_converge):
+
+		mock_module.return_value.check_mode = False
+		mock_module.return_value._diff = False
+		mock_module.return_value.params = {
+			"kong_admin_uri": mock_kong_admin_url, "kong_admin_username": None, "kong_admin_password": None,
+			"upstream": "mockbin.service", "targets": ["10.0.0.1:8080", "10.0.0.2:8080"], "purge": False, "parallelism": 1, "compact": True,
+		}
+		mock_converge.return_value = [
+			{"name": "10.0.0.1:8080", "action": "create", "changed": True, "failed": False, "status_code": 201, "msg": None},
+			{"name": "10.0.0.2:8080", "action": "update", "changed": False, "failed": True, "status_code": 400, "msg": "Bad weight"},
+		]
+		main()
+
+		failed = mock_module.return_value.fail_json.call_args[1]
+		assert failed["results"] == [{"name": "10.0.0.2:8080", "action": "update", "status_code": 400, "msg": "Bad weight"}]
+		assert failed["summary"] == {"create": 1, "update": 1}
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+from __future__ import absolute_import
+import unittest, responses, json, mock
+from module_utils.kong_task import KongTask, task_params, finish
+from module_utils.kong_batch import run_batch, run_task
+from kong_api import ModuleHelper
+
+mock_kong_admin_url = "http://192.168.99.100:8001"
+
+class TaskParamsTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.spec = ModuleHelper().argument_spec()
+
+	def test_defaults(self):
+		params = task_params(self.spec, {"kong_admin_uri": mock_kong_admin_url, "name": "mockbin"})
+
+		assert params["state"] == "present"
+		assert params["strip_request_path"] == False
+		assert params["kong_admin_pool_size"] == 10
+		assert params["request_host"] is None
+
+	def test_conversion(self):
+		params = task_params(self.spec, {"strip_request_path": "yes", "kong_admin_pool_size": "4"})
+
+		assert params["strip_request_path"] == True
+		assert params["kong_admin_pool_size"] == 4
+
+	def test_errors(self):
+		for params in [{"unknown": "x"}, {"state": "gone"}, {"strip_request_path": "maybe"}]:
+			try:
+				task_params(self.spec, params)
+			except ValueError:
+				pass
+			else:
+				self.fail("Expect {} to be refused" . format (params))
+
+	def test_required(self):
+		try:
+			task_params({"name": dict(required=True, type='str')}, {})
+		except ValueError as error:
+			assert "name" in str(error)
+		else:
+			self.fail("Expect a missing required param to be refused")
+
+class FinishTestCase(unittest.TestCase):
+
+	def test_finish(self):
+		module = mock.MagicMock()
+
+		finish(module, dict(changed=True, meta={}))
+		module.exit_json.assert_called_once_with(changed=True, meta={})
+
+		finish(module, dict(failed=True, msg="broken"))
+		module.fail_json.assert_called_once_with(msg="broken")
+
+class BatchTestCase(unittest.TestCase):
+
+	def task(self, name):
+		return dict(module="kong_api", params=dict(kong_admin_uri=mock_kong_admin_url, name=name, upstream_url="http://mockbin.com"))
+
+	@responses.activate
+	def test_run_batch(self):
+		responses.add(responses.GET, '{}/apis/mockbin' . format (mock_kong_admin_url), status=404, body=json.dumps({"message": "Not found"}))
+		responses.add(responses.POST, '{}/apis/' . format (mock_kong_admin_url), status=201, body=json.dumps({"id": "1", "name": "mockbin"}))
+
+		results = list(run_batch([self.task("mockbin"), {"module": "kong_unknown"}]))
+
+		assert results[0]["changed"] == True
+		assert results[0]["failed"] == False
+		assert results[0]["module"] == "kong_api"
+		assert results[1]["failed"] == True
+		assert "kong_unknown" in results[1]["msg"]
+
+	@responses.activate
+	def test_check_mode(self):
+		responses.add(responses.GET, '{}/apis/mockbin' . format (mock_kong_admin_url), status=404, body=json.dumps({"message": "Not found"}))
+
+		result = run_task(self.task("mockbin"), check_mode=True)
+
+		assert result["changed"] == True
+		assert result["meta"] == {"action": "create"}
+		assert [call.request.method for call in responses.calls] == ["GET"]
+
+	@responses.activate
+	def test_return_fields(self):
+		responses.add(responses.GET, '{}/apis/mockbin' . format (mock_kong_admin_url), status=404, body=json.dumps({"message": "Not found"}))
+		responses.add(responses.POST, '{}/apis/' . format (mock_kong_admin_url), status=201, body=json.dumps({"id": "1", "name": "mockbin"}))
+		task = self.task("mockbin")
+		task["params"]["return_fields"] = ["id"]
+
+		result = run_task(task)
+
+		assert result["meta"] == {"id": "1"}
+
+	@responses.activate
+	def test_stats_per_task(self):
+		responses.add(responses.GET, '{}/apis/mockbin' . format (mock_kong_admin_url), status=404, body=json.dumps({"message": "Not found"}))
+		responses.add(responses.POST, '{}/apis/' . format (mock_kong_admin_url), status=201, body=json.dumps({"id": "1", "name": "mockbin"}))
+		task = self.task("mockbin")
+		task["params"]["kong_admin_metrics"] = True
+
+		results = list(run_batch([task, task, task]))
+
+		assert [result["metrics"]["calls"] for result in results] == [2, 2, 2], \
+			"Expect each task to report its own calls, not those of the tasks before it"
+
+	def test_stop_on_failure(self):
+		results = list(run_batch([{"module": "kong_unknown"}, self.task("mockbin")], stop_on_failure=True))
+
+		assert len(results) == 1
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest, responses, json
+from six.moves.urllib.parse import parse_qs
+from kong_upstream import KongUpstream, ModuleHelper, run
+from module_utils.kong_task import KongTask
+
+mock_kong_admin_url = "http://192.168.99.100:8001"
+
+class KongUpstreamTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.upstream = KongUpstream(mock_kong_admin_url)
+		self.url = '{}/upstreams/mockbin.service' . format (mock_kong_admin_url)
+
+	@responses.activate
+	def test_upstream_add_new(self):
+		responses.add(responses.GET, self.url, status=404, body=json.dumps({"message": "Not found"}))
+		responses.add(responses.POST, '{}/upstreams/' . format (mock_kong_admin_url), status=201, body=json.dumps({"id": "1", "name": "mockbin.service"}))
+
+		healthchecks = {"active": {"http_path": "/status", "healthy": {"interval": 5}}}
+		response = self.upstream.add_or_update("mockbin.service", slots=1000, healthchecks=healthchecks)
+
+		assert response.status_code == 201
+		body = parse_qs(responses.calls[1].request.body)
+		assert body == {
+			"name": ["mockbin.service"],
+			"slots": ["1000"],
+			"healthchecks.active.http_path": ["/status"],
+			"healthchecks.active.healthy.interval": ["5"],
+		}, "Expect the health checks as dotted form keys. Got: {}" . format (body)
+
+	@responses.activate
+	def test_upstream_unchanged(self):
+		current = {"id": "1", "name": "mockbin.service", "slots": 1000, "healthchecks": {"active": {"http_path": "/status"}}}
+		responses.add(responses.GET, self.url, status=200, body=json.dumps(current))
+
+		response = self.upstream.add_or_update("mockbin.service", slots=1000, healthchecks={"active": {"http_path": "/status"}})
+
+		assert response.status_code == 304
+		assert len(responses.calls) == 1
+
+	@responses.activate
+	def test_upstream_update(self):
+		responses.add(responses.GET, self.url, status=200, body=json.dumps({"id": "1", "name": "mockbin.service", "slots": 100}))
+		responses.add(responses.PATCH, '{}/upstreams/1' . format (mock_kong_admin_url), status=200, body=json.dumps({"id": "1", "name": "mockbin.service", "slots": 1000}))
+
+		response = self.upstream.add_or_update("mockbin.service", slots=1000)
+
+		assert response.status_code == 200
+		assert parse_qs(responses.calls[1].request.body)["slots"] == ["1000"]
+
+	@responses.activate
+	def test_upstream_delete_missing(self):
+		responses.add(responses.GET, self.url, status=404)
+
+		response = self.upstream.delete_by_name("mockbin.service")
+
+		assert response.status_code == 404
+		assert all(call.request.method == "GET" for call in responses.calls)
+
+class RunTestCase(unittest.TestCase):
+
+	def params(self, **params):
+		defaults = dict(
+			kong_admin_uri=mock_kong_admin_url, kong_admin_username=None, kong_admin_password=None,
+			name="mockbin.service", slots=None, healthchecks=None, state="present",
+		)
+		return dict(defaults, **params)
+
+	@responses.activate
+	def test_check_mode(self):
+		responses.add(responses.GET, '{}/upstreams/mockbin.service' . format (mock_kong_admin_url), status=404)
+
+		result = run(ModuleHelper(), KongTask(self.params(slots=1000), check_mode=True))
+
+		assert result["changed"] == True
+		assert result["meta"] == {"action": "create"}
+
+	def test_name_required(self):
+		result = run(ModuleHelper(), KongTask(self.params(name=None)))
+
+		assert result["failed"] == True
+
+if __name__ == '__main__':
+    unittest.main()